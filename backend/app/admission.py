@@ -0,0 +1,174 @@
+# backend/app/admission.py
+"""
+Admission control for the heavy upload endpoints.
+
+Every admitted request holds one concurrency slot and an estimated memory cost
+(request bytes * ADMISSION_MEMORY_FACTOR, for the temp copy, decoded text, parsed
+rows and staged chunks). A request is admitted while both budgets have room;
+otherwise it waits in its dataset's FIFO queue. Freed capacity is handed out
+round-robin across datasets, so one dataset sending many uploads cannot starve
+the others.
+
+A request is rejected (Rejected -> 429 with Retry-After) when its dataset queue is
+full or it has waited ADMISSION_QUEUE_TIMEOUT seconds. Retry-After is estimated
+from the recent average hold time and the queue length.
+
+The controller lives in the event loop of one process; with several uvicorn
+workers each worker has its own budget.
+"""
+from __future__ import annotations
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional, Tuple
+
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", "4"))
+ADMISSION_MEMORY_BUDGET = int(os.getenv("ADMISSION_MEMORY_BUDGET_MB", "512")) * 1024 * 1024
+ADMISSION_MEMORY_FACTOR = float(os.getenv("ADMISSION_MEMORY_FACTOR", "4"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))  # waiting requests per dataset
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+ADMISSION_RETRY_AFTER_MAX = int(os.getenv("ADMISSION_RETRY_AFTER_MAX", "60"))
+
+
+class Rejected(Exception):
+    def __init__(self, message: str, retry_after: int, reason: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+@dataclass
+class Ticket:
+    dataset: str
+    cost: int
+    admitted_at: float = field(default_factory=time.monotonic)
+
+
+def estimate_cost(nbytes: Optional[int], default_bytes: int = 10 * 1024 * 1024) -> int:
+    """Estimated peak memory for handling a request body of nbytes."""
+    return int((nbytes if nbytes and nbytes > 0 else default_bytes) * ADMISSION_MEMORY_FACTOR)
+
+
+class AdmissionController:
+    def __init__(self, max_active: int = ADMISSION_MAX_ACTIVE, memory_budget: int = ADMISSION_MEMORY_BUDGET,
+                 max_queue: int = ADMISSION_MAX_QUEUE, queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.max_active = max(1, max_active)
+        self.memory_budget = max(1, memory_budget)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.memory = 0
+        self._queues: Dict[str, Deque[Tuple[asyncio.Future, Ticket]]] = {}
+        self._turns: Deque[str] = deque()  # datasets with waiters, in round-robin order
+        self._hold_avg = 1.0  # seconds, exponentially weighted
+        self.admitted = 0
+        self.rejected = 0
+
+    # ---- budget ----
+    def _fits(self, cost: int) -> bool:
+        if self.active >= self.max_active:
+            return False
+        # a request larger than the whole budget still runs, but alone
+        return self.active == 0 or self.memory + cost <= self.memory_budget
+
+    def _grant(self, ticket: Ticket) -> Ticket:
+        self.active += 1
+        self.memory += ticket.cost
+        self.admitted += 1
+        ticket.admitted_at = time.monotonic()
+        return ticket
+
+    def _queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def retry_after(self) -> int:
+        waves = (self._queued() + 1) / self.max_active
+        return max(1, min(ADMISSION_RETRY_AFTER_MAX, math.ceil(self._hold_avg * waves)))
+
+    def _reject(self, message: str, reason: str) -> Rejected:
+        self.rejected += 1
+        return Rejected(message, self.retry_after(), reason)
+
+    # ---- scheduling ----
+    def _drop(self, dataset: str, fut: asyncio.Future) -> None:
+        q = self._queues.get(dataset)
+        if q is None:
+            return
+        for item in list(q):
+            if item[0] is fut:
+                q.remove(item)
+        if not q:
+            self._queues.pop(dataset, None)
+            if dataset in self._turns:
+                self._turns.remove(dataset)
+
+    def _dispatch(self) -> None:
+        """Hand free capacity to queue heads, one dataset per turn."""
+        while self._turns:
+            for _ in range(len(self._turns)):
+                dataset = self._turns[0]
+                self._turns.rotate(-1)
+                fut, ticket = self._queues[dataset][0]
+                if self._fits(ticket.cost):
+                    self._queues[dataset].popleft()
+                    if not self._queues[dataset]:
+                        self._queues.pop(dataset)
+                        self._turns.remove(dataset)
+                    fut.set_result(self._grant(ticket))
+                    break
+            else:
+                return  # nothing fits until something is released
+
+    async def acquire(self, dataset: str, cost: int) -> Ticket:
+        ticket = Ticket(dataset, int(cost))
+        if not self._turns and self._fits(ticket.cost):
+            return self._grant(ticket)
+
+        q = self._queues.get(dataset)
+        if self.max_queue == 0 or (q is not None and len(q) >= self.max_queue):
+            raise self._reject(f"Too many uploads queued for {dataset}", "queue_full")
+
+        fut = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(dataset, deque()).append((fut, ticket))
+        if dataset not in self._turns:
+            self._turns.append(dataset)
+        self._dispatch()
+        try:
+            done, _ = await asyncio.wait({fut}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release(fut.result())
+            else:
+                self._drop(dataset, fut)
+            raise
+        if not done:
+            self._drop(dataset, fut)
+            fut.cancel()
+            raise self._reject(f"Upload capacity busy; waited {self.queue_timeout:.0f}s", "timeout")
+        return fut.result()
+
+    def release(self, ticket: Ticket) -> None:
+        self.active = max(0, self.active - 1)
+        self.memory = max(0, self.memory - ticket.cost)
+        held = time.monotonic() - ticket.admitted_at
+        self._hold_avg = 0.8 * self._hold_avg + 0.2 * held
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "max_active": self.max_active,
+            "memory_bytes": self.memory,
+            "memory_budget_bytes": self.memory_budget,
+            "queued": {ds: len(q) for ds, q in self._queues.items()},
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_hold_seconds": round(self._hold_avg, 3),
+            "retry_after": self.retry_after(),
+        }
+
+
+controller = AdmissionController()
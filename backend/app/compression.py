@@ -0,0 +1,188 @@
+# backend/app/compression.py
+"""
+Streaming decompression for compressed uploads (.csv.gz, .zip bundles, .zst).
+
+Nothing is inflated into memory up front: iter_members() yields a binary stream per
+member (gzip has one, zip one per file, zstd one) and open_text() wraps it for
+csv.reader, so rows are parsed while the archive is being read.
+
+The size limit applies to DECOMPRESSED bytes, summed over all members of one upload
+(MAX_DECOMPRESSED_BYTES). A zip's declared member sizes are checked before a member
+is opened, but the byte count is always enforced while reading, since headers can lie.
+
+zstd needs the optional `zstandard` package.
+"""
+from __future__ import annotations
+import codecs
+import gzip
+import io
+import os
+import zipfile
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+try:
+    import zstandard
+except Exception:
+    zstandard = None
+
+MAX_DECOMPRESSED_BYTES = int(os.getenv("MAX_DECOMPRESSED_BYTES", str(2 * 1024 * 1024 * 1024)))  # default 2GB
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZIP_MAGIC = b"PK\x03\x04"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# zip containers that are documents, not bundles
+_OFFICE_EXTENSIONS = (".docx", ".xlsx", ".xlsm", ".pptx")
+
+
+class DecompressionLimitError(ValueError):
+    """Decompressed data exceeded the configured limit (zip bomb guard)."""
+
+
+def detect_compression(head: bytes, filename: str = "") -> Optional[str]:
+    """Return "gzip", "zip", "zstd" or None from the leading bytes (and the name, to skip DOCX/XLSX)."""
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    if head.startswith(ZIP_MAGIC) and not (filename or "").lower().endswith(_OFFICE_EXTENSIONS):
+        return "zip"
+    return None
+
+
+class _Budget:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    def take(self, n: int) -> None:
+        self.used += n
+        if self.used > self.max_bytes:
+            raise DecompressionLimitError(f"Decompressed size exceeds limit of {self.max_bytes} bytes.")
+
+
+class LimitedReader(io.RawIOBase):
+    """Raw stream over a decompressor that charges every byte read to a shared budget."""
+
+    def __init__(self, inner: BinaryIO, budget: _Budget):
+        self._inner = inner
+        self._budget = budget
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self._inner.read(len(b))
+        n = len(data)
+        if n:
+            self._budget.take(n)
+            b[:n] = data
+        return n
+
+    def close(self) -> None:
+        try:
+            self._inner.close()
+        finally:
+            super().close()
+
+
+def _member_name(filename: str, suffix: str) -> str:
+    base = os.path.basename(filename or "uploaded")
+    return base[: -len(suffix)] if base.lower().endswith(suffix) else base
+
+
+def _skip_zip_member(info: zipfile.ZipInfo) -> bool:
+    name = info.filename
+    base = os.path.basename(name)
+    return info.is_dir() or name.startswith("__MACOSX/") or not base or base.startswith(".")
+
+
+def member_names(source: Union[str, BinaryIO], kind: str, filename: str = "") -> List[str]:
+    """Names iter_members() will yield, without decompressing anything."""
+    if kind == "zip":
+        with zipfile.ZipFile(source) as zf:
+            return [i.filename for i in zf.infolist() if not _skip_zip_member(i)]
+    return [_member_name(filename, ".gz" if kind == "gzip" else ".zst")]
+
+
+def iter_members(
+    source: Union[str, BinaryIO],
+    kind: str,
+    filename: str = "",
+    max_bytes: Optional[int] = None,
+) -> Iterator[Tuple[str, io.BufferedReader]]:
+    """
+    Yield (member_name, binary stream) for each member of a compressed file.
+    Concatenated gzip members are read as one stream (gzip semantics). Each stream
+    must be consumed before asking for the next one.
+    """
+    budget = _Budget(MAX_DECOMPRESSED_BYTES if max_bytes is None else max_bytes)
+    if kind == "gzip":
+        gz = gzip.open(source, "rb") if isinstance(source, str) else gzip.GzipFile(fileobj=source, mode="rb")
+        with io.BufferedReader(LimitedReader(gz, budget)) as stream:
+            yield _member_name(filename, ".gz"), stream
+    elif kind == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd uploads require the zstandard package (pip install zstandard).")
+        fh = open(source, "rb") if isinstance(source, str) else source
+        try:
+            reader = zstandard.ZstdDecompressor().stream_reader(fh, read_across_frames=True)
+            with io.BufferedReader(LimitedReader(reader, budget)) as stream:
+                yield _member_name(filename, ".zst"), stream
+        finally:
+            if isinstance(source, str):
+                fh.close()
+    elif kind == "zip":
+        with zipfile.ZipFile(source) as zf:
+            for info in zf.infolist():
+                if _skip_zip_member(info):
+                    continue
+                # cheap early rejection from the central directory; the reader still counts real bytes
+                if budget.used + info.file_size > budget.max_bytes:
+                    raise DecompressionLimitError(f"Decompressed size exceeds limit of {budget.max_bytes} bytes.")
+                with io.BufferedReader(LimitedReader(zf.open(info), budget)) as stream:
+                    yield info.filename, stream
+    else:
+        raise ValueError(f"Unsupported compression: {kind}")
+
+
+def open_text(stream: io.BufferedReader, probe_bytes: int = 64 * 1024) -> io.TextIOWrapper:
+    """
+    Wrap a binary member stream as text for csv.reader. The encoding is chosen from the
+    first probe_bytes (utf-8, else latin-1, as for plain uploads); later undecodable
+    utf-8 bytes are replaced rather than failing the whole stream.
+    """
+    head = stream.peek(probe_bytes)[:probe_bytes]
+    encoding = "utf-8-sig"
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+    except UnicodeDecodeError:
+        encoding = "latin-1"
+    return io.TextIOWrapper(stream, encoding=encoding, errors="replace", newline="")
+
+
+def decompress_head(content: bytes, kind: str, n: int = 4096, filename: str = "") -> bytes:
+    """First n decompressed bytes of the first member (for sniffing); b"" if unreadable."""
+    try:
+        for _name, stream in iter_members(io.BytesIO(content), kind, filename):
+            return stream.read(n)
+    except Exception:
+        return b""
+    return b""
+
+
+# Quick local check:
+#   python -m backend.app.compression feed.csv.gz
+if __name__ == "__main__":
+    import sys
+    import time
+
+    path = sys.argv[1]
+    with open(path, "rb") as fh:
+        kind = detect_compression(fh.read(8), path)
+    print("compression:", kind)
+    t0 = time.perf_counter()
+    for name, stream in iter_members(path, kind, path):
+        lines = sum(1 for _ in open_text(stream))
+        print(f"  {name}: {lines} lines")
+    print(f"done in {time.perf_counter() - t0:.2f}s")
@@ -0,0 +1,82 @@
+# backend/app/datasets.py
+"""
+Which tables, promotion RPC and ETL module belong to each dataset.
+
+The one copy of this mapping: main.py (upload / process / export), the ETL
+dispatcher and worker (--promote) and the local warehouse (its process_cleaned_*
+RPCs) all read it from here.
+
+DATASET_MAP accepts every name a dataset is uploaded under ("airline" and
+"airlines", ...); canonical_dataset() maps them to the first one. dim_table is None
+for entities without a dim table (travel agency and corporate sales): their
+process_cleaned_* RPC only marks the cleaned rows processed.
+"""
+from __future__ import annotations
+from typing import Any, Dict, Optional
+
+# canonical name -> cleaned table, dim table, promotion rpc, ETL module (backend/app/etl)
+DATASETS: Dict[str, Dict[str, Optional[str]]] = {
+    "airline": {
+        "cleaned_table": "cleaned_airlines",
+        "dim_table": "dimairline",
+        "rpc": "process_cleaned_airlines",
+        "etl_module": "airlines_etl",
+    },
+    "passenger": {
+        "cleaned_table": "cleaned_passengers",
+        "dim_table": "dimpassenger",
+        "rpc": "process_cleaned_passengers",
+        "etl_module": "passengers_etl",
+    },
+    "flight": {
+        "cleaned_table": "cleaned_flights",
+        "dim_table": "dimflight",
+        "rpc": "process_cleaned_flights",
+        "etl_module": "flights_etl",
+    },
+    "airport": {
+        "cleaned_table": "cleaned_airports",
+        "dim_table": "dimairport",
+        "rpc": "process_cleaned_airports",
+        "etl_module": "airports_etl",
+    },
+    "travelagency": {
+        "cleaned_table": "cleaned_travelagency",
+        "dim_table": None,
+        "rpc": "process_cleaned_travelagency",
+        "etl_module": "travelagency_etl",
+    },
+    "corporatesales": {
+        "cleaned_table": "cleaned_corporatesales",
+        "dim_table": None,
+        "rpc": "process_cleaned_corporatesales",
+        "etl_module": "corporatesales_etl",
+    },
+}
+
+# other names a dataset is uploaded under
+ALIASES = {
+    "airline": ["airlines"],
+    "passenger": ["passengers"],
+    "flight": ["flights"],
+    "airport": ["airports"],
+    "travelagency": ["travel_agency"],
+    "corporatesales": ["corporate_sales"],
+}
+
+# dataset name (canonical or alias) -> its DATASETS entry
+DATASET_MAP: Dict[str, Dict[str, Optional[str]]] = {}
+for _name, _cfg in DATASETS.items():
+    for _key in [_name] + ALIASES.get(_name, []):
+        DATASET_MAP[_key] = _cfg
+
+
+def canonical_dataset(dataset_key: str) -> str:
+    """First DATASET_MAP key sharing the dataset's cleaned table ("airlines" -> "airline")."""
+    table = DATASET_MAP[dataset_key]["cleaned_table"]
+    return next(k for k, cfg in DATASET_MAP.items() if cfg["cleaned_table"] == table)
+
+
+def by_rpc(rpc_name: str) -> Dict[str, Any]:
+    """The DATASETS entry promoted by `rpc_name` (KeyError if none)."""
+    return next(cfg for cfg in DATASETS.values() if cfg["rpc"] == rpc_name)
@@ -0,0 +1,243 @@
+# backend/app/dates.py
+"""
+Vectorized date parsing with cached format inference.
+
+pd.to_datetime() without a format guesses per element, which is slow on large or
+mixed columns. parse_dates() instead:
+
+  1. looks up the format for (source, header signature, column) in the format cache;
+  2. otherwise infers the dominant format from a sample of distinct values, trying
+     CANDIDATE_FORMATS and keeping the one that parses the most of them;
+  3. parses the whole column with that format. Numeric day/month orders are
+     rewritten to ISO with one regex and go through pandas' fast ISO8601 parser
+     (strptime with an explicit format is several times slower);
+  4. parses only the residue (values that did not match) element-wise.
+
+The source is the feed name with digits removed ("sales_2024-05-01.csv" and
+"sales_2024-05-02.csv" share an entry). A cached format is re-inferred when it stops
+matching most of a column. The cache is kept in memory and in DATE_FORMAT_CACHE_PATH.
+
+What a call did (format used, whether it came from the cache, residue count) travels
+with its result in Series.attrs; read it with parse_info(parsed).
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+
+DATE_FORMAT_CACHE_PATH = os.getenv("DATE_FORMAT_CACHE_PATH", os.path.join(tempfile.gettempdir(), "etl_date_formats.json"))
+DATE_SAMPLE_SIZE = int(os.getenv("DATE_SAMPLE_SIZE", "200"))
+DATE_FORMAT_MIN_SHARE = float(os.getenv("DATE_FORMAT_MIN_SHARE", "0.6"))
+
+# order matters on ties: ISO first, then day-first (the feeds are mostly non-US)
+CANDIDATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y/%m/%d",
+    "%d/%m/%Y",
+    "%m/%d/%Y",
+    "%d-%m-%Y",
+    "%m-%d-%Y",
+    "%d.%m.%Y",
+    "%d/%m/%y",
+    "%m/%d/%y",
+    "%d/%m/%Y %H:%M",
+    "%m/%d/%Y %H:%M",
+    "%d %b %Y",
+    "%d-%b-%Y",
+    "%b %d %Y",
+    "%b %d, %Y",
+    "%d %B %Y",
+    "%B %d, %Y",
+    "%Y%m%d",
+]
+
+# numeric layouts rewritten to Y-M-D (the time part, if any, is kept as is)
+_ISO_REWRITES = {
+    "%Y/%m/%d": (r"^(\d{4})/(\d{1,2})/(\d{1,2})", r"\1-\2-\3"),
+    "%d/%m/%Y": (r"^(\d{1,2})/(\d{1,2})/(\d{4})", r"\3-\2-\1"),
+    "%m/%d/%Y": (r"^(\d{1,2})/(\d{1,2})/(\d{4})", r"\3-\1-\2"),
+    "%d-%m-%Y": (r"^(\d{1,2})-(\d{1,2})-(\d{4})", r"\3-\2-\1"),
+    "%m-%d-%Y": (r"^(\d{1,2})-(\d{1,2})-(\d{4})", r"\3-\1-\2"),
+    "%d.%m.%Y": (r"^(\d{1,2})\.(\d{1,2})\.(\d{4})", r"\3-\2-\1"),
+    "%d/%m/%Y %H:%M": (r"^(\d{1,2})/(\d{1,2})/(\d{4})", r"\3-\2-\1"),
+    "%m/%d/%Y %H:%M": (r"^(\d{1,2})/(\d{1,2})/(\d{4})", r"\3-\1-\2"),
+}
+
+# Series.attrs key of parse_dates() results: {"format", "cached", "residue"} (see parse_info)
+PARSE_ATTR = "date_parse"
+
+_cache: Optional[Dict[str, str]] = None
+_cache_lock = threading.Lock()
+
+
+def _load_cache() -> Dict[str, str]:
+    global _cache
+    if _cache is None:
+        _cache = {}
+        if DATE_FORMAT_CACHE_PATH and os.path.exists(DATE_FORMAT_CACHE_PATH):
+            try:
+                with open(DATE_FORMAT_CACHE_PATH, "r", encoding="utf-8") as fh:
+                    _cache = dict(json.load(fh))
+            except Exception as e:
+                print("Warning: could not read date format cache:", str(e))
+    return _cache
+
+
+def _save_cache() -> None:
+    if not DATE_FORMAT_CACHE_PATH:
+        return
+    try:
+        tmp = DATE_FORMAT_CACHE_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(_cache, fh)
+        os.replace(tmp, DATE_FORMAT_CACHE_PATH)
+    except Exception as e:
+        print("Warning: could not write date format cache:", str(e))
+
+
+def cache_key(source: Optional[str], columns: Iterable[str], column: str) -> str:
+    """Key for one column of one feed: digit-free source name + hash of the header."""
+    feed = re.sub(r"\d+", "", os.path.basename(source or "")).lower()
+    signature = hashlib.sha1("\x1f".join(map(str, columns)).encode("utf-8")).hexdigest()[:16]
+    return f"{feed}|{signature}|{column}"
+
+
+def clear_cache() -> None:
+    global _cache
+    with _cache_lock:
+        _cache = {}
+        if DATE_FORMAT_CACHE_PATH and os.path.exists(DATE_FORMAT_CACHE_PATH):
+            os.remove(DATE_FORMAT_CACHE_PATH)
+
+
+def _to_datetime(values: pd.Series, **kwargs) -> pd.Series:
+    """pd.to_datetime(errors="coerce") that converts mixed UTC offsets instead of raising."""
+    try:
+        return pd.to_datetime(values, errors="coerce", **kwargs)
+    except ValueError:
+        return pd.to_datetime(values, errors="coerce", utc=True, **kwargs).dt.tz_convert(None)
+
+
+def _parse_with(text: pd.Series, fmt: str) -> pd.Series:
+    if fmt in _ISO_REWRITES:
+        pattern, repl = _ISO_REWRITES[fmt]
+        return _to_datetime(text.str.replace(pattern, repl, regex=True), format="ISO8601")
+    if fmt.startswith("%Y-%m-%d"):
+        return _to_datetime(text, format="ISO8601")
+    return _to_datetime(text, format=fmt)
+
+
+def infer_format(values: pd.Series, sample_size: int = DATE_SAMPLE_SIZE) -> Optional[str]:
+    """Dominant CANDIDATE_FORMATS entry for a string column, or None if none covers DATE_FORMAT_MIN_SHARE."""
+    sample = values.dropna().drop_duplicates()
+    if len(sample) > sample_size:
+        sample = sample.sample(sample_size, random_state=0)
+    if sample.empty:
+        return None
+    best, best_hits = None, 0
+    for fmt in CANDIDATE_FORMATS:
+        # strict strptime on the sample: decides between d/m and m/d layouts
+        hits = int(_to_datetime(sample, format=fmt).notna().sum())
+        if hits > best_hits:
+            best, best_hits = fmt, hits
+            if hits == len(sample):
+                break
+    if best_hits < DATE_FORMAT_MIN_SHARE * len(sample):
+        return None
+    return best
+
+
+def _naive(parsed: pd.Series) -> pd.Series:
+    """Drop timezones (wall-clock time kept) so mixed offsets end up in one datetime64 column."""
+    if getattr(parsed.dt, "tz", None) is not None:
+        parsed = parsed.dt.tz_localize(None)
+    return parsed.astype("datetime64[ns]")
+
+
+def _residue(text: pd.Series, parsed: pd.Series) -> pd.Series:
+    return text.notna() & parsed.isna()
+
+
+def parse_dates(s: pd.Series, source: Optional[str] = None, columns: Optional[Iterable[str]] = None) -> pd.Series:
+    """
+    Parse a column to datetime64 (NaT where unparseable). `source` and `columns` (the
+    frame's header) select the format cache entry; without them the format is inferred
+    every call. parse_info() on the result tells which format was used.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return _with_info(s.copy(deep=False), None, False, 0)
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return _with_info(pd.to_datetime(s, errors="coerce"), None, False, 0)
+
+    text = s.astype("string").str.strip()
+    text = text.mask(text == "")
+    key = cache_key(source, columns, str(s.name)) if source and columns is not None else None
+
+    with _cache_lock:
+        fmt = _load_cache().get(key) if key else None
+    cached = fmt is not None
+    parsed = _naive(_parse_with(text, fmt)) if fmt else None
+
+    present = int(text.notna().sum())
+    if parsed is None or (present and int(_residue(text, parsed).sum()) > (1 - DATE_FORMAT_MIN_SHARE) * present):
+        # no cache entry, or the feed changed format: infer again
+        fmt = infer_format(text)
+        cached = False
+        if fmt:
+            parsed = _naive(_parse_with(text, fmt))
+        else:
+            parsed = pd.Series(pd.NaT, index=s.index, dtype="datetime64[ns]")
+        if key and fmt:
+            with _cache_lock:
+                _load_cache()[key] = fmt
+                _save_cache()
+
+    # slow path only for what the dominant format did not cover
+    residue = _residue(text, parsed)
+    n_residue = int(residue.sum())
+    if n_residue:
+        rest = text[residue]
+        fallback = _naive(_to_datetime(rest, format="ISO8601"))
+        still = fallback.isna()
+        if still.any():
+            try:
+                fallback[still] = _naive(_to_datetime(rest[still], format="mixed", dayfirst=bool(fmt and fmt.startswith("%d"))))
+            except (ValueError, TypeError):
+                pass  # e.g. tz-aware and naive values mixed in the residue; leave them NaT
+        parsed[residue] = fallback
+
+    return _with_info(parsed, fmt, cached, n_residue)
+
+
+def _with_info(parsed: pd.Series, fmt: Optional[str], cached: bool, residue: int) -> pd.Series:
+    parsed.attrs[PARSE_ATTR] = {"format": fmt, "cached": cached, "residue": residue}
+    return parsed
+
+
+def parse_info(parsed: pd.Series) -> Dict[str, object]:
+    """{"format", "cached", "residue"} of the parse_dates() call that returned `parsed` ({} otherwise)."""
+    return parsed.attrs.get(PARSE_ATTR) or {}
+
+
+# Quick local check:
+#   python -m backend.app.dates feed.csv saledate
+if __name__ == "__main__":
+    import sys
+    import time
+
+    frame = pd.read_csv(sys.argv[1], dtype=str, keep_default_na=False)
+    col = sys.argv[2]
+    for attempt in ("cold", "warm"):
+        t0 = time.perf_counter()
+        out = parse_dates(frame[col], source=sys.argv[1], columns=list(frame.columns))
+        print(f"{attempt}: {time.perf_counter() - t0:.3f}s", parse_info(out), f"nat={int(out.isna().sum())}")
@@ -1,11 +1,15 @@
 # backend/app/etl/__init__.py
-# Explicitly expose available ETL modules used by main.py
-from . import airlines_etl
-from . import passengers_etl
-from . import flights_etl
-from . import airports_etl
-from . import travelagency_etl
-from . import corporatesales_etl
+"""
+Lazy registry of the ETL modules.
+
+The modules pull in pandas/numpy (and python-docx), so they are imported on first
+use instead of with the package: `from backend.app.etl import flights_etl` and
+`load("flights_etl")` both import on demand (PEP 562 module __getattr__).
+Import times are kept in LOAD_SECONDS for /api/startup.
+"""
+import importlib
+import time
+from typing import Dict
 
 __all__ = [
     "airlines_etl",
@@ -15,3 +19,24 @@ __all__ = [
     "travelagency_etl",
     "corporatesales_etl",
 ]
+
+LOAD_SECONDS: Dict[str, float] = {}
+
+
+def load(name: str):
+    """Import (once) and return backend.app.etl.<name>."""
+    if name not in __all__ and name != "dispatcher":
+        raise ValueError(f"Unknown ETL module: {name}")
+    module = globals().get(name)
+    if module is None:
+        t0 = time.perf_counter()
+        module = importlib.import_module(f"{__name__}.{name}")
+        LOAD_SECONDS[name] = time.perf_counter() - t0
+        globals()[name] = module
+    return module
+
+
+def __getattr__(name: str):
+    if name in __all__ or name == "dispatcher":
+        return load(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -19,7 +19,7 @@ from pathlib import Path
 import io
 import pandas as pd
 import numpy as np
-from typing import List, Tuple, Dict, Any, Optional
+from typing import List, Tuple, Dict, Any, Iterator, Optional
 from datetime import datetime
 
 try:
@@ -28,6 +28,8 @@ except Exception:
     Document = None
 
 from ..services.supabase_client import sb
+from ..services.sinks import get_sink, write_in_batches
+from .. import readers
 
 def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     cols = (
@@ -92,6 +94,19 @@ def _read_csv_file(path: Path) -> pd.DataFrame:
         return pd.read_csv(path, engine="python", encoding="latin-1")
 
 
+def read_frame(path: str, sheet: Optional[Any] = None) -> pd.DataFrame:
+    p = Path(path)
+    if p.suffix.lower() == ".docx":
+        return _read_docx_table(p)
+    if readers.detect_format(p.name):
+        return readers.read_frame(p, sheet=sheet)  # xlsx / parquet / arrow / ndjson, already typed
+    return _read_csv_file(p)
+
+
+def iter_frames(path: str, sheet: Optional[Any] = None) -> Iterator[pd.DataFrame]:
+    return readers.iter_etl_frames(path, read_frame, sheet=sheet)
+
+
 def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     """
     Returns (cleaned_rows, raw_rows). Uses no-underscore names:
@@ -101,13 +116,12 @@ def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(path)
+    return clean_records(read_frame(str(p)), source=p.name)
 
-    ext = p.suffix.lower()
-    if ext == ".docx":
-        df = _read_docx_table(p)
-    else:
-        df = _read_csv_file(p)
 
+def clean_records(df: pd.DataFrame, source: Optional[str] = None,
+                  errors: Optional[Dict[str, Dict[str, int]]] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """clean_file() on an already-read frame (modified in place). No schema coercion, so `errors` is left as is."""
     df = _normalize_columns(df)
 
     # map common variations
@@ -161,12 +175,12 @@ def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
 
 
 # --- ETL runtime entrypoint used by dispatcher/CLI ---
-def _upsert_airline_row(row: Dict[str, Any], upload_id: int) -> None:
+def _airline_payload(row: Dict[str, Any], upload_id: int) -> Dict[str, Any]:
     """
-    Upsert a single normalized airline row into cleaned_airlines.
+    cleaned_airlines record of a normalized airline row.
     Sets processed = true and upload_id for lineage.
     """
-    payload = {
+    return {
         "airlinekey": row.get("airlinekey"),
         "airlinename": row.get("airlinename"),
         "alliance": row.get("alliance"),
@@ -177,10 +191,13 @@ def _upsert_airline_row(row: Dict[str, Any], upload_id: int) -> None:
         "error_count": 0,
         "last_error": None
     }
+
+
+def _upsert_airline_rows(rows: List[Dict[str, Any]], upload_id: int) -> None:
+    """Upsert normalized airline rows into cleaned_airlines in one sink call."""
+    payloads = [_airline_payload(row, upload_id) for row in rows]
     # use on_conflict = "airlinekey" to upsert by natural key
-    res = supabase.table("cleaned_airlines").upsert(payload, on_conflict="airlinekey").execute()
-    if getattr(res, "status_code", None) and res.status_code >= 400:
-        raise Exception(res.error)
+    get_sink().upsert("cleaned_airlines", payloads, on_conflict="airlinekey", batch_size=max(1, len(payloads)))
 
 
 def process_airlines_upload(upload_id: int, raw: Dict[str, Any], run_id: int = None) -> Dict[str, int]:
@@ -212,6 +229,16 @@ def process_airlines_upload(upload_id: int, raw: Dict[str, Any], run_id: int = N
 
     processed = 0
     errors = 0
+    pending: List[Tuple[Any, Dict[str, Any]]] = []  # (staged row, normalized row)
+
+    def log_error(r: Any, e: Exception) -> None:
+        nonlocal errors
+        errors += 1
+        sb.table("import_errors").insert({
+            "upload_id": upload_id,
+            "row_data": r,
+            "message": str(e)
+        }).execute()
 
     for r in rows:
         try:
@@ -230,23 +257,19 @@ def process_airlines_upload(upload_id: int, raw: Dict[str, Any], run_id: int = N
             if not normalized["airlinekey"]:
                 # if no natural key, skip and log
                 errors += 1
-                supabase.table("import_errors").insert({
+                sb.table("import_errors").insert({
                     "upload_id": upload_id,
                     "row_data": rec,
                     "message": "missing airline key"
                 }).execute()
                 continue
 
-            _upsert_airline_row(normalized, upload_id)
-            processed += 1
+            pending.append((r, normalized))
         except Exception as e:
-            errors += 1
-            supabase.table("import_errors").insert({
-                "upload_id": upload_id,
-                "row_data": r,
-                "message": str(e)
-            }).execute()
+            log_error(r, e)
 
+    processed += write_in_batches(lambda batch: _upsert_airline_rows([n for _, n in batch], upload_id),
+                                  pending, lambda item, e: log_error(item[0], e))
     return {"processed": processed, "errors": errors}
 
 
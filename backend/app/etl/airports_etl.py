@@ -21,12 +21,14 @@ does NOT include legacy handling for 'iata', 'icao', 'lat', 'lon', etc.
 from __future__ import annotations
 from pathlib import Path
 import zipfile, io, csv, re, json
-from typing import List, Tuple, Dict, Any, Optional
+from typing import List, Tuple, Dict, Any, Iterator, Optional
 from datetime import datetime
 
 # NOTE: replace this import with your actual supabase client instance
 from ..services.supabase_client import sb
+from ..services.sinks import get_sink, write_in_batches
 from .. import parsers  # tolerant parser / parse warnings (if present)
+from .. import readers
 
 # -------------------- Helpers: DOCX/CSV extraction --------------------
 def _extract_docx_lines(path: Path) -> List[str]:
@@ -144,6 +146,7 @@ def _normalize_country(c: Optional[str]) -> Optional[str]:
 
 def _df_to_cleaned_records(df: "pd.DataFrame") -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     import pandas as pd
+    from .. import schemas
     df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
     for col in ("airportkey", "airportname", "city", "country"):
         if col not in df.columns:
@@ -166,8 +169,7 @@ def _df_to_cleaned_records(df: "pd.DataFrame") -> Tuple[List[Dict[str, Any]], Li
 
     cleaned_rows = []
     raw_rows = []
-    for _, r in df.iterrows():
-        raw = {c: (r.get(c) if c in r.index else None) for c in r.index}
+    for raw in schemas.to_records(df):  # column-wise, no per-row Series
         raw_rows.append({"rawjson": raw})
         cleaned_rows.append({
             "airportkey": raw.get("airportkey"),
@@ -182,11 +184,23 @@ def _df_to_cleaned_records(df: "pd.DataFrame") -> Tuple[List[Dict[str, Any]], Li
 def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     """
     Returns (cleaned_rows, raw_rows) as described above.
-    Works for .docx files (word) and plain CSVs.
+    Works for .docx files (word), .xlsx workbooks (first sheet), parquet/arrow/ndjson and plain CSVs.
     """
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(path)
+    return clean_records(read_frame(str(p)), source=p.name)
+
+def read_frame(path: str, sheet: Optional[Any] = None) -> "pd.DataFrame":
+    """Text frame (airportkey, airportname, city, country + extra columns) of any supported file."""
+    p = Path(path)
+    fmt = readers.detect_format(p.name)
+    if fmt == "xlsx":
+        rows = [[None if v is None else str(v) for v in r] for r in readers.iter_xlsx_rows(p, sheet)]
+        return _rows_to_dataframe(rows)
+    if fmt:
+        # parquet / arrow / ndjson carry their own header
+        return _typed_to_text_frame(readers.read_frame(p, fmt))
 
     lines = _extract_docx_lines(p)
     if not lines:
@@ -197,71 +211,76 @@ def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
             lines = []
 
     rows = _parse_lines_to_rows(lines)
-    df = _rows_to_dataframe(rows)
-    cleaned_rows, raw_rows = _df_to_cleaned_records(df)
-    return cleaned_rows, raw_rows
+    return _rows_to_dataframe(rows)
+
+def _typed_to_text_frame(frame: "pd.DataFrame") -> "pd.DataFrame":
+    rows = [list(frame.columns)] + [[None if v is None or v != v else str(v) for v in r] for r in frame.itertuples(index=False)]
+    return _rows_to_dataframe(rows)
+
+def iter_frames(path: str, sheet: Optional[Any] = None) -> Iterator["pd.DataFrame"]:
+    return readers.iter_etl_frames(path, read_frame, sheet=sheet, convert=_typed_to_text_frame)
+
+def clean_records(df: "pd.DataFrame", source: Optional[str] = None,
+                  errors: Optional[Dict[str, Dict[str, int]]] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """clean_file() on a frame from read_frame(). No schema coercion, so `errors` is left as is."""
+    return _df_to_cleaned_records(df)
 
 # -------------------- DB upsert helpers (minimal dimairport) --------------------
-def _upsert_dimairport_by_key(payload: Dict[str, Any]) -> None:
-    """
-    Upsert into dimairport using 'airportkey' unique constraint.
-    Writes only canonical minimal columns.
-    """
-    if not payload.get("airportkey"):
-        raise ValueError("missing airportkey for upsert")
-    mapped = {
-        "airportkey": payload.get("airportkey"),
-        "airportname": payload.get("airportname"),
-        "city": payload.get("city"),
-        "country": payload.get("country"),
-        "createdat": payload.get("createdat", datetime.utcnow().isoformat())
-    }
-    res = sb.table("dimairport").upsert(mapped, on_conflict="airportkey").execute()
-    if isinstance(res, dict) and res.get("error"):
-        raise Exception(res.get("error"))
-    if hasattr(res, "error") and res.error:
-        raise Exception(str(res.error))
-
-def _insert_dimairport(payload: Dict[str, Any]) -> None:
-    mapped = {
+def _dimairport_record(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
         "airportkey": payload.get("airportkey"),
         "airportname": payload.get("airportname"),
         "city": payload.get("city"),
         "country": payload.get("country"),
         "createdat": payload.get("createdat", datetime.utcnow().isoformat())
     }
-    res = sb.table("dimairport").insert(mapped).execute()
-    if isinstance(res, dict) and res.get("error"):
-        raise Exception(res.get("error"))
-    if hasattr(res, "error") and res.error:
-        raise Exception(str(res.error))
 
-def _upsert_airport_row(row: Dict[str, Any], upload_id: int) -> None:
+def _upsert_dimairport_by_key(payloads: List[Dict[str, Any]]) -> None:
+    """
+    Upsert into dimairport using 'airportkey' unique constraint.
+    Writes only canonical minimal columns.
+    """
+    if any(not p.get("airportkey") for p in payloads):
+        raise ValueError("missing airportkey for upsert")
+    records = [_dimairport_record(p) for p in payloads]
+    get_sink().upsert("dimairport", records, on_conflict="airportkey", batch_size=max(1, len(records)))
+
+def _insert_dimairport(payloads: List[Dict[str, Any]]) -> None:
+    records = [_dimairport_record(p) for p in payloads]
+    get_sink().insert("dimairport", records, batch_size=max(1, len(records)))
+
+def _upsert_airport_rows(rows: List[Dict[str, Any]], upload_id: int) -> None:
     """
     Row shape expected from clean_file entries.
-    Writes canonical minimal fields to dimairport, and inserts/upserts into cleaned_airports.
+    Writes canonical minimal fields to dimairport, and inserts/upserts into cleaned_airports,
+    with one sink call per table and kind of write for the whole batch.
     """
-    airportkey = row.get("airportkey") or None
-    payload = {
-        "airportkey": (airportkey.strip().upper() if isinstance(airportkey, str) else airportkey),
-        "airportname": row.get("airportname"),
-        "city": row.get("city"),
-        "country": row.get("country"),
-        "rawjson": row.get("rawjson"),
-        "createdat": datetime.utcnow().isoformat()
-    }
+    now = datetime.utcnow().isoformat()
+    payloads = []
+    for row in rows:
+        airportkey = row.get("airportkey") or None
+        payloads.append({
+            "airportkey": (airportkey.strip().upper() if isinstance(airportkey, str) else airportkey),
+            "airportname": row.get("airportname"),
+            "city": row.get("city"),
+            "country": row.get("country"),
+            "rawjson": row.get("rawjson"),
+            "createdat": now
+        })
 
     # Upsert to dimairport
-    if payload.get("airportkey"):
+    keyed = [p for p in payloads if p.get("airportkey")]
+    if keyed:
         try:
-            _upsert_dimairport_by_key(payload)
+            _upsert_dimairport_by_key(keyed)
         except Exception:
-            _insert_dimairport(payload)
-    else:
-        _insert_dimairport(payload)
+            _insert_dimairport(keyed)
+    unkeyed = [p for p in payloads if not p.get("airportkey")]
+    if unkeyed:
+        _insert_dimairport(unkeyed)
 
     # Upsert cleaned_airports (only canonical columns)
-    cleaned_payload = {
+    cleaned_payloads = [{
         "id": row.get("id"),
         "airportkey": payload.get("airportkey"),
         "airportname": payload.get("airportname"),
@@ -270,27 +289,21 @@ def _upsert_airport_row(row: Dict[str, Any], upload_id: int) -> None:
         "rawjson": payload.get("rawjson"),
         "upload_id": upload_id,
         "processed": True,
-        "insertedat": datetime.utcnow().isoformat()
-    }
+        "insertedat": now
+    } for row, payload in zip(rows, payloads)]
 
-    try:
-        if row.get("id"):
-            res = sb.table("cleaned_airports").upsert(cleaned_payload, on_conflict="id").execute()
-        else:
-            insert_payload = {k: v for k, v in cleaned_payload.items() if k != "id"}
-            res = sb.table("cleaned_airports").insert(insert_payload).execute()
-        if isinstance(res, dict) and res.get("error"):
-            raise Exception(res.get("error"))
-        if hasattr(res, "error") and res.error:
-            raise Exception(str(res.error))
-    except Exception:
-        raise
+    with_id = [c for c in cleaned_payloads if c.get("id")]
+    if with_id:
+        get_sink().upsert("cleaned_airports", with_id, on_conflict="id", batch_size=len(with_id))
+    insert_payloads = [{k: v for k, v in c.items() if k != "id"} for c in cleaned_payloads if not c.get("id")]
+    if insert_payloads:
+        get_sink().insert("cleaned_airports", insert_payloads, batch_size=len(insert_payloads))
 
 # -------------------- process function --------------------
 def process_airports_upload(upload_id: int, raw: Optional[Dict[str, Any]], run_id: int = None) -> Dict[str, int]:
     """
     Accepts staging_raw.raw shapes: dict with 'rows' or 'raw_rows', or a list.
-    Upserts each row into dimairport and writes/updates cleaned_airports.
+    Upserts the rows into dimairport and writes/updates cleaned_airports, a batch at a time.
     Returns {"processed": n, "errors": m}
     """
     rows: List[Dict[str, Any]] = []
@@ -312,6 +325,21 @@ def process_airports_upload(upload_id: int, raw: Optional[Dict[str, Any]], run_i
 
     processed = 0
     errors = 0
+    pending: List[Tuple[Any, Dict[str, Any]]] = []  # (staged row, normalized row)
+
+    def log_error(r: Any, e: Exception) -> None:
+        nonlocal errors
+        errors += 1
+        try:
+            sb.table("import_errors").insert({
+                "sourcetable": "staging_raw",
+                "sourceid": upload_id,
+                "raw": r if isinstance(r, dict) else {"row": r},
+                "errormessage": str(e),
+                "createdat": datetime.utcnow().isoformat()
+            }).execute()
+        except Exception:
+            pass
 
     parse_warnings = getattr(parsers, "LAST_CSV_PARSE_ERRORS", None)
     if parse_warnings:
@@ -353,21 +381,12 @@ def process_airports_upload(upload_id: int, raw: Optional[Dict[str, Any]], run_i
                     pass
                 continue
 
-            _upsert_airport_row(normalized, upload_id)
-            processed += 1
+            pending.append((r, normalized))
         except Exception as e:
-            errors += 1
-            try:
-                sb.table("import_errors").insert({
-                    "sourcetable": "staging_raw",
-                    "sourceid": upload_id,
-                    "raw": r if isinstance(r, dict) else {"row": r},
-                    "errormessage": str(e),
-                    "createdat": datetime.utcnow().isoformat()
-                }).execute()
-            except Exception:
-                pass
+            log_error(r, e)
 
+    processed += write_in_batches(lambda batch: _upsert_airport_rows([n for _, n in batch], upload_id),
+                                  pending, lambda item, e: log_error(item[0], e))
     return {"processed": processed, "errors": errors}
 
 # -------------------- Quick local test (prints cleaned count) --------------------
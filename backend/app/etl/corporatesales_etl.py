@@ -1,88 +1,278 @@
 # backend/app/etl/corporatesales_etl.py
+"""
+Corporate sales ETL: clean_file(path) and process_corporatesales_upload(upload_id, raw, run_id=None)
+
+Normalized cleaned fields:
+ - invoice
+ - transactionid (falls back to invoice, and the other way round)
+ - corporate_id, corporate_name, item
+ - qty (Int64), unitprice, total, saleamount (decimals)
+ - currency
+ - saledate (ISO date)
+ - rawjson
+
+Cleaning is column-wise (clean_frame): header aliases, schema coercion
+(schemas.coerce_frame), total = qty * unitprice when missing, and a total check.
+Rows whose stated total differs from qty * unitprice by more than
+TOTAL_TOLERANCE are kept and counted in the coercion errors as ["total"]["mismatch"].
+
+process_corporatesales_upload cleans a staged chunk the same way and upserts it into
+cleaned_corporatesales in bulk (CORPORATESALES_BATCH rows per sink call).
+"""
+
 from __future__ import annotations
+import os
 from pathlib import Path
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Iterator, Optional
+from datetime import datetime
 import pandas as pd
-import io
+
+try:
+    from docx import Document
+except Exception:
+    Document = None
+
+from ..services.supabase_client import sb
+from ..services.sinks import get_sink
+from .. import readers
+from .. import schemas
+
+CORPORATESALES_BATCH = int(os.getenv("CORPORATESALES_BATCH", "5000"))
+TOTAL_TOLERANCE = float(os.getenv("CORPORATESALES_TOTAL_TOLERANCE", "0.01"))
+
+# header variant -> canonical column (applied only when the canonical column is absent)
+COLUMN_ALIASES = {
+    "invoice_id": "invoice",
+    "invoiceid": "invoice",
+    "invoice_no": "invoice",
+    "transaction_id": "transactionid",
+    "corp_id": "corporate_id",
+    "company": "corporate_name",
+    "corporate": "corporate_name",
+    "description": "item",
+    "quantity": "qty",
+    "unit_price": "unitprice",
+    "price": "unitprice",
+    "amount": "total",
+    "sale_amount": "saleamount",
+    "sale_date": "saledate",
+    "date": "saledate",
+}
+
+CLEANED_COLUMNS = ["invoice", "transactionid", "corporate_id", "corporate_name", "item",
+                   "qty", "unitprice", "total", "saleamount", "currency", "saledate"]
+
+
+def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    cols = (
+        df.columns.astype(str).str.strip()
+        .str.replace(r"([a-z0-9])([A-Z])", r"\1_\2", regex=True)
+        .str.replace(r"[ \-]+", "_", regex=True)
+        .str.lower()
+    )
+    df.columns = cols
+    return df
+
 
 def _read_csv(path: Path) -> pd.DataFrame:
+    # C parser, everything as text: schema coercion decides the types
     try:
-        return pd.read_csv(path, engine="python")
-    except Exception:
-        return pd.read_csv(path, engine="python", encoding="latin-1")
+        return pd.read_csv(path, dtype=str, keep_default_na=False, low_memory=False)
+    except UnicodeDecodeError:
+        return pd.read_csv(path, dtype=str, keep_default_na=False, low_memory=False, encoding="latin-1")
+    except pd.errors.ParserError:
+        return pd.read_csv(path, dtype=str, keep_default_na=False, engine="python")
+
+
+def _read_docx_table(path: Path) -> pd.DataFrame:
+    """First table of a .docx (header = first row)."""
+    if Document is None:
+        raise RuntimeError("python-docx not installed.")
+    doc = Document(str(path))
+    if not doc.tables:
+        raise RuntimeError("DOCX contained no tables")
+    rows = [[c.text.strip() for c in row.cells] for row in doc.tables[0].rows]
+    if len(rows) < 2:
+        raise RuntimeError("DOCX table has no data rows")
+    return pd.DataFrame(rows[1:], columns=rows[0])
+
+
+def read_frame(path: str, sheet: Optional[Any] = None) -> pd.DataFrame:
+    p = Path(path)
+    if p.suffix.lower() == ".docx":
+        return _read_docx_table(p)
+    if readers.detect_format(p.name):
+        return readers.read_frame(p, sheet=sheet)  # xlsx / parquet / arrow / ndjson, already typed
+    return _read_csv(p)
+
+
+def iter_frames(path: str, sheet: Optional[Any] = None) -> Iterator[pd.DataFrame]:
+    return readers.iter_etl_frames(path, read_frame, sheet=sheet)
+
+
+def clean_frame(df: pd.DataFrame, source: Optional[str] = None) -> pd.DataFrame:
+    """
+    Vectorized cleaning of a raw corporate sales frame. Returns a frame with every
+    CLEANED_COLUMNS column (missing ones as NA) plus any extra source columns.
+    """
+    df = _normalize_columns(df)
+    renames = {src: dst for src, dst in COLUMN_ALIASES.items() if src in df.columns and dst not in df.columns}
+    df = df.rename(columns=renames)
+    df = df.loc[:, ~df.columns.duplicated()]
+    for c in CLEANED_COLUMNS:
+        if c not in df.columns:
+            df[c] = pd.NA
+    df = schemas.coerce_frame(df, "corporatesales", source=source)
+    errors = {col: dict(kinds) for col, kinds in schemas.coercion_errors(df).items()}
+
+    df["transactionid"] = df["transactionid"].fillna(df["invoice"])
+    df["invoice"] = df["invoice"].fillna(df["transactionid"])
+
+    # computed total: fill gaps from qty * unitprice, count disagreements
+    expected = (df["qty"].astype("Float64") * df["unitprice"]).round(2)
+    mismatch = (df["total"] - expected).abs() > TOTAL_TOLERANCE * expected.abs().clip(lower=1)
+    n_mismatch = int(mismatch.fillna(False).sum())
+    if n_mismatch:
+        errors.setdefault("total", {})["mismatch"] = n_mismatch
+    df["total"] = df["total"].fillna(expected)
+    df["saleamount"] = df["saleamount"].fillna(df["total"])
+
+    missing_id = int(df["transactionid"].isna().sum())
+    if missing_id:
+        errors.setdefault("transactionid", {})["missing"] = missing_id
+
+    try:
+        df = df.drop_duplicates()
+    except TypeError:
+        pass  # nested values (e.g. NDJSON objects) are unhashable; keep every row
+    df = df.reset_index(drop=True)
+    df.attrs[schemas.ERRORS_ATTR] = errors
+    return df
+
+
+def _to_rows(df: pd.DataFrame) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    cols = schemas.column_lists(df)
+    names = list(cols)
+    records = [dict(zip(names, values)) for values in zip(*cols.values())]
+    cleaned_rows = [dict(zip(CLEANED_COLUMNS, values), rawjson=r)
+                    for values, r in zip(zip(*(cols[c] for c in CLEANED_COLUMNS)), records)]
+    raw_rows = [{"rawjson": r} for r in records]
+    return cleaned_rows, raw_rows
+
 
 def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     """
-    Minimal corporatesales ETL stub.
-    Converts incoming CSV/DOCX into:
-      - cleaned rows with keys: invoiceid, corporate_id, corporate_name, item, qty, unitprice, total, currency, saledate, rawjson
-      - raw rows as {"rawjson": {...}}
-    This will be compatible with your upload pipeline while you flesh it out.
+    Returns (cleaned_rows, raw_rows).
+    cleaned_rows fields: CLEANED_COLUMNS + rawjson
+    raw_rows: [{"rawjson": {...}}, ...]
     """
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(path)
+    return clean_records(read_frame(str(p)), source=p.name)
+
+
+def clean_records(df: pd.DataFrame, source: Optional[str] = None,
+                  errors: Optional[Dict[str, Dict[str, int]]] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """clean_file() on an already-read frame; coercion error counts are added to `errors`."""
+    df = clean_frame(df, source=source)
+    if errors is not None:
+        schemas.merge_errors(errors, schemas.coercion_errors(df))
+    return _to_rows(df)
 
-    ext = p.suffix.lower()
-    if ext == ".docx":
-        # simple fallback: treat as text lines (your full ETL may parse docx tables)
-        text = p.read_text(encoding="utf-8", errors="ignore")
-        lines = [l for l in text.splitlines() if l.strip()]
-        if not lines:
-            raise RuntimeError("DOCX contained no usable lines")
-        csv_buf = io.StringIO("\n".join(lines))
-        df = pd.read_csv(csv_buf, engine="python")
+
+# ---------- upsert / ETL runtime functions ----------
+
+def _rows_from_raw(raw: Any) -> List[Dict[str, Any]]:
+    if isinstance(raw, dict) and isinstance(raw.get("rows"), list):
+        rows = raw["rows"]
+    elif isinstance(raw, dict) and isinstance(raw.get("raw_rows"), list):
+        rows = raw["raw_rows"]
+    elif isinstance(raw, list):
+        rows = raw
     else:
-        df = _read_csv(p)
+        rows = next((v for v in raw.values() if isinstance(v, list)), []) if isinstance(raw, dict) else []
+    return [r.get("rawjson") if isinstance(r, dict) and "rawjson" in r else r for r in rows if isinstance(r, dict)]
 
-    # normalize columns to snake-like names
-    df.columns = (
-        df.columns.str.strip()
-        .str.replace(r"([a-z0-9])([A-Z])", r"\1_\2", regex=True)
-        .str.replace(r"[ \-]+", "_", regex=True)
-        .str.lower()
-    )
 
-    # safe coercions / selects: keep common columns if present
-    def safe_col(key):
-        return key if key in df.columns else None
-
-    cleaned = []
-    raw_rows = []
-
-    for _, row in df.fillna("").iterrows():
-        r = row.to_dict()
-        # simple normalization: prefer common variants
-        invoiceid = r.get("invoiceid") or r.get("invoice_id") or r.get("transactionid") or r.get("transaction_id") or None
-        corporate_id = r.get("corporate_id") or r.get("corp_id") or None
-        corporate_name = r.get("corporate_name") or r.get("company") or r.get("corporate") or None
-        item = r.get("item") or r.get("description") or None
-        qty = r.get("qty") or r.get("quantity") or None
-        unitprice = r.get("unitprice") or r.get("price") or None
-        total = r.get("total") or r.get("amount") or None
-        currency = r.get("currency") or None
-        saledate = r.get("saledate") or r.get("date") or None
-
-        raw_rows.append({"rawjson": r})
-        cleaned.append({
-            "invoiceid": invoiceid,
-            "transactionid": invoiceid,  # convenience: set transactionid = invoiceid if present
-            "corporate_id": corporate_id,
-            "corporate_name": corporate_name,
-            "item": item,
-            "qty": qty,
-            "unitprice": unitprice,
-            "total": total,
-            "currency": currency,
-            "saledate": saledate,
-            "rawjson": r,
-        })
-
-    return cleaned, raw_rows
+def process_corporatesales_upload(upload_id: int, raw: Optional[Dict[str, Any]], run_id: int = None) -> Dict[str, int]:
+    """
+    Entrypoint for dispatcher/CLI.
+    - upload_id: staging_raw upload id
+    - raw: staging_raw.raw ({"rows": [...]}, {"raw_rows": [...]} or a list)
+    Cleans the whole chunk column-wise and upserts cleaned_corporatesales on transactionid.
+    Returns: {"processed": n, "errors": m}
+    """
+    if not raw:
+        return {"processed": 0, "errors": 0}
+    recs = _rows_from_raw(raw)
+    if not recs:
+        return {"processed": 0, "errors": 0}
+
+    df = clean_frame(pd.DataFrame.from_records(recs))
+    keyed = df["transactionid"].notna()
+    now = datetime.utcnow().isoformat()
+
+    errors = 0
+    bad = df[~keyed]
+    if len(bad):
+        payload = [{
+            "sourcetable": "cleaned_corporatesales",
+            "sourceid": None,
+            "raw": r,
+            "errormessage": "missing transactionid/invoice",
+            "createdat": now,
+        } for r in schemas.to_records(bad)]
+        try:
+            sb.table("import_errors").insert(payload).execute()
+        except Exception as e:
+            print("Warning: could not insert import_errors rows:", str(e))
+        errors += len(payload)
+
+    good = df[keyed].drop_duplicates(subset=["transactionid"], keep="last")
+    records = schemas.to_records(good)
+    payloads = [{
+        "invoice": r["invoice"],
+        "transactionid": r["transactionid"],
+        "saleamount": r["saleamount"],
+        "currency": r["currency"],
+        "saledate": r["saledate"],
+        "rawjson": r,
+        "upload_id": upload_id,
+        "processed": False,
+        "insertedat": now,
+        "error_count": 0,
+        "last_error": None,
+    } for r in records]
+
+    processed = 0
+    sink = get_sink()
+    for i in range(0, len(payloads), CORPORATESALES_BATCH):
+        chunk = payloads[i : i + CORPORATESALES_BATCH]
+        try:
+            processed += sink.upsert("cleaned_corporatesales", chunk, on_conflict="transactionid")
+        except Exception as e:
+            errors += len(chunk)
+            try:
+                sb.table("import_errors").insert({
+                    "sourcetable": "cleaned_corporatesales",
+                    "sourceid": None,
+                    "raw": {"upload_id": upload_id, "rows": len(chunk)},
+                    "errormessage": str(e),
+                    "createdat": now,
+                }).execute()
+            except Exception:
+                pass
+    return {"processed": processed, "errors": errors}
 
 
 if __name__ == "__main__":
     import sys
+    import time
     p = sys.argv[1] if len(sys.argv) > 1 else "sample_corporate.csv"
-    cleaned, raw = clean_file(p)
-    print("Cleaned:", len(cleaned))
+    t0 = time.perf_counter()
+    counts: Dict[str, Dict[str, int]] = {}
+    cleaned, raw = clean_records(read_frame(p), source=Path(p).name, errors=counts)
+    print(f"Cleaned: {len(cleaned)} rows in {time.perf_counter() - t0:.2f}s")
+    print("coercion errors:", counts)
+    print(cleaned[:3])
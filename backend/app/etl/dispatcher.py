@@ -1,10 +1,52 @@
 # backend/app/etl/dispatcher.py
-from typing import Dict, Callable, Any
-from app.etl.airlines_etl import process_airlines_upload
-from app.etl.passengers_etl import process_passengers_upload
-from app.etl.flights_etl import process_flights_upload
-from app.etl.travelagency_etl import process_travelagency_upload
-from app.etl.airports_etl import process_airports_upload   # <-- ADD THIS IMPORT
+"""
+Route one staged payload to its ETL runtime handler (dispatch_etl), and drain a
+backlog of unprocessed staging_raw records from the command line:
+
+    python -m backend.app.etl.dispatcher --workers 8 --promote
+    python -m backend.app.etl.dispatcher --entity flights --order upload --dry-run
+
+The backlog scan reads only ids and metadata (keyset pages of DISPATCH_SCAN_PAGE)
+and groups chunk records into units of (entity, upload_id). Units are queued on
+lanes that run in parallel on a thread pool; a lane processes its units one after
+the other in upload_id order, and the chunks of a unit in staging id order:
+
+  --order entity   one lane per entity (default): later uploads of an entity
+                   always upsert after earlier ones
+  --order upload   one lane per upload: only the chunks of an upload stay ordered
+
+--promote promotes each drained upload into its dim table in id-range chunks
+(promotion.promote).
+
+A chunk that raises stops its lane (the rest of that entity waits for the next run)
+and is logged to import_errors. Finished chunks are marked processed in
+staging_raw and recorded in a checkpoint file (DISPATCH_CHECKPOINT_PATH), so an
+interrupted run resumes where it stopped, even for chunks whose processed flag
+could not be written. Progress (chunks, rows, rows/s, ETA) is printed every
+--progress seconds.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Callable, Any, List, Optional, Tuple
+
+from .airlines_etl import process_airlines_upload
+from .passengers_etl import process_passengers_upload
+from .flights_etl import process_flights_upload
+from .travelagency_etl import process_travelagency_upload
+from .airports_etl import process_airports_upload
+from .corporatesales_etl import process_corporatesales_upload
+from ..datasets import DATASETS
+from ..services.supabase_client import sb
+from ..services import key_cache
+from .. import promotion
 
 ETL_HANDLERS: Dict[str, Callable[[int, dict, int], Any]] = {
     "airline": process_airlines_upload,
@@ -19,13 +61,355 @@ ETL_HANDLERS: Dict[str, Callable[[int, dict, int], Any]] = {
     "travelagency": process_travelagency_upload,
     "travel_agency": process_travelagency_upload,
 
-    # ✅ FIX: add airport mappings
     "airport": process_airports_upload,
     "airports": process_airports_upload,
+
+    "corporatesales": process_corporatesales_upload,
+    "corporate_sales": process_corporatesales_upload,
 }
 
+# handler -> (promotion rpc, cleaned table, dim table or None); used by --promote once an upload is drained
+PROMOTIONS: Dict[Callable, Tuple[str, str, Optional[str]]] = {
+    ETL_HANDLERS[name]: (cfg["rpc"], cfg["cleaned_table"], cfg["dim_table"]) for name, cfg in DATASETS.items()
+}
+
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", "4"))
+# staging_raw ids read per scan page, and chunk payloads fetched per request
+DISPATCH_SCAN_PAGE = int(os.getenv("DISPATCH_SCAN_PAGE", "1000"))
+DISPATCH_FETCH_CHUNKS = int(os.getenv("DISPATCH_FETCH_CHUNKS", "10"))
+DISPATCH_CHECKPOINT_PATH = os.getenv(
+    "DISPATCH_CHECKPOINT_PATH", os.path.join(tempfile.gettempdir(), "etl_dispatch_checkpoint.json")
+)
+# minimum seconds between checkpoint writes (always written at the end of a unit)
+DISPATCH_CHECKPOINT_EVERY = float(os.getenv("DISPATCH_CHECKPOINT_EVERY", "5"))
+
+
 def dispatch_etl(upload_id: int, entity: str, raw: dict, run_id: int = None):
     handler = ETL_HANDLERS.get((entity or "").lower())
     if not handler:
         raise ValueError(f"No ETL handler for entity '{entity}'")
     return handler(upload_id, raw, run_id)
+
+
+# ---------- backlog reprocessing ----------
+
+def _data(res: Any) -> List[Dict[str, Any]]:
+    if isinstance(res, dict):
+        if res.get("error"):
+            raise RuntimeError(res.get("error"))
+        return res.get("data") or []
+    return getattr(res, "data", None) or []
+
+
+def _unit_key(entity: str, upload_id: Optional[int]) -> str:
+    return f"{entity}:{upload_id}"
+
+
+def scan_backlog(entities: Optional[List[str]] = None, page: int = DISPATCH_SCAN_PAGE) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Unprocessed staging_raw records grouped by (entity, upload_id), without payloads.
+    Returns (units, skipped) where each unit is
+    {"entity", "handler", "upload_id", "ids": [...], "rows": n} and skipped counts
+    records per entity that has no handler.
+    """
+    wanted = {ETL_HANDLERS[e.lower()] for e in entities} if entities else None
+    units: Dict[str, Dict[str, Any]] = {}
+    skipped: Dict[str, int] = {}
+    last_id = 0
+    while True:
+        batch = _data(
+            sb.table("staging_raw").select("id,entity,detected_entity,upload_id,notes")
+            .eq("processed", False).gt("id", last_id).order("id").limit(page).execute()
+        )
+        for rec in batch:
+            entity = (rec.get("detected_entity") or rec.get("entity") or "").lower()
+            handler = ETL_HANDLERS.get(entity)
+            if handler is None:
+                skipped[entity] = skipped.get(entity, 0) + 1
+                continue
+            if wanted is not None and handler not in wanted:
+                continue
+            key = _unit_key(entity, rec.get("upload_id"))
+            unit = units.setdefault(key, {"key": key, "entity": entity, "handler": handler,
+                                          "upload_id": rec.get("upload_id"), "ids": [], "rows": 0})
+            unit["ids"].append(rec["id"])
+            notes = rec.get("notes")
+            unit["rows"] += int(notes.get("rows", 1)) if isinstance(notes, dict) else 1
+        if len(batch) < page:
+            break
+        last_id = batch[-1]["id"]
+    return list(units.values()), skipped
+
+
+def plan_lanes(units: List[Dict[str, Any]], order: str = "entity") -> List[List[Dict[str, Any]]]:
+    """Group units into lanes that must run sequentially, each sorted by upload_id."""
+    lanes: Dict[Any, List[Dict[str, Any]]] = {}
+    for unit in units:
+        lane = unit["handler"] if order == "entity" else unit["key"]
+        lanes.setdefault(lane, []).append(unit)
+    for lane in lanes.values():
+        lane.sort(key=lambda u: (u["upload_id"] is None, u["upload_id"] or 0, u["ids"][0]))
+    # biggest lanes first so the pool is not left waiting on one long tail
+    return sorted(lanes.values(), key=lambda lane: -sum(u["rows"] for u in lane))
+
+
+class Checkpoint:
+    """Last finished staging id per unit, persisted as JSON (atomic replace)."""
+
+    def __init__(self, path: Optional[str] = DISPATCH_CHECKPOINT_PATH):
+        self.path = path
+        self.done: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as fh:
+                    self.done = {k: int(v) for k, v in json.load(fh).get("done", {}).items()}
+            except Exception as e:
+                print("Warning: could not read dispatch checkpoint:", str(e))
+
+    def last(self, key: str) -> int:
+        with self._lock:
+            return self.done.get(key, 0)
+
+    def advance(self, key: str, staging_id: int, force: bool = False) -> None:
+        with self._lock:
+            self.done[key] = max(self.done.get(key, 0), int(staging_id))
+            if force or time.monotonic() - self._saved_at >= DISPATCH_CHECKPOINT_EVERY:
+                self._save()
+
+    def save(self) -> None:
+        with self._lock:
+            self._save()
+
+    def _save(self) -> None:
+        self._saved_at = time.monotonic()
+        if not self.path:
+            return
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({"done": self.done, "saved_at": datetime.now(timezone.utc).isoformat()}, fh)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print("Warning: could not write dispatch checkpoint:", str(e))
+
+    def reset(self) -> None:
+        with self._lock:
+            self.done = {}
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class Progress:
+    """Thread-safe counters plus a reporter thread printing throughput and ETA."""
+
+    def __init__(self, total_chunks: int, total_rows: int, interval: float = 10.0):
+        self.total_chunks = total_chunks
+        self.total_rows = total_rows
+        self.interval = interval
+        self.chunks = self.rows = self.processed = self.errors = self.failed_units = 0
+        self.t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, chunks: int = 0, rows: int = 0, processed: int = 0, errors: int = 0, failed_units: int = 0) -> None:
+        with self._lock:
+            self.chunks += chunks
+            self.rows += rows
+            self.processed += processed
+            self.errors += errors
+            self.failed_units += failed_units
+
+    def line(self) -> str:
+        with self._lock:
+            elapsed = max(time.perf_counter() - self.t0, 1e-9)
+            rate = self.rows / elapsed
+            left = max(self.total_rows - self.rows, 0)
+            eta = f"{left / rate:.0f}s" if rate > 0 else "?"
+            return (f"[dispatch] {self.chunks}/{self.total_chunks} chunks  {self.rows}/{self.total_rows} rows  "
+                    f"{rate:,.0f} rows/s  eta {eta}  errors={self.errors} failed_units={self.failed_units}")
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            print(self.line(), flush=True)
+
+    def start(self) -> None:
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = time.perf_counter() - self.t0
+            return {
+                "chunks": self.chunks,
+                "rows": self.rows,
+                "processed": self.processed,
+                "errors": self.errors,
+                "failed_units": self.failed_units,
+                "seconds": round(elapsed, 2),
+                "rows_per_second": round(self.rows / elapsed, 1) if elapsed > 0 else None,
+            }
+
+
+def _log_failure(unit: Dict[str, Any], staging_id: int, exc: Exception) -> None:
+    try:
+        sb.table("import_errors").insert({
+            "sourcetable": "staging_raw",
+            "sourceid": staging_id,
+            "raw": {"upload_id": unit["upload_id"], "entity": unit["entity"]},
+            "errormessage": f"dispatch failed: {exc}",
+            "createdat": datetime.now(timezone.utc).isoformat(),
+        }).execute()
+    except Exception:
+        pass
+
+
+def _promote(unit: Dict[str, Any]) -> None:
+    rpc, cleaned, dim = PROMOTIONS[unit["handler"]]
+    promotion.promote(rpc, cleaned, unit["upload_id"])
+    key_cache.refresh_after_promotion(dim)
+
+
+def run_unit(unit: Dict[str, Any], checkpoint: Checkpoint, progress: Progress,
+             run_id: Optional[int] = None, promote: bool = False) -> bool:
+    """Dispatch every pending chunk of one unit in id order. False if a chunk failed."""
+    done = checkpoint.last(unit["key"])
+    pending = [i for i in unit["ids"] if i > done]
+    skipped = len(unit["ids"]) - len(pending)
+    if skipped:
+        # processed in an earlier run whose processed flag was not written
+        try:
+            sb.table("staging_raw").update({"processed": True}).in_("id", [i for i in unit["ids"] if i <= done]).execute()
+        except Exception:
+            pass
+        progress.add(chunks=skipped)
+
+    for start in range(0, len(pending), DISPATCH_FETCH_CHUNKS):
+        ids = pending[start : start + DISPATCH_FETCH_CHUNKS]
+        records = sorted(_data(sb.table("staging_raw").select("id,raw").in_("id", ids).execute()), key=lambda r: r["id"])
+        for rec in records:
+            raw = rec.get("raw")
+            try:
+                result = unit["handler"](unit["upload_id"], raw, run_id) or {}
+            except Exception as e:
+                _log_failure(unit, rec["id"], e)
+                checkpoint.save()
+                progress.add(failed_units=1)
+                return False
+            rows = len(raw["rows"]) if isinstance(raw, dict) and isinstance(raw.get("rows"), list) else 1
+            progress.add(chunks=1, rows=rows, processed=int(result.get("processed", 0)), errors=int(result.get("errors", 0)))
+            checkpoint.advance(unit["key"], rec["id"])
+        try:
+            sb.table("staging_raw").update({"processed": True}).in_("id", [r["id"] for r in records]).execute()
+        except Exception as e:
+            print("Warning: could not mark staging_raw processed:", str(e))
+
+    if promote and unit["upload_id"] is not None:
+        try:
+            _promote(unit)
+        except Exception as e:
+            print(f"Warning: promotion failed for {unit['key']}:", str(e))
+    checkpoint.advance(unit["key"], unit["ids"][-1], force=True)
+    return True
+
+
+def _run_lane(lane: List[Dict[str, Any]], checkpoint: Checkpoint, progress: Progress,
+              run_id: Optional[int], promote: bool) -> List[str]:
+    """Run a lane's units in order; stop at the first failure. Returns the failed/unrun unit keys."""
+    for n, unit in enumerate(lane):
+        try:
+            ok = run_unit(unit, checkpoint, progress, run_id=run_id, promote=promote)
+        except Exception as e:
+            print(f"Warning: unit {unit['key']} aborted:", str(e))
+            progress.add(failed_units=1)
+            ok = False
+        if not ok:
+            return [u["key"] for u in lane[n:]]
+    return []
+
+
+def reprocess_backlog(workers: int = DISPATCH_WORKERS, order: str = "entity", entities: Optional[List[str]] = None,
+                      promote: bool = False, checkpoint_path: Optional[str] = DISPATCH_CHECKPOINT_PATH,
+                      reset: bool = False, dry_run: bool = False, progress_every: float = 10.0) -> Dict[str, Any]:
+    """Scan, plan and drain the staging backlog. Returns a summary dict."""
+    units, skipped = scan_backlog(entities)
+    lanes = plan_lanes(units, order)
+    total_rows = sum(u["rows"] for u in units)
+    plan = {
+        "units": len(units),
+        "lanes": len(lanes),
+        "chunks": sum(len(u["ids"]) for u in units),
+        "rows": total_rows,
+        "skipped_no_handler": skipped,
+    }
+    if dry_run or not units:
+        return {"plan": plan}
+
+    checkpoint = Checkpoint(checkpoint_path)
+    if reset:
+        checkpoint.reset()
+    progress = Progress(plan["chunks"], total_rows, interval=progress_every)
+
+    run_id = None
+    try:
+        res = sb.table("etl_runs").insert({"jobname": "dispatch_backlog", "status": "started",
+                                           "note": json.dumps(plan), "startedat": datetime.now(timezone.utc).isoformat()}).execute()
+        rows = _data(res)
+        run_id = rows[0].get("id") if rows else None
+    except Exception as e:
+        print("Warning: could not create etl_runs row:", str(e))
+
+    progress.start()
+    failed: List[str] = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="dispatch") as pool:
+            futures = [pool.submit(_run_lane, lane, checkpoint, progress, run_id, promote) for lane in lanes]
+            for f in futures:
+                failed.extend(f.result())
+    finally:
+        progress.stop()
+        checkpoint.save()
+
+    summary = {"plan": plan, **progress.summary(), "unfinished_units": failed}
+    if run_id is not None:
+        try:
+            sb.table("etl_runs").update({"status": "failed" if failed else "success",
+                                         "note": json.dumps(summary, default=str),
+                                         "finishedat": datetime.now(timezone.utc).isoformat()}).eq("id", run_id).execute()
+        except Exception:
+            pass
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Drain unprocessed staging_raw records through the ETL handlers.")
+    ap.add_argument("--workers", type=int, default=DISPATCH_WORKERS, help="lanes processed in parallel")
+    ap.add_argument("--order", choices=["entity", "upload"], default="entity",
+                    help="keep uploads of an entity in order (entity) or only chunks of an upload (upload)")
+    ap.add_argument("--entity", action="append", choices=sorted(ETL_HANDLERS), help="limit to an entity (repeatable)")
+    ap.add_argument("--promote", action="store_true", help="call the process_cleaned_* RPC after each upload")
+    ap.add_argument("--checkpoint", default=DISPATCH_CHECKPOINT_PATH, help="checkpoint file ('' to disable)")
+    ap.add_argument("--reset", action="store_true", help="ignore and clear an existing checkpoint")
+    ap.add_argument("--dry-run", action="store_true", help="only print the plan")
+    ap.add_argument("--progress", type=float, default=10.0, help="seconds between progress lines (0 = off)")
+    args = ap.parse_args(argv)
+
+    summary = reprocess_backlog(
+        workers=args.workers, order=args.order, entities=args.entity, promote=args.promote,
+        checkpoint_path=args.checkpoint or None, reset=args.reset, dry_run=args.dry_run,
+        progress_every=args.progress,
+    )
+    print(json.dumps(summary, indent=2, default=str))
+    return 1 if summary.get("unfinished_units") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
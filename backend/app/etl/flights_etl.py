@@ -2,9 +2,11 @@
 from __future__ import annotations
 from pathlib import Path
 import pandas as pd
-from typing import List, Tuple, Dict, Any, Optional
+from typing import List, Tuple, Dict, Any, Iterator, Optional
 from datetime import datetime
 from ..services.supabase_client import sb
+from ..services.sinks import get_sink, write_in_batches
+from .. import readers
 
 # helpers
 def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
@@ -45,8 +47,19 @@ def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(path)
+    return clean_records(read_frame(str(p)), source=p.name)
 
-    df = _read_csv_file(p)
+def read_frame(path: str, sheet: Optional[Any] = None) -> pd.DataFrame:
+    p = Path(path)
+    # xlsx / parquet / arrow / ndjson arrive typed; CSV goes through pandas
+    return readers.read_frame(p, sheet=sheet) if readers.detect_format(p.name) else _read_csv_file(p)
+
+def iter_frames(path: str, sheet: Optional[Any] = None) -> Iterator[pd.DataFrame]:
+    return readers.iter_etl_frames(path, read_frame, sheet=sheet)
+
+def clean_records(df: pd.DataFrame, source: Optional[str] = None,
+                  errors: Optional[Dict[str, Dict[str, int]]] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """clean_file() on an already-read frame (modified in place). No schema coercion, so `errors` is left as is."""
     df = _normalize_columns(df)
 
     # common header variants -> canonical names expected by cleaned_flights
@@ -100,8 +113,8 @@ def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     return cleaned_rows, raw_rows
 
 # upsert to cleaned_flights table (used when ingesting directly)
-def _upsert_cleaned_flight_row(row: Dict[str, Any], upload_id: int) -> None:
-    payload = {
+def _cleaned_flight_payload(row: Dict[str, Any], upload_id: int) -> Dict[str, Any]:
+    return {
         "flightkey": row.get("flightkey"),
         "originairportkey": row.get("originairportkey"),
         "destinationairportkey": row.get("destinationairportkey"),
@@ -113,12 +126,11 @@ def _upsert_cleaned_flight_row(row: Dict[str, Any], upload_id: int) -> None:
         "error_count": 0,
         "last_error": None
     }
-    # upsert on flightkey (your dimflight uses flightkey as business key)
-    res = sb.table("cleaned_flights").upsert(payload, on_conflict="flightkey").execute()
-    if isinstance(res, dict) and res.get("error"):
-        raise Exception(res.get("error"))
-    if hasattr(res, "error") and res.error:
-        raise Exception(str(res.error))
+
+def _upsert_cleaned_flight_rows(rows: List[Dict[str, Any]], upload_id: int) -> None:
+    payloads = [_cleaned_flight_payload(row, upload_id) for row in rows]
+    # upsert on flightkey (your dimflight uses flightkey as business key); one sink call per batch
+    get_sink().upsert("cleaned_flights", payloads, on_conflict="flightkey", batch_size=max(1, len(payloads)))
 
 def process_flights_upload(upload_id: int, raw: Optional[Dict[str, Any]], run_id: int = None) -> Dict[str, int]:
     """
@@ -144,6 +156,22 @@ def process_flights_upload(upload_id: int, raw: Optional[Dict[str, Any]], run_id
 
     processed = 0
     errors = 0
+    pending: List[Tuple[Any, Dict[str, Any]]] = []  # (staged row, normalized row)
+
+    def log_error(r: Any, e: Exception) -> None:
+        nonlocal errors
+        errors += 1
+        try:
+            sb.table("import_errors").insert({
+                "sourcetable": "cleaned_flights",
+                "sourceid": None,
+                "raw": r,
+                "errormessage": str(e),
+                "createdat": datetime.utcnow().isoformat()
+            }).execute()
+        except Exception:
+            pass
+
     for r in rows:
         try:
             rec = r.get("rawjson") if isinstance(r, dict) and "rawjson" in r else r
@@ -166,21 +194,12 @@ def process_flights_upload(upload_id: int, raw: Optional[Dict[str, Any]], run_id
                 "aircrafttype": rec.get("aircrafttype") or rec.get("aircraft_type") or rec.get("aircraft"),
                 "rawjson": rec
             }
-            _upsert_cleaned_flight_row(normalized, upload_id)
-            processed += 1
+            pending.append((r, normalized))
         except Exception as e:
-            errors += 1
-            try:
-                sb.table("import_errors").insert({
-                    "sourcetable": "cleaned_flights",
-                    "sourceid": None,
-                    "raw": r,
-                    "errormessage": str(e),
-                    "createdat": datetime.utcnow().isoformat()
-                }).execute()
-            except Exception:
-                pass
+            log_error(r, e)
 
+    processed += write_in_batches(lambda batch: _upsert_cleaned_flight_rows([n for _, n in batch], upload_id),
+                                  pending, lambda item, e: log_error(item[0], e))
     return {"processed": processed, "errors": errors}
 
 # optional quick test when run directly
@@ -23,10 +23,13 @@ from pathlib import Path
 import io
 import pandas as pd
 import numpy as np
-from typing import List, Tuple, Dict, Any, Optional
+from typing import List, Tuple, Dict, Any, Iterator, Optional
 from datetime import datetime
 
 from ..services.supabase_client import sb
+from ..services.sinks import get_sink, write_in_batches
+from .. import readers
+from .. import schemas
 
 # ---------- helpers (pandas-based parsing + normalization) ----------
 
@@ -40,13 +43,6 @@ def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     df.columns = cols
     return df
 
-def _df_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
-    str_cols = df.select_dtypes(include=["object", "string"]).columns
-    for c in str_cols:
-        df[c] = df[c].astype(str).str.strip().replace({"nan": None, "None": None})
-    df = df.where(pd.notnull(df), None)
-    return df.to_dict(orient="records")
-
 def _read_csv_file(path: Path) -> pd.DataFrame:
     try:
         return pd.read_csv(path, engine="python")
@@ -62,8 +58,19 @@ def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(path)
+    return clean_records(read_frame(str(p)), source=p.name)
+
+def read_frame(path: str, sheet: Optional[Any] = None) -> pd.DataFrame:
+    p = Path(path)
+    # xlsx / parquet / arrow / ndjson arrive typed; CSV goes through pandas
+    return readers.read_frame(p, sheet=sheet) if readers.detect_format(p.name) else _read_csv_file(p)
 
-    df = _read_csv_file(p)
+def iter_frames(path: str, sheet: Optional[Any] = None) -> Iterator[pd.DataFrame]:
+    return readers.iter_etl_frames(path, read_frame, sheet=sheet)
+
+def clean_records(df: pd.DataFrame, source: Optional[str] = None,
+                  errors: Optional[Dict[str, Dict[str, int]]] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """clean_file() on an already-read frame (modified in place); coercion error counts are added to `errors`."""
     df = _normalize_columns(df)
 
     # map common variations
@@ -71,19 +78,18 @@ def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         df["name"] = df["first_name"].fillna("") + " " + df["last_name"].fillna("")
     if "id" in df.columns and "passenger_id" not in df.columns:
         df = df.rename(columns={"id": "passenger_id"})
-    # Try to coerce numeric age
-    if "age" in df.columns:
-        df["age"] = pd.to_numeric(df["age"], errors="coerce")
-        # replace NaN with None for consistency
-        df["age"] = df["age"].where(pd.notnull(df["age"]), None)
-
-    # trim and normalize string columns
-    str_cols = df.select_dtypes(include=["object", "string"]).columns
+    # typed columns (age -> Int64, ids/names -> stripped strings); counts added to `errors`
+    df = schemas.coerce_frame(df, "passengers", source=source)
+    if errors is not None:
+        schemas.merge_errors(errors, schemas.coercion_errors(df))
+
+    # trim and normalize the remaining string columns
+    str_cols = [c for c in df.select_dtypes(include=["object", "string"]).columns if c not in schemas.SCHEMAS["passengers"]]
     for c in str_cols:
         df[c] = df[c].astype(str).str.strip().replace({"nan": None, "None": None})
 
     df = df.drop_duplicates().reset_index(drop=True)
-    records = _df_to_records(df)
+    records = schemas.to_records(df)
 
     cleaned_rows: List[Dict[str, Any]] = []
     raw_rows: List[Dict[str, Any]] = []
@@ -93,7 +99,7 @@ def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         cleaned_rows.append({
             "passenger_id": r.get("passenger_id") or r.get("id") or None,
             "name": r.get("name") or ( (r.get("first_name") or "") + " " + (r.get("last_name") or "") ).strip() or None,
-            "age": int(r["age"]) if (r.get("age") not in (None, "", "nan") and str(r.get("age")).isdigit()) else (int(float(r["age"])) if r.get("age") not in (None, "", "nan") else None) if r.get("age") is not None else None,
+            "age": r.get("age"),
             "rawjson": r
         })
 
@@ -101,12 +107,12 @@ def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
 
 # ---------- upsert / ETL runtime functions ----------
 
-def _upsert_passenger_row(row: Dict[str, Any], upload_id: int) -> None:
+def _passenger_payload(row: Dict[str, Any], upload_id: int) -> Dict[str, Any]:
     """
-    Upsert a single normalized passenger row into cleaned_passengers.
+    cleaned_passengers record of a normalized passenger row.
     Sets processed = true and upload_id for lineage.
     """
-    payload = {
+    return {
         "passenger_id": row.get("passenger_id"),
         "name": row.get("name"),
         "age": row.get("age"),
@@ -117,10 +123,12 @@ def _upsert_passenger_row(row: Dict[str, Any], upload_id: int) -> None:
         "error_count": 0,
         "last_error": None
     }
+
+def _upsert_passenger_rows(rows: List[Dict[str, Any]], upload_id: int) -> None:
+    """Upsert normalized passenger rows into cleaned_passengers in one sink call."""
+    payloads = [_passenger_payload(row, upload_id) for row in rows]
     # upsert on passenger_id natural key
-    res = supabase.table("cleaned_passengers").upsert(payload, on_conflict="passenger_id").execute()
-    if getattr(res, "status_code", None) and res.status_code >= 400:
-        raise Exception(res.error)
+    get_sink().upsert("cleaned_passengers", payloads, on_conflict="passenger_id", batch_size=max(1, len(payloads)))
 
 def process_passengers_upload(upload_id: int, raw: Optional[Dict[str, Any]], run_id: int = None) -> Dict[str, int]:
     """
@@ -151,14 +159,27 @@ def process_passengers_upload(upload_id: int, raw: Optional[Dict[str, Any]], run
 
     processed = 0
     errors = 0
-
-    for r in rows:
+    pending: List[Tuple[Any, Dict[str, Any]]] = []  # (staged row, normalized row)
+
+    def log_error(r: Any, e: Exception) -> None:
+        nonlocal errors
+        errors += 1
+        # record import error for the row
+        sb.table("import_errors").insert({
+            "upload_id": upload_id,
+            "row_data": r,
+            "message": str(e)
+        }).execute()
+
+    recs = [r.get("rawjson") if isinstance(r, dict) and "rawjson" in r else r for r in rows]
+    typed_rows = schemas.coerce_records([rec if isinstance(rec, dict) else {} for rec in recs], "passengers")
+
+    for r, rec, typed in zip(rows, recs, typed_rows):
         try:
-            rec = r.get("rawjson") if isinstance(r, dict) and "rawjson" in r else r
             pid = rec.get("passenger_id") or rec.get("id")
             if not pid:
                 errors += 1
-                supabase.table("import_errors").insert({
+                sb.table("import_errors").insert({
                     "upload_id": upload_id,
                     "row_data": rec,
                     "message": "missing passenger id"
@@ -168,22 +189,17 @@ def process_passengers_upload(upload_id: int, raw: Optional[Dict[str, Any]], run
             normalized = {
                 "passenger_id": pid,
                 "name": rec.get("name") or ( (rec.get("first_name") or "") + " " + (rec.get("last_name") or "") ).strip() or None,
-                "age": (int(rec.get("age")) if (rec.get("age") not in (None, "", "nan") and str(rec.get("age")).replace('.','',1).isdigit()) else None),
+                "age": typed.get("age"),
                 "rawjson": rec
             }
 
-            _upsert_passenger_row(normalized, upload_id)
-            processed += 1
+            pending.append((r, normalized))
 
         except Exception as e:
-            errors += 1
-            # record import error for the row
-            supabase.table("import_errors").insert({
-                "upload_id": upload_id,
-                "row_data": r,
-                "message": str(e)
-            }).execute()
+            log_error(r, e)
 
+    processed += write_in_batches(lambda batch: _upsert_passenger_rows([n for _, n in batch], upload_id),
+                                  pending, lambda item, e: log_error(item[0], e))
     return {"processed": processed, "errors": errors}
 
 
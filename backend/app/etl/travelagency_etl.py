@@ -18,10 +18,13 @@ from __future__ import annotations
 from pathlib import Path
 import pandas as pd
 import numpy as np
-from typing import List, Tuple, Dict, Any, Optional
+from typing import List, Tuple, Dict, Any, Iterator, Optional
 from datetime import datetime
 
 from ..services.supabase_client import sb
+from ..services.sinks import get_sink, write_in_batches
+from .. import readers
+from .. import schemas
 
 def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     cols = (
@@ -33,13 +36,6 @@ def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     df.columns = cols
     return df
 
-def _df_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
-    str_cols = df.select_dtypes(include=["object", "string"]).columns
-    for c in str_cols:
-        df[c] = df[c].astype(str).str.strip().replace({"nan": None, "None": None})
-    df = df.where(pd.notnull(df), None)
-    return df.to_dict(orient="records")
-
 def _read_csv_file(path: Path) -> pd.DataFrame:
     try:
         return pd.read_csv(path, engine="python")
@@ -50,7 +46,19 @@ def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(path)
-    df = _read_csv_file(p)
+    return clean_records(read_frame(str(p)), source=p.name)
+
+def read_frame(path: str, sheet: Optional[Any] = None) -> pd.DataFrame:
+    p = Path(path)
+    # xlsx / parquet / arrow / ndjson arrive typed; CSV goes through pandas
+    return readers.read_frame(p, sheet=sheet) if readers.detect_format(p.name) else _read_csv_file(p)
+
+def iter_frames(path: str, sheet: Optional[Any] = None) -> Iterator[pd.DataFrame]:
+    return readers.iter_etl_frames(path, read_frame, sheet=sheet)
+
+def clean_records(df: pd.DataFrame, source: Optional[str] = None,
+                  errors: Optional[Dict[str, Dict[str, int]]] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """clean_file() on an already-read frame (modified in place); coercion error counts are added to `errors`."""
     df = _normalize_columns(df)
 
     # map common keys
@@ -65,19 +73,21 @@ def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     if "sale_date" in df.columns and "saledate" not in df.columns:
         df = df.rename(columns={"sale_date": "saledate"})
 
-    if "saledate" in df.columns:
-        df["saledate"] = pd.to_datetime(df["saledate"], errors="coerce").dt.date
-
     if "sale_amount" in df.columns and "saleamount" not in df.columns:
         df = df.rename(columns={"sale_amount": "saleamount"})
 
-    # normalize string columns
-    str_cols = df.select_dtypes(include=["object", "string"]).columns
+    # typed columns (saleamount -> Float64, saledate -> ISO date); counts added to `errors`
+    df = schemas.coerce_frame(df, "travelagency", source=source)
+    if errors is not None:
+        schemas.merge_errors(errors, schemas.coercion_errors(df))
+
+    # normalize the remaining string columns
+    str_cols = [c for c in df.select_dtypes(include=["object", "string"]).columns if c not in schemas.SCHEMAS["travelagency"]]
     for c in str_cols:
         df[c] = df[c].astype(str).str.strip().replace({"nan": None, "None": None})
 
     df = df.drop_duplicates().reset_index(drop=True)
-    records = _df_to_records(df)
+    records = schemas.to_records(df)
     cleaned_rows = []
     raw_rows = []
     for r in records:
@@ -88,15 +98,15 @@ def clean_file(path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
             "transactionid": r.get("transactionid") or r.get("transaction_id"),
             "passengername": r.get("passengername") or r.get("passenger_name"),
             "flightnumber": r.get("flightnumber") or r.get("flight_number"),
-            "saleamount": r.get("saleamount") if r.get("saleamount") not in (None, "", "nan") else None,
+            "saleamount": r.get("saleamount"),
             "currency": r.get("currency"),
             "saledate": r.get("saledate"),
             "rawjson": r
         })
     return cleaned_rows, raw_rows
 
-def _upsert_travel_row(row: Dict[str, Any], upload_id: int):
-    payload = {
+def _travel_payload(row: Dict[str, Any], upload_id: int) -> Dict[str, Any]:
+    return {
         "agencykey": row.get("agencykey"),
         "agencyname": row.get("agencyname"),
         "transactionid": row.get("transactionid"),
@@ -112,9 +122,10 @@ def _upsert_travel_row(row: Dict[str, Any], upload_id: int):
         "error_count": 0,
         "last_error": None
     }
-    res = supabase.table("cleaned_travelagency").upsert(payload, on_conflict="transactionid").execute()
-    if getattr(res, "status_code", None) and res.status_code >= 400:
-        raise Exception(res.error)
+
+def _upsert_travel_rows(rows: List[Dict[str, Any]], upload_id: int) -> None:
+    payloads = [_travel_payload(row, upload_id) for row in rows]
+    get_sink().upsert("cleaned_travelagency", payloads, on_conflict="transactionid", batch_size=max(1, len(payloads)))
 
 def process_travelagency_upload(upload_id: int, raw: Optional[Dict[str, Any]], run_id: int = None) -> Dict[str, int]:
     rows = []
@@ -129,13 +140,21 @@ def process_travelagency_upload(upload_id: int, raw: Optional[Dict[str, Any]], r
 
     processed = 0
     errors = 0
-    for r in rows:
+    pending: List[Tuple[Any, Dict[str, Any]]] = []  # (staged row, normalized row)
+
+    def log_error(r: Any, e: Exception) -> None:
+        nonlocal errors
+        errors += 1
+        sb.table("import_errors").insert({"upload_id": upload_id, "row_data": r, "message": str(e)}).execute()
+
+    recs = [r.get("rawjson") if isinstance(r, dict) and "rawjson" in r else r for r in rows]
+    typed_rows = schemas.coerce_records([rec if isinstance(rec, dict) else {} for rec in recs], "travelagency")
+    for r, rec, typed in zip(rows, recs, typed_rows):
         try:
-            rec = r.get("rawjson") if isinstance(r, dict) and "rawjson" in r else r
             transaction = rec.get("transactionid") or rec.get("transaction_id") or rec.get("transaction")
             if not transaction:
                 errors += 1
-                supabase.table("import_errors").insert({"upload_id": upload_id, "row_data": rec, "message": "missing transaction id"}).execute()
+                sb.table("import_errors").insert({"upload_id": upload_id, "row_data": rec, "message": "missing transaction id"}).execute()
                 continue
             normalized = {
                 "agencykey": rec.get("agencykey") or rec.get("agency_id"),
@@ -143,16 +162,16 @@ def process_travelagency_upload(upload_id: int, raw: Optional[Dict[str, Any]], r
                 "transactionid": transaction,
                 "passengername": rec.get("passengername") or rec.get("passenger_name"),
                 "flightnumber": rec.get("flightnumber") or rec.get("flight_number"),
-                "saleamount": float(rec.get("saleamount")) if rec.get("saleamount") not in (None, "", "nan") else None,
+                "saleamount": typed.get("saleamount"),
                 "currency": rec.get("currency"),
-                "saledate": rec.get("saledate"),
+                "saledate": typed.get("saledate"),
                 "rawjson": rec
             }
-            _upsert_travel_row(normalized, upload_id)
-            processed += 1
+            pending.append((r, normalized))
         except Exception as e:
-            errors += 1
-            supabase.table("import_errors").insert({"upload_id": upload_id, "row_data": r, "message": str(e)}).execute()
+            log_error(r, e)
+    processed += write_in_batches(lambda batch: _upsert_travel_rows([n for _, n in batch], upload_id),
+                                  pending, lambda item, e: log_error(item[0], e))
     return {"processed": processed, "errors": errors}
 
 # quick local test
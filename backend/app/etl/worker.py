@@ -0,0 +1,269 @@
+# backend/app/etl/worker.py
+"""
+Standalone staging worker. Start as many as needed, on as many nodes as needed:
+
+    python -m backend.app.etl.worker --promote
+    python -m backend.app.etl.worker --threads 4 --entity flights --batch 20 --once
+
+A worker claims up to --batch unprocessed staging_raw chunks with the
+claim_staging_chunks RPC (backend/sql/staging_leases.sql). The RPC locks candidate
+rows FOR UPDATE SKIP LOCKED and leases them to the worker until lease_expires_at, so
+concurrent workers never get the same chunk and never wait on each other. Each
+claimed chunk runs through its entity's dispatcher handler (dispatch_etl):
+
+  - chunks that succeed are completed (processed = true, lease cleared)
+  - a chunk that raises is logged to import_errors and released; it can be claimed
+    again after WORKER_RETRY_DELAY seconds, at most WORKER_MAX_ATTEMPTS times in
+    total (then it stays unprocessed, with its attempts count, for inspection)
+  - chunks claimed but not started (the worker is stopping) are released without
+    using up an attempt
+
+While a batch runs, a heartbeat extends its leases every --lease/3 seconds. A worker
+that dies stops extending, and its chunks are claimed by other workers once the
+leases expire. Handlers upsert on natural keys, so a chunk that runs twice (its
+lease was lost by a stalled worker) does not duplicate rows.
+
+--promote promotes the uploads touched by a batch into their dim tables
+(promotion.promote) after the batch is completed.
+
+Unlike the backlog dispatcher (dispatcher.py, --order entity), workers do not keep
+the uploads of an entity in order. Use the dispatcher when a later upload must win
+over an earlier one.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from .dispatcher import ETL_HANDLERS, PROMOTIONS, _data, dispatch_etl
+from ..services.supabase_client import sb
+from ..services import key_cache
+from .. import promotion
+from ..promotion import parse_rpc_count
+
+WORKER_BATCH = int(os.getenv("WORKER_BATCH", "10"))
+WORKER_LEASE_SECONDS = int(os.getenv("WORKER_LEASE_SECONDS", "300"))
+WORKER_MAX_ATTEMPTS = int(os.getenv("WORKER_MAX_ATTEMPTS", "5"))
+# seconds before a failed chunk can be claimed again
+WORKER_RETRY_DELAY = int(os.getenv("WORKER_RETRY_DELAY", "60"))
+# seconds to sleep when a claim comes back empty
+WORKER_IDLE_SLEEP = float(os.getenv("WORKER_IDLE_SLEEP", "5"))
+
+
+def worker_name(n: int = 0) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{n}"
+
+
+class Stats:
+    """Counters shared by the worker threads of one process."""
+
+    def __init__(self):
+        self.claimed = self.completed = self.failed = self.lost = self.rows = 0
+        self.t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, **counts: int) -> None:
+        with self._lock:
+            for k, v in counts.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = time.perf_counter() - self.t0
+            return {
+                "claimed": self.claimed,
+                "completed": self.completed,
+                "failed": self.failed,
+                "lost_leases": self.lost,
+                "rows": self.rows,
+                "seconds": round(elapsed, 2),
+                "rows_per_second": round(self.rows / elapsed, 1) if elapsed > 0 else None,
+            }
+
+
+class Worker:
+    def __init__(self, name: str, stats: Stats, stop: threading.Event, batch: int = WORKER_BATCH,
+                 lease_seconds: int = WORKER_LEASE_SECONDS, entities: Optional[List[str]] = None,
+                 promote: bool = False, max_attempts: int = WORKER_MAX_ATTEMPTS, run_id: Optional[int] = None):
+        self.name = name
+        self.stats = stats
+        self.stop = stop
+        self.batch = batch
+        self.lease_seconds = lease_seconds
+        # only entities with a handler; others are left for whoever knows them
+        self.entities = entities or sorted(ETL_HANDLERS)
+        self.promote = promote
+        self.max_attempts = max_attempts
+        self.run_id = run_id
+
+    # ---- lease RPCs ----
+    def claim(self) -> List[Dict[str, Any]]:
+        chunks = _data(sb.rpc("claim_staging_chunks", {
+            "p_worker": self.name, "p_limit": self.batch, "p_lease_seconds": self.lease_seconds,
+            "p_entities": self.entities, "p_max_attempts": self.max_attempts,
+        }).execute())
+        return sorted(chunks, key=lambda c: c["id"])
+
+    def _lease_call(self, rpc: str, ids: List[int], **params: Any) -> int:
+        if not ids:
+            return 0
+        return parse_rpc_count(sb.rpc(rpc, {"p_worker": self.name, "p_ids": ids, **params}).execute())
+
+    def _heartbeat(self, ids: List[int], done: threading.Event) -> None:
+        while not done.wait(max(self.lease_seconds / 3, 1)):
+            try:
+                self._lease_call("extend_staging_leases", ids, p_lease_seconds=self.lease_seconds)
+            except Exception as e:
+                print(f"Warning: [{self.name}] could not extend leases:", str(e))
+
+    # ---- processing ----
+    def _log_failure(self, chunk: Dict[str, Any], exc: Exception) -> None:
+        try:
+            sb.table("import_errors").insert({
+                "sourcetable": "staging_raw",
+                "sourceid": chunk["id"],
+                "raw": {"upload_id": chunk.get("upload_id"), "entity": chunk.get("detected_entity") or chunk.get("entity"),
+                        "worker": self.name, "attempt": chunk.get("attempts")},
+                "errormessage": f"worker failed: {exc}",
+                "createdat": datetime.now(timezone.utc).isoformat(),
+            }).execute()
+        except Exception:
+            pass
+
+    def run_batch(self, chunks: List[Dict[str, Any]]) -> None:
+        ids = [c["id"] for c in chunks]
+        done_ids: List[int] = []
+        failed_ids: List[int] = []
+        rows = 0
+        done = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(ids, done), daemon=True)
+        beat.start()
+        try:
+            for chunk in chunks:
+                if self.stop.is_set():
+                    break
+                entity = chunk.get("detected_entity") or chunk.get("entity")
+                raw = chunk.get("raw")
+                try:
+                    dispatch_etl(chunk.get("upload_id"), entity, raw, self.run_id)
+                except Exception as e:
+                    self._log_failure(chunk, e)
+                    failed_ids.append(chunk["id"])
+                    continue
+                done_ids.append(chunk["id"])
+                rows += len(raw["rows"]) if isinstance(raw, dict) and isinstance(raw.get("rows"), list) else 1
+        finally:
+            done.set()
+            beat.join()
+            completed = self._lease_call("complete_staging_chunks", done_ids)
+            self._lease_call("release_staging_chunks", failed_ids, p_delay_seconds=WORKER_RETRY_DELAY)
+            # claimed but not started (stopping): straight back to the pool, without using up an attempt
+            self._lease_call("release_staging_chunks", [i for i in ids if i not in done_ids and i not in failed_ids],
+                             p_failed=False)
+            self.stats.add(completed=completed, failed=len(failed_ids), lost=len(done_ids) - completed, rows=rows)
+
+        if self.promote:
+            self._promote([c for c in chunks if c["id"] in done_ids])
+
+    def _promote(self, chunks: List[Dict[str, Any]]) -> None:
+        targets = set()
+        for c in chunks:
+            handler = ETL_HANDLERS.get((c.get("detected_entity") or c.get("entity") or "").lower())
+            if handler is not None and c.get("upload_id") is not None:
+                targets.add((PROMOTIONS[handler], c["upload_id"]))
+        for (rpc, cleaned, dim), upload_id in sorted(targets, key=lambda t: t[1]):
+            try:
+                promotion.promote(rpc, cleaned, upload_id)
+                key_cache.refresh_after_promotion(dim)
+            except Exception as e:
+                print(f"Warning: [{self.name}] promotion failed for {cleaned} upload {upload_id}:", str(e))
+
+    def run(self, once: bool = False, idle_sleep: float = WORKER_IDLE_SLEEP) -> None:
+        """Claim and process batches until stopped (or, with once, until nothing is left)."""
+        while not self.stop.is_set():
+            try:
+                chunks = self.claim()
+            except Exception as e:
+                print(f"Warning: [{self.name}] claim failed:", str(e))
+                chunks = []
+            if not chunks:
+                if once:
+                    return
+                self.stop.wait(idle_sleep)
+                continue
+            self.stats.add(claimed=len(chunks))
+            self.run_batch(chunks)
+
+
+def run_workers(threads: int = 1, once: bool = False, progress_every: float = 10.0, **options: Any) -> Dict[str, Any]:
+    """Run `threads` workers in this process until SIGINT/SIGTERM (or drained, with once)."""
+    stats = Stats()
+    stop = threading.Event()
+    run_id = None
+    try:
+        res = sb.table("etl_runs").insert({"jobname": "staging_worker", "status": "started", "note": worker_name(),
+                                           "startedat": datetime.now(timezone.utc).isoformat()}).execute()
+        rows = _data(res)
+        run_id = rows[0].get("id") if rows else None
+    except Exception as e:
+        print("Warning: could not create etl_runs row:", str(e))
+
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+    workers = [Worker(worker_name(n), stats, stop, run_id=run_id, **options) for n in range(max(1, threads))]
+    pool = [threading.Thread(target=w.run, kwargs={"once": once}, name=w.name) for w in workers]
+    for t in pool:
+        t.start()
+    for t in pool:
+        while t.is_alive():
+            t.join(progress_every if progress_every > 0 else None)
+            if t.is_alive():
+                print(f"[worker] {json.dumps(stats.summary())}", flush=True)
+
+    summary = {"workers": [w.name for w in workers], **stats.summary()}
+    if run_id is not None:
+        try:
+            sb.table("etl_runs").update({"status": "success", "note": json.dumps(summary, default=str),
+                                         "finishedat": datetime.now(timezone.utc).isoformat()}).eq("id", run_id).execute()
+        except Exception:
+            pass
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Claim and process staging_raw chunks (run one per node, or many).")
+    ap.add_argument("--threads", type=int, default=1, help="workers in this process")
+    ap.add_argument("--batch", type=int, default=WORKER_BATCH, help="chunks claimed per lease")
+    ap.add_argument("--lease", type=int, default=WORKER_LEASE_SECONDS, help="lease length in seconds")
+    ap.add_argument("--entity", action="append", choices=sorted(ETL_HANDLERS), help="limit to an entity (repeatable)")
+    ap.add_argument("--max-attempts", type=int, default=WORKER_MAX_ATTEMPTS, help="claims per chunk before it is parked")
+    ap.add_argument("--promote", action="store_true", help="promote touched uploads after each batch")
+    ap.add_argument("--once", action="store_true", help="exit when nothing is left to claim")
+    ap.add_argument("--progress", type=float, default=10.0, help="seconds between progress lines (0 = off)")
+    args = ap.parse_args(argv)
+
+    entities = None
+    if args.entity:
+        # every alias of the chosen handlers (staged rows carry whichever name the upload used)
+        wanted = {ETL_HANDLERS[e] for e in args.entity}
+        entities = sorted(name for name, h in ETL_HANDLERS.items() if h in wanted)
+
+    summary = run_workers(
+        threads=args.threads, once=args.once, progress_every=args.progress, batch=args.batch,
+        lease_seconds=args.lease, entities=entities, promote=args.promote, max_attempts=args.max_attempts,
+    )
+    print(json.dumps(summary, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+# backend/app/export.py
+"""
+Streaming export of cleaned_* / dim* tables.
+
+iter_pages() walks a table with keyset pagination (id > last_id ORDER BY id LIMIT n),
+so every request is an index range scan and nothing past one page is held in memory.
+The encoders turn pages into byte chunks for a StreamingResponse:
+
+  csv      header from the first page (or the requested columns), one csv.writer flush per page
+  ndjson   one JSON object per line
+  parquet  one row group per page, written through pyarrow.parquet.ParquetWriter
+
+gzip_chunks() optionally compresses any of them as a single gzip stream.
+pyarrow is only needed for parquet and is imported on first use.
+"""
+from __future__ import annotations
+import csv
+import importlib
+import io
+import json
+import zlib
+from typing import Any, Dict, Iterator, List, Optional
+
+pyarrow = None  # set by require_pyarrow()
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def require_pyarrow() -> None:
+    global pyarrow
+    if pyarrow is None:
+        try:
+            importlib.import_module("pyarrow.parquet")
+            pyarrow = importlib.import_module("pyarrow")
+        except Exception:
+            raise RuntimeError("parquet export requires pyarrow (pip install pyarrow).")
+
+
+def iter_pages(
+    client,
+    table: str,
+    page_size: int = 1000,
+    columns: Optional[List[str]] = None,
+    upload_id: Optional[int] = None,
+    time_column: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    key: str = "id",
+) -> Iterator[List[Dict[str, Any]]]:
+    """Yield pages of rows ordered by `key`, resuming each query after the last key seen."""
+    select_cols = "*"
+    if columns:
+        select_cols = ",".join(columns if key in columns else [key] + columns)
+    last = None
+    while True:
+        q = client.table(table).select(select_cols)
+        if upload_id is not None:
+            q = q.eq("upload_id", upload_id)
+        if time_column and since:
+            q = q.gte(time_column, since)
+        if time_column and until:
+            q = q.lt(time_column, until)
+        if last is not None:
+            q = q.gt(key, last)
+        res = q.order(key).limit(page_size).execute()
+        if isinstance(res, dict) and res.get("error"):
+            raise RuntimeError(res.get("error"))
+        rows = getattr(res, "data", None) or []
+        if not rows:
+            return
+        if columns and key not in columns:
+            yield [{c: r.get(c) for c in columns} for r in rows]
+        else:
+            yield rows
+        if len(rows) < page_size:
+            return
+        last = rows[-1][key]
+
+
+def _cell(v: Any) -> Any:
+    if isinstance(v, (dict, list)):
+        return json.dumps(v, default=str)
+    return v
+
+
+def csv_chunks(pages: Iterator[List[Dict[str, Any]]], columns: Optional[List[str]] = None) -> Iterator[bytes]:
+    header = list(columns) if columns else None
+    buf = io.StringIO()
+    writer = None
+    for page in pages:
+        if writer is None:
+            header = header or list(page[0].keys())
+            writer = csv.writer(buf)
+            writer.writerow(header)
+        for r in page:
+            writer.writerow(["" if r.get(c) is None else _cell(r.get(c)) for c in header])
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if writer is None and header:
+        yield (",".join(header) + "\r\n").encode("utf-8")
+
+
+def ndjson_chunks(pages: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    for page in pages:
+        yield "".join(json.dumps(r, default=str) + "\n" for r in page).encode("utf-8")
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to a generator (ParquetWriter, streamed zips)."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = bytes(b)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts = []
+        return out
+
+
+def _parquet_schema(page: List[Dict[str, Any]]):
+    """Schema from the first page; columns that are all-null or nested there become strings."""
+    inferred = pyarrow.Table.from_pylist([{k: _cell(v) for k, v in r.items()} for r in page]).schema
+    fields = []
+    for f in inferred:
+        t = f.type
+        if pyarrow.types.is_null(t) or pyarrow.types.is_nested(t):
+            t = pyarrow.string()
+        fields.append(pyarrow.field(f.name, t))
+    return pyarrow.schema(fields)
+
+
+def _parquet_table(page: List[Dict[str, Any]], schema):
+    string_cols = {f.name for f in schema if pyarrow.types.is_string(f.type)}
+    rows = []
+    for r in page:
+        row = {}
+        for name in schema.names:
+            v = _cell(r.get(name))
+            if v is not None and name in string_cols and not isinstance(v, str):
+                v = str(v)
+            row[name] = v
+        rows.append(row)
+    return pyarrow.Table.from_pylist(rows, schema=schema)
+
+
+def parquet_chunks(pages: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    require_pyarrow()
+    sink = ChunkSink()
+    writer = None
+    for page in pages:
+        if writer is None:
+            schema = _parquet_schema(page)
+            writer = pyarrow.parquet.ParquetWriter(sink, schema)
+        writer.write_table(_parquet_table(page, schema))
+        data = sink.drain()
+        if data:
+            yield data
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+def gzip_chunks(chunks: Iterator[bytes], level: int = 6) -> Iterator[bytes]:
+    comp = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        out = comp.compress(chunk)
+        if out:
+            yield out
+    yield comp.flush()
+
+
+def encode(fmt: str, pages: Iterator[List[Dict[str, Any]]], columns: Optional[List[str]] = None) -> Iterator[bytes]:
+    if fmt == "csv":
+        return csv_chunks(pages, columns)
+    if fmt == "ndjson":
+        return ndjson_chunks(pages)
+    if fmt == "parquet":
+        return parquet_chunks(pages)
+    raise ValueError(f"Unsupported export format: {fmt}")
@@ -0,0 +1,213 @@
+# backend/app/promotion.py
+"""
+Chunked dimension promotion.
+
+A single process_cleaned_<x>(p_upload_id) call promotes a whole upload in one
+transaction, which can run into the statement timeout and keeps the dim table
+locked for as long as it runs. promote() instead:
+
+  1. reads the id bounds of the upload's unprocessed cleaned rows;
+  2. calls process_cleaned_<x>_range(p_upload_id, p_min_id, p_max_id) for consecutive
+     id ranges of PROMOTION_CHUNK_ROWS ids, one short transaction each
+     (backend/sql/promotion_ranges.sql);
+  3. adds up the parse_rpc_count() results and records progress in PROGRESS.
+
+The range functions run the unchanged process_cleaned_<x> on just that id range, so
+the single RPC stays the behaviour of record. When there are no cleaned rows yet (the
+RPC materializes staged rows itself) or the range function is not installed, promote()
+makes the single process_cleaned_<x> call.
+
+PROGRESS keeps the latest promotions only: finished ones are dropped after
+PROMOTION_PROGRESS_TTL seconds, and beyond PROMOTION_PROGRESS_MAX entries the least
+recently updated go first.
+A failed range leaves earlier ranges promoted; running promote() again continues with
+the rows still unprocessed.
+
+promote_many() runs promotions for several entities on a thread pool; jobs that
+write the same dim table run one after the other.
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .services.supabase_client import sb
+
+PROMOTION_CHUNK_ROWS = int(os.getenv("PROMOTION_CHUNK_ROWS", "5000"))
+PROMOTION_WORKERS = int(os.getenv("PROMOTION_WORKERS", "4"))
+PROMOTION_PROGRESS_TTL = float(os.getenv("PROMOTION_PROGRESS_TTL", "3600"))
+PROMOTION_PROGRESS_MAX = int(os.getenv("PROMOTION_PROGRESS_MAX", "1000"))
+
+# "<rpc>:<upload_id>" -> progress of the latest promotion, least recently updated first
+PROGRESS: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_progress_lock = threading.Lock()
+
+
+def parse_rpc_count(res) -> int:
+    try:
+        if hasattr(res, "data"):
+            d = res.data
+            if isinstance(d, list) and d:
+                first = d[0]
+                if isinstance(first, dict):
+                    for v in first.values():
+                        if isinstance(v, int):
+                            return v
+                if isinstance(first, int):
+                    return first
+            if isinstance(d, int):
+                return d
+    except Exception:
+        pass
+    if isinstance(res, dict):
+        if "data" in res:
+            d = res["data"]
+            if isinstance(d, list) and d:
+                first = d[0]
+                if isinstance(first, dict):
+                    for v in first.values():
+                        if isinstance(v, int):
+                            return v
+                if isinstance(first, int):
+                    return first
+            if isinstance(d, int):
+                return d
+        for k in ("count", "rows_affected", "result"):
+            if k in res and isinstance(res[k], int):
+                return res[k]
+    return 0
+
+
+def _data(res: Any) -> List[Dict[str, Any]]:
+    if isinstance(res, dict):
+        if res.get("error"):
+            raise RuntimeError(res.get("error"))
+        return res.get("data") or []
+    return getattr(res, "data", None) or []
+
+
+def pending_bounds(cleaned_table: str, upload_id: Optional[int]) -> Optional[Dict[str, int]]:
+    """
+    Lowest and highest id of the upload's cleaned rows (None if it has none). Without an
+    upload_id, of all unprocessed rows. The range RPCs skip rows already processed.
+    """
+
+    def edge(desc: bool) -> Optional[int]:
+        q = sb.table(cleaned_table).select("id")
+        q = q.eq("upload_id", upload_id) if upload_id is not None else q.eq("processed", False)
+        rows = _data(q.order("id", desc=desc).limit(1).execute())
+        return rows[0]["id"] if rows else None
+
+    lo = edge(False)
+    if lo is None:
+        return None
+    return {"min_id": lo, "max_id": edge(True)}
+
+
+def _missing_function(e: Exception) -> bool:
+    text = str(e)
+    return "PGRST202" in text or "Could not find the function" in text or getattr(e, "code", None) == "PGRST202"
+
+
+def _prune_progress(now: float) -> None:
+    # caller holds _progress_lock
+    for key in [k for k, e in PROGRESS.items() if e.get("finished_at") and now - e["finished_at"] > PROMOTION_PROGRESS_TTL]:
+        del PROGRESS[key]
+    while len(PROGRESS) > max(1, PROMOTION_PROGRESS_MAX):
+        PROGRESS.popitem(last=False)
+
+
+def _record(key: str, **fields: Any) -> Dict[str, Any]:
+    now = time.time()
+    with _progress_lock:
+        entry = PROGRESS.setdefault(key, {})
+        entry.update(fields)
+        if fields.get("status") in ("done", "failed"):
+            entry["finished_at"] = now
+        PROGRESS.move_to_end(key)
+        _prune_progress(now)
+        return dict(entry)
+
+
+def progress() -> Dict[str, Dict[str, Any]]:
+    """Copy of the running and recent promotions (for /api/promotion)."""
+    with _progress_lock:
+        _prune_progress(time.time())
+        return {k: dict(e) for k, e in PROGRESS.items()}
+
+
+def promote(rpc_name: str, cleaned_table: str, upload_id: Optional[int] = None,
+            chunk_rows: int = PROMOTION_CHUNK_ROWS,
+            on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Promote the unprocessed rows of `cleaned_table` (one upload, or all when upload_id
+    is None) in id-range chunks. Returns {"promoted", "chunks", "mode", "seconds"}.
+    """
+    key = f"{rpc_name}:{upload_id}"
+    t0 = time.perf_counter()
+    with _progress_lock:
+        PROGRESS.pop(key, None)
+    _record(key, rpc=rpc_name, upload_id=upload_id, status="running", promoted=0, chunks_done=0)
+
+    def report(**fields: Any) -> None:
+        snapshot = _record(key, seconds=round(time.perf_counter() - t0, 3), **fields)
+        if on_progress:
+            on_progress(snapshot)
+
+    def single() -> Dict[str, Any]:
+        n = parse_rpc_count(sb.rpc(rpc_name, {"p_upload_id": upload_id}).execute())
+        report(status="done", mode="single", promoted=n, chunks_done=1, chunks=1)
+        return {"promoted": n, "chunks": 1, "mode": "single", "seconds": round(time.perf_counter() - t0, 3)}
+
+    try:
+        bounds = pending_bounds(cleaned_table, upload_id)
+        if bounds is None:
+            return single()
+        chunk_rows = max(1, int(chunk_rows))
+        starts = list(range(bounds["min_id"], bounds["max_id"] + 1, chunk_rows))
+        report(mode="range", chunks=len(starts), **bounds)
+        total = 0
+        for n, lo in enumerate(starts):
+            hi = min(lo + chunk_rows - 1, bounds["max_id"])
+            try:
+                res = sb.rpc(f"{rpc_name}_range", {"p_upload_id": upload_id, "p_min_id": lo, "p_max_id": hi}).execute()
+            except Exception as e:
+                if n == 0 and _missing_function(e):
+                    return single()
+                raise
+            total += parse_rpc_count(res)
+            report(promoted=total, chunks_done=n + 1, last_id=hi)
+        report(status="done")
+        return {"promoted": total, "chunks": len(starts), "mode": "range", "seconds": round(time.perf_counter() - t0, 3)}
+    except Exception as e:
+        report(status="failed", error=str(e))
+        raise
+
+
+def promote_many(jobs: List[Dict[str, Any]], workers: int = PROMOTION_WORKERS,
+                 chunk_rows: int = PROMOTION_CHUNK_ROWS) -> Dict[str, Dict[str, Any]]:
+    """
+    jobs: [{"rpc": ..., "cleaned_table": ..., "dim_table": ..., "upload_id": ...}, ...].
+    Jobs on different dim tables run in parallel; each job's result (or {"error": ...})
+    is returned under "<rpc>:<upload_id>".
+    """
+    lanes: Dict[str, List[Dict[str, Any]]] = {}
+    for job in jobs:
+        lanes.setdefault(job.get("dim_table") or job["rpc"], []).append(job)
+
+    results: Dict[str, Dict[str, Any]] = {}
+
+    def run_lane(lane: List[Dict[str, Any]]) -> None:
+        for job in lane:
+            key = f"{job['rpc']}:{job.get('upload_id')}"
+            try:
+                results[key] = promote(job["rpc"], job["cleaned_table"], job.get("upload_id"), chunk_rows)
+            except Exception as e:
+                results[key] = {"error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="promote") as pool:
+        list(pool.map(run_lane, lanes.values()))
+    return results
@@ -0,0 +1,323 @@
+# backend/app/readers.py
+"""
+Streaming readers for non-CSV upload formats.
+
+XLSX: workbooks are opened with openpyxl in read-only mode, which parses the sheet
+XML as it is iterated instead of building the workbook object model, so memory
+stays bounded by one row.
+
+Parquet: read one row group at a time. Arrow IPC (file or stream format): read one
+record batch at a time, memory-mapped. NDJSON: one JSON object per line.
+
+Values keep their types (numbers, booleans) instead of going through CSV text;
+dates/times become ISO strings and NaN becomes None so rows can be staged as JSON.
+For the ETL clean_file paths, read_frame() returns a typed DataFrame; iter_frames()
+yields the same frame in batches of at most FRAME_BATCH_ROWS rows (Parquet via
+iter_batches, Arrow per record batch, NDJSON in line chunks), so /api/process and
+the fused upload never hold a whole columnar file in memory. iter_etl_frames() is
+the same for an ETL module's own read_frame() (its iter_frames()).
+
+openpyxl and pyarrow are optional and imported on first use (together they add
+~0.3s to process start); reading a format without its package raises a RuntimeError.
+"""
+from __future__ import annotations
+import importlib
+import json
+import math
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, TextIO, Union
+
+# set by _require_openpyxl() / _require_pyarrow()
+openpyxl = None
+pyarrow = None
+
+XLSX_EXTENSIONS = (".xlsx", ".xlsm")
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc", ".arrows")
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+
+# formats iter_frames() reads in batches (xlsx is read whole, as read_xlsx_frame)
+BATCHED_FORMATS = ("parquet", "arrow", "ndjson")
+FRAME_BATCH_ROWS = int(os.getenv("FRAME_BATCH_ROWS", "50000"))
+
+PARQUET_MAGIC = b"PAR1"
+ARROW_FILE_MAGIC = b"ARROW1"
+
+
+def detect_format(filename: str, head: bytes = b"") -> Optional[str]:
+    """Return "xlsx", "parquet", "arrow", "ndjson" or None (CSV/DOCX/other) from the name or magic bytes."""
+    name = (filename or "").lower()
+    if name.endswith(XLSX_EXTENSIONS):
+        return "xlsx"
+    if name.endswith(PARQUET_EXTENSIONS) or head.startswith(PARQUET_MAGIC):
+        return "parquet"
+    if name.endswith(ARROW_EXTENSIONS) or head.startswith(ARROW_FILE_MAGIC):
+        return "arrow"
+    if name.endswith(NDJSON_EXTENSIONS):
+        return "ndjson"
+    return None
+
+
+def _require_pyarrow(fmt: str) -> None:
+    global pyarrow
+    if pyarrow is None:
+        try:
+            for sub in ("pyarrow.ipc", "pyarrow.parquet"):
+                importlib.import_module(sub)
+            pyarrow = importlib.import_module("pyarrow")
+        except Exception:
+            raise RuntimeError(f"{fmt} uploads require pyarrow (pip install pyarrow).")
+
+
+def _require_openpyxl() -> None:
+    global openpyxl
+    if openpyxl is None:
+        try:
+            openpyxl = importlib.import_module("openpyxl")
+        except Exception:
+            raise RuntimeError("XLSX uploads require openpyxl (pip install openpyxl).")
+
+
+def _cell_value(v: Any) -> Any:
+    if isinstance(v, (datetime, date, time)):
+        return v.isoformat()
+    if isinstance(v, str):
+        v = v.strip()
+        return v or None
+    if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
+        return None
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (bytes, bytearray)):
+        return v.hex()
+    return v
+
+
+def _json_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {str(k): _cell_value(v) for k, v in row.items()}
+
+
+def _pick_sheet(wb, sheet: Optional[Union[str, int]]):
+    """None -> first worksheet; an int or digit string -> 0-based index; otherwise a sheet name."""
+    if sheet is None or sheet == "":
+        return wb.worksheets[0]
+    if isinstance(sheet, int) or str(sheet).isdigit():
+        idx = int(sheet)
+        if idx >= len(wb.worksheets):
+            raise ValueError(f"Sheet index {idx} out of range; workbook has {len(wb.worksheets)} sheet(s).")
+        return wb.worksheets[idx]
+    if sheet not in wb.sheetnames:
+        raise ValueError(f"Sheet {sheet!r} not found; available: {wb.sheetnames}")
+    return wb[sheet]
+
+
+def xlsx_sheet_names(path: Union[str, Path]) -> List[str]:
+    _require_openpyxl()
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def iter_xlsx_rows(path: Union[str, Path], sheet: Optional[Union[str, int]] = None) -> Iterator[List[Any]]:
+    """Yield the rows of one sheet as lists of cell values, skipping completely-empty rows."""
+    _require_openpyxl()
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = _pick_sheet(wb, sheet)
+        for values in ws.iter_rows(values_only=True):
+            row = [_cell_value(v) for v in values]
+            # read-only sheets pad rows to the sheet's max column; drop the trailing empties
+            while row and row[-1] is None:
+                row.pop()
+            if row:
+                yield row
+    finally:
+        wb.close()
+
+
+def iter_xlsx_dicts(path: Union[str, Path], sheet: Optional[Union[str, int]] = None) -> Iterator[Dict[str, Any]]:
+    """Yield one dict per data row, keyed by the first non-empty row (the header)."""
+    rows = iter_xlsx_rows(path, sheet)
+    header_row = next(rows, None)
+    if header_row is None:
+        return
+    header = [str(h).strip() if h is not None else f"column_{i + 1}" for i, h in enumerate(header_row)]
+    width = len(header)
+    for row in rows:
+        if len(row) < width:
+            row = row + [None] * (width - len(row))
+        yield {header[i]: row[i] for i in range(width)}
+
+
+def read_xlsx_frame(path: Union[str, Path], sheet: Optional[Union[str, int]] = None):
+    """DataFrame of one sheet (header from the first non-empty row) for the ETL clean_file paths."""
+    import pandas as pd
+
+    rows = iter_xlsx_rows(path, sheet)
+    header_row = next(rows, None)
+    if header_row is None:
+        return pd.DataFrame()
+    header = [str(h).strip() if h is not None else f"column_{i + 1}" for i, h in enumerate(header_row)]
+    width = len(header)
+    records = ((r + [None] * (width - len(r)))[:width] for r in rows)
+    return pd.DataFrame.from_records(records, columns=header)
+
+
+# -----------------------
+# Parquet / Arrow IPC / NDJSON
+# -----------------------
+def _parquet_file(source):
+    if isinstance(source, (str, Path)):
+        return pyarrow.parquet.ParquetFile(str(source), memory_map=True)
+    return pyarrow.parquet.ParquetFile(source)  # seekable file object
+
+
+def iter_parquet_dicts(path: Union[str, Path, BinaryIO]) -> Iterator[Dict[str, Any]]:
+    """Yield rows of a Parquet file, decoding one row group at a time."""
+    _require_pyarrow("Parquet")
+    pf = _parquet_file(path)
+    for i in range(pf.num_row_groups):
+        table = pf.read_row_group(i)
+        for batch in table.to_batches():
+            for row in batch.to_pylist():
+                yield _json_row(row)
+        del table
+
+
+def _open_arrow(source):
+    """Arrow IPC file format first (random access), then the streaming format."""
+    try:
+        return pyarrow.ipc.open_file(source)
+    except pyarrow.ArrowInvalid:
+        source.seek(0)
+        return pyarrow.ipc.open_stream(source)
+
+
+def iter_arrow_dicts(path: Union[str, Path, BinaryIO]) -> Iterator[Dict[str, Any]]:
+    """Yield rows of an Arrow IPC file/stream, one record batch at a time (memory-mapped for paths)."""
+    _require_pyarrow("Arrow")
+    if isinstance(path, (str, Path)):
+        source = pyarrow.memory_map(str(path), "r")
+    else:
+        source = pyarrow.PythonFile(path, mode="r")
+    with source:
+        reader = _open_arrow(source)
+        if isinstance(reader, pyarrow.ipc.RecordBatchFileReader):
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        else:
+            batches = iter(reader)
+        for batch in batches:
+            for row in batch.to_pylist():
+                yield _json_row(row)
+
+
+def iter_ndjson_lines(text: TextIO) -> Iterator[Dict[str, Any]]:
+    """Yield one dict per non-empty line of newline-delimited JSON text; non-object lines are skipped."""
+    for n, line in enumerate(text, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid JSON on line {n}: {e}")
+        if isinstance(obj, dict):
+            yield _json_row(obj)
+
+
+def iter_ndjson_dicts(path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as fh:
+        yield from iter_ndjson_lines(fh)
+
+
+def iter_records(path: Union[str, Path], fmt: str, sheet: Optional[Union[str, int]] = None) -> Iterator[Dict[str, Any]]:
+    """Rows of a file in one of the detect_format() formats, as JSON-safe dicts."""
+    if fmt == "xlsx":
+        return iter_xlsx_dicts(path, sheet)
+    if fmt == "parquet":
+        return iter_parquet_dicts(path)
+    if fmt == "arrow":
+        return iter_arrow_dicts(path)
+    if fmt == "ndjson":
+        return iter_ndjson_dicts(path)
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+def iter_frames(path: Union[str, Path], fmt: Optional[str] = None, sheet: Optional[Union[str, int]] = None,
+                batch_rows: Optional[int] = None) -> Iterator[Any]:
+    """Typed DataFrames of at most batch_rows rows each (one frame for xlsx)."""
+    import pandas as pd
+
+    fmt = fmt or detect_format(str(path))
+    batch_rows = batch_rows or FRAME_BATCH_ROWS
+    if fmt == "xlsx":
+        yield read_xlsx_frame(path, sheet)
+    elif fmt == "parquet":
+        _require_pyarrow("Parquet")
+        pf = pyarrow.parquet.ParquetFile(str(path), memory_map=True)
+        for batch in pf.iter_batches(batch_size=batch_rows):
+            yield batch.to_pandas()
+    elif fmt == "arrow":
+        _require_pyarrow("Arrow")
+        with pyarrow.memory_map(str(path), "r") as source:
+            reader = _open_arrow(source)
+            if isinstance(reader, pyarrow.ipc.RecordBatchFileReader):
+                batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            else:
+                batches = iter(reader)
+            for batch in batches:
+                for start in range(0, batch.num_rows, batch_rows):
+                    yield batch.slice(start, batch_rows).to_pandas()
+    elif fmt == "ndjson":
+        with pd.read_json(path, lines=True, dtype=False, chunksize=batch_rows) as chunks:
+            for frame in chunks:
+                yield frame.reset_index(drop=True)
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def iter_etl_frames(path: Union[str, Path], read_frame: Callable[..., Any], sheet: Optional[Union[str, int]] = None,
+                    convert: Optional[Callable[[Any], Any]] = None) -> Iterator[Any]:
+    """
+    An ETL module's read_frame() in row batches: parquet / arrow / ndjson come from
+    iter_frames() (passed through `convert`, if given) and are never loaded whole;
+    anything else is read_frame(path, sheet=sheet) as one frame.
+    """
+    fmt = detect_format(str(path))
+    if fmt in BATCHED_FORMATS:
+        for frame in iter_frames(path, fmt):
+            yield convert(frame) if convert else frame
+    else:
+        yield read_frame(str(path), sheet=sheet)
+
+
+def read_frame(path: Union[str, Path], fmt: Optional[str] = None, sheet: Optional[Union[str, int]] = None):
+    """Typed DataFrame for the ETL clean_file paths (no CSV round-trip, no type re-inference)."""
+    import pandas as pd
+
+    frames = list(iter_frames(path, fmt, sheet))
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+# Quick local check:
+#   python -m backend.app.readers feed.xlsx [sheet]
+#   python -m backend.app.readers feed.parquet
+if __name__ == "__main__":
+    import sys
+
+    p = sys.argv[1]
+    fmt = detect_format(p)
+    if fmt == "xlsx":
+        print("sheets:", xlsx_sheet_names(p))
+    n = 0
+    for n, r in enumerate(iter_records(p, fmt, sys.argv[2] if len(sys.argv) > 2 else None), 1):
+        if n <= 3:
+            print(r)
+    print(f"{n} rows")
@@ -0,0 +1,233 @@
+# backend/app/schemas.py
+"""
+Declarative typed schemas for the cleaned datasets.
+
+Each dataset has one schema: canonical column -> Column(dtype, nullable). coerce_frame()
+converts whole DataFrame columns at once, so the cleaners and the process_*_upload
+runtimes share the same rules and null handling:
+
+  string   pandas "string" dtype, stripped; "", "nan", "none", "null" -> NA
+  int      nullable Int64; non-integral numbers count as errors
+  decimal  nullable Float64 rounded to `scale`; "$1,200.50" / "1 200,50" style noise stripped
+  date     ISO "YYYY-MM-DD" strings (dates.parse_dates: cached dominant format + residue fallback)
+  bool     nullable boolean from true/false/yes/no/1/0
+
+Values that are present but cannot be coerced become NA and are counted per column.
+Non-nullable columns left empty are counted separately. The counts travel with the
+frame in df.attrs["coercion_errors"] (read them with coercion_errors(df)), e.g.
+{"saleamount": {"invalid": 3}, "transactionid": {"missing": 1}}, so concurrent
+cleaners never see each other's counts.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from . import dates
+
+ERRORS_ATTR = "coercion_errors"
+
+NULL_TOKENS = {"", "nan", "none", "null", "nat", "n/a", "na"}
+_TRUE = {"true", "t", "yes", "y", "1"}
+_FALSE = {"false", "f", "no", "n", "0"}
+
+
+@dataclass(frozen=True)
+class Column:
+    dtype: str = "string"
+    nullable: bool = True
+    scale: int = 2  # decimal places kept for "decimal"
+
+
+SCHEMAS: Dict[str, Dict[str, Column]] = {
+    "airlines": {
+        "airlinekey": Column("string", nullable=False),
+        "airlinename": Column("string"),
+        "alliance": Column("string"),
+    },
+    "airports": {
+        "airportkey": Column("string", nullable=False),
+        "airportname": Column("string"),
+        "city": Column("string"),
+        "country": Column("string"),
+    },
+    "flights": {
+        "flightkey": Column("string", nullable=False),
+        "originairportkey": Column("string"),
+        "destinationairportkey": Column("string"),
+        "aircrafttype": Column("string"),
+    },
+    "passengers": {
+        "passenger_id": Column("string", nullable=False),
+        "name": Column("string"),
+        "email": Column("string"),
+        "age": Column("int"),
+    },
+    "travelagency": {
+        "transactionid": Column("string", nullable=False),
+        "agencykey": Column("string"),
+        "agencyname": Column("string"),
+        "passengername": Column("string"),
+        "flightnumber": Column("string"),
+        "saleamount": Column("decimal"),
+        "currency": Column("string"),
+        "saledate": Column("date"),
+    },
+    "corporatesales": {
+        "invoice": Column("string"),
+        "transactionid": Column("string"),
+        "corporate_id": Column("string"),
+        "corporate_name": Column("string"),
+        "item": Column("string"),
+        "qty": Column("int"),
+        "unitprice": Column("decimal"),
+        "total": Column("decimal"),
+        "saleamount": Column("decimal"),
+        "currency": Column("string"),
+        "saledate": Column("date"),
+    },
+}
+
+
+def _null_mask(s: pd.Series) -> pd.Series:
+    """True where the value is missing or a null token."""
+    text = s.astype("string").str.strip().str.lower()
+    return s.isna() | text.isin(NULL_TOKENS).fillna(False)
+
+
+def _to_string(s: pd.Series) -> pd.Series:
+    out = s.astype("string").str.strip()
+    return out.mask(out.str.lower().isin(NULL_TOKENS).fillna(False))
+
+
+def _numeric_text(s: pd.Series) -> pd.Series:
+    """Strip currency symbols, spaces and thousands separators before to_numeric."""
+    text = s.astype("string").str.strip()
+    text = text.str.replace(r"[^\d,.\-eE+]", "", regex=True)
+    # "1.234,50" / "1 234,50": comma is the decimal separator when it comes last
+    comma_decimal = text.str.contains(r",\d{1,2}$", regex=True).fillna(False) & ~text.str.contains(r"\.\d{1,2}$", regex=True).fillna(False)
+    text = text.where(~comma_decimal, text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    return text.str.replace(",", "", regex=False)
+
+
+def _to_number(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return pd.to_numeric(s, errors="coerce").astype("Float64")
+    return pd.to_numeric(_numeric_text(s), errors="coerce").astype("Float64")
+
+
+def _to_int(s: pd.Series) -> pd.Series:
+    num = _to_number(s)
+    integral = num.isna() | (num % 1 == 0)
+    return num.where(integral).astype("Int64")
+
+
+def _to_decimal(s: pd.Series, scale: int) -> pd.Series:
+    return _to_number(s).round(scale)
+
+
+def _to_bool(s: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(s):
+        return s.astype("boolean")
+    text = s.astype("string").str.strip().str.lower()
+    out = pd.Series(pd.NA, index=s.index, dtype="boolean")
+    out[text.isin(_TRUE).fillna(False)] = True
+    out[text.isin(_FALSE).fillna(False)] = False
+    return out
+
+
+def _to_date(s: pd.Series, source: Optional[str] = None, columns: Optional[List[str]] = None) -> pd.Series:
+    parsed = dates.parse_dates(s, source=source, columns=columns)
+    return parsed.dt.strftime("%Y-%m-%d").astype("string")
+
+
+def coerce_series(s: pd.Series, col: Column, source: Optional[str] = None, columns: Optional[List[str]] = None) -> pd.Series:
+    if col.dtype == "int":
+        return _to_int(s)
+    if col.dtype == "decimal":
+        return _to_decimal(s, col.scale)
+    if col.dtype == "float":
+        return _to_number(s)
+    if col.dtype == "date":
+        return _to_date(s, source, columns)
+    if col.dtype == "bool":
+        return _to_bool(s)
+    return _to_string(s)
+
+
+def coerce_frame(df: pd.DataFrame, dataset: str, source: Optional[str] = None) -> pd.DataFrame:
+    """
+    Coerce the schema columns present in `df` (in place) and return it. Columns not in
+    the schema are left alone. `source` identifies the feed (e.g. the filename) for
+    format caches. Per-column error counts go to df.attrs["coercion_errors"].
+    """
+    schema = SCHEMAS.get(dataset, {})
+    header = [str(c) for c in df.columns]
+    errors: Dict[str, Dict[str, int]] = {}
+    for name, col in schema.items():
+        if name not in df.columns:
+            continue
+        original = df[name]
+        present = ~_null_mask(original)
+        coerced = coerce_series(original, col, source, header)
+        invalid = int((present & coerced.isna()).sum())
+        counts: Dict[str, int] = {}
+        if invalid:
+            counts["invalid"] = invalid
+        if not col.nullable:
+            missing = int((~present).sum())
+            if missing:
+                counts["missing"] = missing
+        if counts:
+            errors[name] = counts
+        df[name] = coerced
+    df.attrs[ERRORS_ATTR] = errors
+    return df
+
+
+def coercion_errors(df: pd.DataFrame) -> Dict[str, Dict[str, int]]:
+    """Per-column error counts of the last coerce_frame() on `df` ({} if none)."""
+    return df.attrs.get(ERRORS_ATTR) or {}
+
+
+def merge_errors(into: Dict[str, Dict[str, int]], counts: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, int]]:
+    """Add per-column counts (e.g. of one batch) into a running total; returns `into`."""
+    for col, kinds in counts.items():
+        total = into.setdefault(col, {})
+        for kind, n in kinds.items():
+            total[kind] = total.get(kind, 0) + n
+    return into
+
+
+def column_lists(df: pd.DataFrame) -> Dict[str, List[Any]]:
+    """Each column as a list of plain Python values (NA/NaN -> None, Int64 -> int)."""
+    return {str(c): df[c].to_numpy(dtype=object, na_value=None).tolist() for c in df.columns}
+
+
+def to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """DataFrame -> list of dicts with plain Python values, built column-wise (no per-cell boxing)."""
+    cols = column_lists(df)
+    names = list(cols)
+    return [dict(zip(names, values)) for values in zip(*cols.values())]
+
+
+def coerce_records(rows: List[Dict[str, Any]], dataset: str, source: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Coerce a batch of row dicts column-wise (for the process_*_upload runtimes)."""
+    if not rows:
+        return []
+    df = pd.DataFrame.from_records(rows)
+    return to_records(coerce_frame(df, dataset, source))
+
+
+# Quick local check:
+#   python -m backend.app.schemas travelagency feed.csv
+if __name__ == "__main__":
+    import sys
+
+    frame = pd.read_csv(sys.argv[2], dtype=str, keep_default_na=False)
+    frame.columns = frame.columns.str.strip().str.lower()
+    coerce_frame(frame, sys.argv[1], source=sys.argv[2])
+    print(frame.dtypes)
+    print(frame.head())
+    print("errors:", coercion_errors(frame))
@@ -0,0 +1,313 @@
+# backend/app/services/fake_supabase.py
+"""
+In-process stand-in for the subset of the supabase-py client used by this backend.
+
+Covers:
+  - sb.table(name).insert/upsert/select/update/delete(...) with
+    eq/neq/gt/gte/lt/lte/in_/is_/order/limit/range filters and .execute()
+  - sb.rpc(name, params).execute()  (process_cleaned_* return a row count)
+  - sb.storage.from_(bucket).upload(path, data, options)
+
+Rows live in plain Python lists guarded by a lock, so the fake is safe to share
+between the FastAPI event loop and worker threads. Every .execute() can sleep for
+an injected latency and fail with an injected error rate, which is what the load
+test harness (backend/loadtest.py) uses to model a slow or flaky PostgREST.
+"""
+from __future__ import annotations
+import copy
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class FakeAPIError(Exception):
+    """Raised for injected failures; mirrors postgrest's APIError (code + message)."""
+
+    def __init__(self, message: str, code: str = "503"):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class FakeResponse:
+    def __init__(self, data: Any = None, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+        self.error = None
+
+
+class _FakeQuery:
+    def __init__(self, client: "FakeSupabase", table: str):
+        self._client = client
+        self._table = table
+        self._op = "select"
+        self._payload: Any = None
+        self._on_conflict: Optional[str] = None
+        self._ignore_duplicates = False
+        self._filters: List[tuple] = []
+        self._order: List[tuple] = []
+        self._limit: Optional[int] = None
+        self._offset = 0
+        self._count: Optional[str] = None
+
+    # ---- operations ----
+    def select(self, columns: str = "*", count: Optional[str] = None):
+        self._op = "select"
+        self._count = count
+        return self
+
+    def insert(self, data: Any, **kwargs):
+        self._op = "insert"
+        self._payload = data
+        return self
+
+    def upsert(self, data: Any, on_conflict: Optional[str] = None, ignore_duplicates: bool = False, **kwargs):
+        self._op = "upsert"
+        self._payload = data
+        self._on_conflict = on_conflict
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, data: Dict[str, Any], **kwargs):
+        self._op = "update"
+        self._payload = data
+        return self
+
+    def delete(self, **kwargs):
+        self._op = "delete"
+        return self
+
+    # ---- filters ----
+    def eq(self, col, val):
+        self._filters.append((col, lambda v, x=val: v == x))
+        return self
+
+    def neq(self, col, val):
+        self._filters.append((col, lambda v, x=val: v != x))
+        return self
+
+    def gt(self, col, val):
+        self._filters.append((col, lambda v, x=val: v is not None and v > x))
+        return self
+
+    def gte(self, col, val):
+        self._filters.append((col, lambda v, x=val: v is not None and v >= x))
+        return self
+
+    def lt(self, col, val):
+        self._filters.append((col, lambda v, x=val: v is not None and v < x))
+        return self
+
+    def lte(self, col, val):
+        self._filters.append((col, lambda v, x=val: v is not None and v <= x))
+        return self
+
+    def in_(self, col, values):
+        vals = list(values)
+        self._filters.append((col, lambda v, x=vals: v in x))
+        return self
+
+    def is_(self, col, val):
+        target = None if val in (None, "null") else val
+        self._filters.append((col, lambda v, x=target: v is x or v == x))
+        return self
+
+    def order(self, col, desc: bool = False, **kwargs):
+        self._order.append((col, desc))
+        return self
+
+    def limit(self, n: int, **kwargs):
+        self._limit = int(n)
+        return self
+
+    def range(self, start: int, end: int, **kwargs):
+        self._offset = int(start)
+        self._limit = int(end) - int(start) + 1
+        return self
+
+    # ---- execution ----
+    def _matches(self, row: Dict[str, Any]) -> bool:
+        return all(pred(row.get(col)) for col, pred in self._filters)
+
+    def execute(self) -> FakeResponse:
+        self._client._before_call(f"{self._op}:{self._table}")
+        with self._client._lock:
+            rows = self._client._tables.setdefault(self._table, [])
+            if self._op in ("insert", "upsert"):
+                return FakeResponse(self._client._write(self._table, rows, self._payload, self._op,
+                                                        self._on_conflict, self._ignore_duplicates))
+            if self._op == "update":
+                hit = [r for r in rows if self._matches(r)]
+                for r in hit:
+                    r.update(copy.deepcopy(self._payload))
+                return FakeResponse([dict(r) for r in hit])
+            if self._op == "delete":
+                hit = [r for r in rows if self._matches(r)]
+                self._client._tables[self._table] = [r for r in rows if not self._matches(r)]
+                return FakeResponse([dict(r) for r in hit])
+
+            hit = [r for r in rows if self._matches(r)]
+            for col, desc in reversed(self._order):
+                hit.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=desc)
+            total = len(hit)
+            end = None if self._limit is None else self._offset + self._limit
+            hit = hit[self._offset:end]
+            return FakeResponse([dict(r) for r in hit], count=total if self._count else None)
+
+
+class _FakeRpc:
+    def __init__(self, client: "FakeSupabase", name: str, params: Optional[Dict[str, Any]]):
+        self._client = client
+        self._name = name
+        self._params = params or {}
+
+    def execute(self) -> FakeResponse:
+        self._client._before_call(f"rpc:{self._name}", rpc=True)
+        handler = self._client.rpc_handlers.get(self._name)
+        with self._client._lock:
+            if handler is not None:
+                return FakeResponse(handler(self._client, self._params))
+            return FakeResponse(self._client._default_rpc(self._name, self._params))
+
+
+class _FakeBucket:
+    def __init__(self, client: "FakeSupabase", bucket: str):
+        self._client = client
+        self._bucket = bucket
+
+    def upload(self, path: str, data: bytes, file_options: Optional[Dict[str, Any]] = None):
+        self._client._before_call(f"storage:{self._bucket}")
+        with self._client._lock:
+            self._client.objects[(self._bucket, path)] = data.read() if hasattr(data, "read") else bytes(data)
+        return {"Key": f"{self._bucket}/{path}"}
+
+    def download(self, path: str) -> bytes:
+        self._client._before_call(f"storage:{self._bucket}")
+        with self._client._lock:
+            key = (self._bucket, path)
+            if key not in self._client.objects:
+                raise FakeAPIError(f"object not found: {self._bucket}/{path}", code="404")
+            return self._client.objects[key]
+
+    def remove(self, paths: List[str]):
+        self._client._before_call(f"storage:{self._bucket}")
+        with self._client._lock:
+            for p in paths:
+                self._client.objects.pop((self._bucket, p), None)
+        return [{"name": p} for p in paths]
+
+
+class _FakeStorage:
+    def __init__(self, client: "FakeSupabase"):
+        self._client = client
+
+    def from_(self, bucket: str) -> _FakeBucket:
+        return _FakeBucket(self._client, bucket)
+
+
+class FakeSupabase:
+    """
+    Minimal in-memory supabase client.
+
+    latency / rpc_latency: seconds slept before every table/storage call or rpc call.
+    jitter: extra uniform random latency (seconds) added on top.
+    error_rate: probability in [0, 1] that a call raises FakeAPIError(code=error_code).
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        rpc_latency: Optional[float] = None,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_code: str = "503",
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.rpc_latency = latency if rpc_latency is None else rpc_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self._rng = random.Random(seed)
+        self._lock = threading.RLock()
+        self._tables: Dict[str, List[Dict[str, Any]]] = {}
+        self._ids: Dict[str, int] = {}
+        self.objects: Dict[tuple, bytes] = {}
+        self.rpc_handlers: Dict[str, Any] = {}
+        self.calls: Dict[str, int] = {}
+        self.storage = _FakeStorage(self)
+
+    # ---- public client surface ----
+    def table(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self, name)
+
+    def from_(self, name: str) -> _FakeQuery:
+        return _FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> _FakeRpc:
+        return _FakeRpc(self, name, params)
+
+    # ---- inspection helpers ----
+    def rows(self, table: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(r) for r in self._tables.get(table, [])]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._tables.clear()
+            self._ids.clear()
+            self.objects.clear()
+            self.calls.clear()
+
+    # ---- internals ----
+    def _before_call(self, key: str, rpc: bool = False) -> None:
+        with self._lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+            fail = self.error_rate > 0 and self._rng.random() < self.error_rate
+            delay = (self.rpc_latency if rpc else self.latency) + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise FakeAPIError(f"injected failure on {key}", code=self.error_code)
+
+    def _next_id(self, table: str) -> int:
+        self._ids[table] = self._ids.get(table, 0) + 1
+        return self._ids[table]
+
+    def _write(self, table, rows, payload, op, on_conflict, ignore_duplicates):
+        records = payload if isinstance(payload, list) else [payload]
+        keys = [k.strip() for k in on_conflict.split(",")] if (op == "upsert" and on_conflict) else None
+        index = {}
+        if keys:
+            for r in rows:
+                index[tuple(r.get(k) for k in keys)] = r
+        out = []
+        for rec in records:
+            rec = copy.deepcopy(rec)
+            if keys:
+                existing = index.get(tuple(rec.get(k) for k in keys))
+                if existing is not None:
+                    if not ignore_duplicates:
+                        existing.update(rec)
+                        out.append(dict(existing))
+                    continue
+            rec.setdefault("id", self._next_id(table))
+            rows.append(rec)
+            if keys:
+                index[tuple(rec.get(k) for k in keys)] = rec
+            out.append(dict(rec))
+        return out
+
+    def _default_rpc(self, name: str, params: Dict[str, Any]):
+        # process_cleaned_<x>(p_upload_id) -> mark the upload's cleaned_<x> rows processed, return count
+        if name.startswith("process_cleaned_"):
+            table = "cleaned_" + name[len("process_cleaned_"):]
+            upload_id = params.get("p_upload_id")
+            n = 0
+            for r in self._tables.get(table, []):
+                if (upload_id is None or r.get("upload_id") == upload_id) and not r.get("processed"):
+                    r["processed"] = True
+                    n += 1
+            return [{name: n}]
+        return []
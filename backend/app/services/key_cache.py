@@ -0,0 +1,322 @@
+# backend/app/services/key_cache.py
+"""
+In-memory dimension key cache for referential checks during upload validation.
+
+Keys of dimairport / dimairline / dimflight are loaded in paginated bulk
+(id > last_id ORDER BY id LIMIT KEY_CACHE_PAGE_SIZE, selecting only id + key) into a
+compact structure per dimension:
+
+  SortedKeys   sorted list of keys, membership by bisect (exact)
+  BloomKeys    bit array + k hashes, used once a dimension has more than
+               KEY_CACHE_BLOOM_MIN keys (no false negatives, so an "absent"
+               answer is always a real orphan; a few orphans may slip through)
+
+refresh(dim) only reads rows with id above the last id seen, so calling it after each
+process_cleaned_* promotion is cheap. The cache is persisted to KEY_CACHE_PATH after
+every refresh and reloaded on start, so a restart only fetches what is new.
+
+The file records the backend it was built from (SUPABASE_URL, or the local warehouse
+path) and is ignored when that changes. Each refresh also reads the dim's first and
+last id: when the last id is below the one seen, or the first id moved (the table was
+truncated, rows deleted or ids restarted), that dimension is rebuilt from scratch.
+
+Keys are compared stripped and upper-cased.
+"""
+from __future__ import annotations
+import bisect
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+KEY_CACHE_ENABLED = os.getenv("KEY_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+KEY_CACHE_PATH = os.getenv("KEY_CACHE_PATH", os.path.join(tempfile.gettempdir(), "etl_key_cache.json"))
+KEY_CACHE_PAGE_SIZE = int(os.getenv("KEY_CACHE_PAGE_SIZE", "10000"))
+KEY_CACHE_BLOOM_MIN = int(os.getenv("KEY_CACHE_BLOOM_MIN", "2000000"))
+KEY_CACHE_BLOOM_FP_RATE = float(os.getenv("KEY_CACHE_BLOOM_FP_RATE", "0.001"))
+
+# dim table -> business key column
+DIM_KEYS = {
+    "dimairport": "airportkey",
+    "dimairline": "airlinekey",
+    "dimflight": "flightkey",
+}
+
+
+def normalize_key(v: Any) -> Optional[str]:
+    if v is None:
+        return None
+    s = str(v).strip().upper()
+    return s or None
+
+
+class SortedKeys:
+    kind = "sorted"
+
+    def __init__(self, keys: Iterable[str] = ()):
+        self.keys: List[str] = sorted(set(keys))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        i = bisect.bisect_left(self.keys, key)
+        return i < len(self.keys) and self.keys[i] == key
+
+    def add_many(self, keys: Iterable[str]) -> None:
+        new = sorted({k for k in keys if k not in self})
+        if not new:
+            return
+        if len(new) < 64:
+            for k in new:
+                bisect.insort(self.keys, k)
+        else:
+            self.keys = sorted(self.keys + new)  # timsort merges the two runs in linear time
+
+    def dump(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "keys": self.keys}
+
+
+class BloomKeys:
+    kind = "bloom"
+
+    def __init__(self, capacity: int, fp_rate: float = KEY_CACHE_BLOOM_FP_RATE):
+        import math
+
+        capacity = max(1, capacity)
+        self.m = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.k = max(1, int(round(self.m / capacity * math.log(2))))
+        self.bits = bytearray((self.m + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.m for i in range(self.k))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add_many(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            for p in self._positions(key):
+                self.bits[p >> 3] |= 1 << (p & 7)
+            self.count += 1
+
+    def dump(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "m": self.m, "k": self.k, "count": self.count, "bits": self.bits.hex()}
+
+    @classmethod
+    def load(cls, d: Dict[str, Any]) -> "BloomKeys":
+        b = cls.__new__(cls)
+        b.m, b.k, b.count, b.bits = d["m"], d["k"], d["count"], bytearray.fromhex(d["bits"])
+        return b
+
+
+def backend_identity() -> str:
+    """Which database the configured client talks to (cache files of another one are ignored)."""
+    from . import supabase_client
+
+    if supabase_client.SUPABASE_BACKEND == "local":
+        from .local_warehouse import LOCAL_WAREHOUSE_PATH
+
+        return "local:" + os.path.abspath(LOCAL_WAREHOUSE_PATH)
+    return "supabase:" + (supabase_client.SUPABASE_URL or "")
+
+
+class KeyCache:
+    def __init__(self, path: Optional[str] = KEY_CACHE_PATH, client=None, identity: Optional[str] = None):
+        self.path = path
+        self._client = client
+        # an injected client has no configured identity unless the caller names one
+        self.identity = identity if identity is not None or client is not None else backend_identity()
+        self._sets: Dict[str, Any] = {}
+        self._last_id: Dict[str, Any] = {}
+        self._first_id: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self._loaded_from_disk = False
+
+    def _sb(self):
+        if self._client is None:
+            from .supabase_client import sb
+
+            return sb
+        return self._client
+
+    # ---- persistence ----
+    def _load_disk(self) -> None:
+        self._loaded_from_disk = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            backend = (data.get("_meta") or {}).get("backend")
+            if backend != self.identity:
+                print(f"Warning: key cache file was built for {backend!r}, not {self.identity!r}; rebuilding")
+                return
+            for dim, entry in data.items():
+                if dim not in DIM_KEYS:
+                    continue
+                store = entry["store"]
+                self._sets[dim] = BloomKeys.load(store) if store["kind"] == "bloom" else SortedKeys(store["keys"])
+                self._last_id[dim] = entry.get("last_id")
+                self._first_id[dim] = entry.get("first_id")
+        except Exception as e:
+            print("Warning: could not read key cache file, rebuilding:", str(e))
+            self._sets, self._last_id, self._first_id = {}, {}, {}
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            data: Dict[str, Any] = {"_meta": {"backend": self.identity}}
+            data.update({dim: {"last_id": self._last_id.get(dim), "first_id": self._first_id.get(dim), "store": s.dump()}
+                         for dim, s in self._sets.items()})
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, self.path)
+
+    # ---- loading ----
+    def _edge_id(self, dim: str, desc: bool) -> Optional[int]:
+        res = self._sb().table(dim).select("id").order("id", desc=desc).limit(1).execute()
+        if isinstance(res, dict) and res.get("error"):
+            raise RuntimeError(res.get("error"))
+        rows = getattr(res, "data", None) or []
+        return rows[0]["id"] if rows else None
+
+    def _is_stale(self, dim: str) -> bool:
+        """True when the dim no longer holds the id range this cache was built from."""
+        last = self._last_id.get(dim)
+        if dim not in self._sets or last is None:
+            return False
+        max_id = self._edge_id(dim, desc=True)
+        if max_id is None or max_id < last:
+            return True
+        first = self._first_id.get(dim)
+        return first is not None and self._edge_id(dim, desc=False) != first
+
+    def _fetch_new(self, dim: str) -> List[str]:
+        key_col = DIM_KEYS[dim]
+        last = self._last_id.get(dim)
+        keys: List[str] = []
+        while True:
+            q = self._sb().table(dim).select(f"id,{key_col}")
+            if last is not None:
+                q = q.gt("id", last)
+            res = q.order("id").limit(KEY_CACHE_PAGE_SIZE).execute()
+            if isinstance(res, dict) and res.get("error"):
+                raise RuntimeError(res.get("error"))
+            rows = getattr(res, "data", None) or []
+            for r in rows:
+                k = normalize_key(r.get(key_col))
+                if k:
+                    keys.append(k)
+            if rows:
+                if self._first_id.get(dim) is None:
+                    self._first_id[dim] = rows[0]["id"]
+                last = rows[-1]["id"]
+            if len(rows) < KEY_CACHE_PAGE_SIZE:
+                break
+        self._last_id[dim] = last
+        return keys
+
+    def refresh(self, dim: str, persist: bool = True) -> int:
+        """Load keys added to `dim` since the last refresh. Returns the number of new keys."""
+        if dim not in DIM_KEYS:
+            return 0
+        with self._lock:
+            if not self._loaded_from_disk:
+                self._load_disk()
+            rebuilt = self._is_stale(dim)
+            if rebuilt:
+                print(f"Warning: {dim} ids no longer match the key cache (truncated or restarted); rebuilding")
+                self._sets.pop(dim, None)
+                self._last_id.pop(dim, None)
+                self._first_id.pop(dim, None)
+            new = self._fetch_new(dim)
+            store = self._sets.get(dim)
+            if store is None:
+                if len(new) >= KEY_CACHE_BLOOM_MIN:
+                    store = BloomKeys(len(new) * 2)
+                    store.add_many(new)
+                else:
+                    store = SortedKeys(new)
+                self._sets[dim] = store
+            elif new:
+                store.add_many(new)
+        if persist and (new or rebuilt):
+            self.save()
+        return len(new)
+
+    def ensure(self, dim: str) -> bool:
+        """Load `dim` on first use (disk + incremental fetch). False when it cannot be loaded."""
+        if dim in self._sets:
+            return True
+        try:
+            self.refresh(dim)
+        except Exception as e:
+            print(f"Warning: key cache for {dim} unavailable:", str(e))
+            return False
+        return dim in self._sets
+
+    def contains(self, dim: str, key: Any) -> Optional[bool]:
+        """True/False for a loaded dimension; None when the check cannot be made."""
+        k = normalize_key(key)
+        if k is None or not self.ensure(dim):
+            return None
+        return k in self._sets[dim]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {dim: {"kind": s.kind, "keys": len(s), "last_id": self._last_id.get(dim)} for dim, s in self._sets.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sets, self._last_id, self._first_id = {}, {}, {}
+            self._loaded_from_disk = True
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+_CACHE: Optional[KeyCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_key_cache() -> KeyCache:
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = KeyCache()
+    return _CACHE
+
+
+def refresh_after_promotion(dim_table: Optional[str]) -> None:
+    """Hook for the process endpoint: pick up keys a process_cleaned_* RPC just promoted."""
+    if not KEY_CACHE_ENABLED or dim_table not in DIM_KEYS:
+        return
+    try:
+        get_key_cache().refresh(dim_table)
+    except Exception as e:
+        print(f"Warning: key cache refresh for {dim_table} failed:", str(e))
+
+
+# Quick check against the configured client:
+#   python -m backend.app.services.key_cache
+if __name__ == "__main__":
+    import time
+
+    cache = get_key_cache()
+    for dim in DIM_KEYS:
+        t0 = time.perf_counter()
+        n = cache.refresh(dim)
+        print(f"{dim}: +{n} keys in {time.perf_counter() - t0:.2f}s")
+    print(cache.stats())
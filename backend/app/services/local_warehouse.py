@@ -0,0 +1,740 @@
+# backend/app/services/local_warehouse.py
+"""
+Embedded local warehouse (SQLite) exposing the same client surface as `sb`.
+
+Enable with SUPABASE_BACKEND=local (see supabase_client.py). The app then runs with
+no SUPABASE_URL at all: staging_raw, etl_runs, import_errors, cleaned_* and dim*
+tables live in one SQLite file (LOCAL_WAREHOUSE_PATH, default backend/local_warehouse.db)
+and the process_cleaned_* RPCs (plus the *_range variants used for chunked promotion,
+see promotion.py) are implemented locally:
+
+  1. staging_raw rows of the upload that never produced cleaned rows are
+     materialized into cleaned_* (same key aliases the ETL modules accept)
+  2. unprocessed cleaned rows are merged into the dim* table by business key
+     (entities without a dim table skip this step)
+  3. those cleaned rows are marked processed and the count is returned
+
+The staging lease RPCs of distributed workers (claim/complete/release_staging_chunks,
+extend_staging_leases; see etl/worker.py) are implemented as well.
+
+Inserts are bulk appends (multi-row INSERT ... RETURNING id in one transaction). Storage uploads are
+written under <warehouse dir>/storage/<bucket>/<path>.
+
+Rows are flagged with synced_at so a field site can push them to the hosted
+project later:
+    python -m backend.app.services.local_warehouse sync
+"""
+from __future__ import annotations
+import json
+import math
+import os
+import shutil
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..datasets import by_rpc
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+LOCAL_WAREHOUSE_PATH = os.getenv("LOCAL_WAREHOUSE_PATH", str(BACKEND_DIR / "local_warehouse.db"))
+# bound parameters per statement (SQLITE_MAX_VARIABLE_NUMBER is 32766 since SQLite 3.32)
+_MAX_SQL_VARIABLES = 32000
+
+# column kinds: INTEGER / REAL / TEXT are native; JSON is stored as TEXT, BOOL as INTEGER
+_TRACKING = [("upload_id", "INTEGER"), ("processed", "BOOL"), ("insertedat", "TEXT"),
+             ("error_count", "INTEGER"), ("last_error", "TEXT"), ("rawjson", "JSON"), ("synced_at", "TEXT"),
+             ("row_key", "TEXT")]
+
+SCHEMA: Dict[str, List[Tuple[str, str]]] = {
+    "etl_runs": [("jobname", "TEXT"), ("status", "TEXT"), ("note", "TEXT"), ("startedat", "TEXT"),
+                 ("finishedat", "TEXT")],
+    "staging_raw": [("entity", "TEXT"), ("raw", "JSON"), ("processed", "BOOL"), ("upload_id", "INTEGER"),
+                    ("original_filename", "TEXT"), ("file_pointer", "TEXT"), ("detected_entity", "TEXT"),
+                    ("notes", "JSON"), ("createdat", "TEXT"), ("synced_at", "TEXT"), ("row_key", "TEXT"),
+                    ("lease_owner", "TEXT"), ("lease_expires_at", "TEXT"), ("attempts", "INTEGER")],
+    "import_errors": [("sourcetable", "TEXT"), ("sourceid", "INTEGER"), ("raw", "JSON"), ("errormessage", "TEXT"),
+                      ("createdat", "TEXT"), ("upload_id", "INTEGER"), ("row_data", "JSON"), ("message", "TEXT")],
+    "cleaned_airlines": [("airlinekey", "TEXT"), ("airlinename", "TEXT"), ("alliance", "TEXT")] + _TRACKING,
+    "cleaned_airports": [("airportkey", "TEXT"), ("airportname", "TEXT"), ("city", "TEXT"), ("country", "TEXT")] + _TRACKING,
+    "cleaned_flights": [("flightkey", "TEXT"), ("originairportkey", "TEXT"), ("destinationairportkey", "TEXT"),
+                        ("aircrafttype", "TEXT")] + _TRACKING,
+    "cleaned_passengers": [("passengerkey", "TEXT"), ("fullname", "TEXT"), ("email", "TEXT"), ("loyaltystatus", "TEXT"),
+                           ("passenger_id", "TEXT"), ("name", "TEXT"), ("age", "INTEGER"),
+                           ("raw_upload_id", "INTEGER")] + _TRACKING,
+    "cleaned_travelagency": [("agencykey", "TEXT"), ("agencyname", "TEXT"), ("bookingid", "TEXT"),
+                             ("transactionid", "TEXT"), ("passengername", "TEXT"), ("flightnumber", "TEXT"),
+                             ("saleamount", "REAL"), ("currency", "TEXT"), ("saledate", "TEXT")] + _TRACKING,
+    "cleaned_corporatesales": [("invoice", "TEXT"), ("transactionid", "TEXT"), ("saleamount", "REAL"),
+                               ("currency", "TEXT"), ("saledate", "TEXT")] + _TRACKING,
+    "dimairline": [("airlinekey", "TEXT UNIQUE"), ("airlinename", "TEXT"), ("alliance", "TEXT"), ("createdat", "TEXT")],
+    "dimairport": [("airportkey", "TEXT UNIQUE"), ("airportname", "TEXT"), ("city", "TEXT"), ("country", "TEXT"),
+                   ("createdat", "TEXT")],
+    "dimflight": [("flightkey", "TEXT UNIQUE"), ("originairportkey", "TEXT"), ("destinationairportkey", "TEXT"),
+                  ("aircrafttype", "TEXT"), ("createdat", "TEXT")],
+    "dimpassenger": [("passengerkey", "TEXT UNIQUE"), ("fullname", "TEXT"), ("email", "TEXT"),
+                     ("loyaltystatus", "TEXT"), ("createdat", "TEXT")],
+}
+
+# process_cleaned_<x>: business key, {cleaned column: [raw json aliases]}. The cleaned and
+# dim tables come from datasets.DATASETS (dim None: the RPC only marks the rows processed).
+PROMOTIONS: Dict[str, Dict[str, Any]] = {
+    "process_cleaned_airlines": {
+        "key": "airlinekey",
+        "columns": {"airlinekey": ["airlinekey", "airline_key", "iata", "icao"],
+                    "airlinename": ["airlinename", "airline_name", "name"], "alliance": ["alliance"]},
+    },
+    "process_cleaned_airports": {
+        "key": "airportkey",
+        "columns": {"airportkey": ["airportkey"], "airportname": ["airportname", "airport_name", "name"],
+                    "city": ["city"], "country": ["country"]},
+    },
+    "process_cleaned_flights": {
+        "key": "flightkey",
+        "columns": {"flightkey": ["flightkey", "flight_number", "flight"],
+                    "originairportkey": ["originairportkey", "origin_airportkey", "origin"],
+                    "destinationairportkey": ["destinationairportkey", "destination_airportkey", "destination"],
+                    "aircrafttype": ["aircrafttype", "aircraft_type", "aircraft"]},
+    },
+    "process_cleaned_passengers": {
+        "key": "passengerkey",
+        # passengers_etl writes passenger_id/name; main.process_staged writes passengerkey/fullname
+        "cleaned_aliases": {"passengerkey": ["passenger_id"], "fullname": ["name"]},
+        "columns": {"passengerkey": ["passengerkey", "passenger_id", "id"], "fullname": ["fullname", "name"],
+                    "email": ["email"], "loyaltystatus": ["loyaltystatus", "loyalty_status"]},
+    },
+    "process_cleaned_travelagency": {
+        "key": "bookingid",
+        "columns": {"bookingid": ["bookingid", "booking_id", "transactionid", "transaction_id"],
+                    "agencykey": ["agencykey", "agency_id", "agency"], "agencyname": ["agencyname", "agency_name"],
+                    "passengername": ["passengername", "passenger_name"],
+                    "flightnumber": ["flightnumber", "flight_number"],
+                    "saleamount": ["saleamount", "sale_amount"], "currency": ["currency"],
+                    "saledate": ["saledate", "sale_date"]},
+    },
+    "process_cleaned_corporatesales": {
+        "key": "transactionid",
+        "columns": {"transactionid": ["transactionid", "transaction_id", "invoice"], "invoice": ["invoice", "invoiceid"],
+                    "saleamount": ["saleamount", "sale_amount", "total"], "currency": ["currency"],
+                    "saledate": ["saledate", "sale_date", "date"]},
+    },
+}
+for _rpc, _spec in PROMOTIONS.items():
+    _spec.update(cleaned=by_rpc(_rpc)["cleaned_table"], dim=by_rpc(_rpc)["dim_table"])
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _json_safe(v: Any) -> Any:
+    """NaN/inf (pandas empties) are not valid JSON; store them as null like PostgREST clients should."""
+    if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
+        return None
+    if isinstance(v, dict):
+        return {k: _json_safe(x) for k, x in v.items()}
+    if isinstance(v, list):
+        return [_json_safe(x) for x in v]
+    return v
+
+
+class LocalAPIError(Exception):
+    def __init__(self, message: str, code: str = "400"):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class LocalResponse:
+    def __init__(self, data: Any = None, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+        self.error = None
+
+
+class _LocalQuery:
+    def __init__(self, wh: "LocalWarehouse", table: str):
+        self._wh = wh
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._payload: Any = None
+        self._on_conflict: Optional[str] = None
+        self._ignore_duplicates = False
+        self._where: List[str] = []
+        self._params: List[Any] = []
+        self._order: List[str] = []
+        self._limit: Optional[int] = None
+        self._offset: Optional[int] = None
+        self._count: Optional[str] = None
+
+    def select(self, columns: str = "*", count: Optional[str] = None):
+        self._op, self._columns, self._count = "select", columns or "*", count
+        return self
+
+    def insert(self, data: Any, **kwargs):
+        self._op, self._payload = "insert", data
+        return self
+
+    def upsert(self, data: Any, on_conflict: Optional[str] = None, ignore_duplicates: bool = False, **kwargs):
+        self._op, self._payload = "upsert", data
+        self._on_conflict, self._ignore_duplicates = on_conflict, ignore_duplicates
+        return self
+
+    def update(self, data: Dict[str, Any], **kwargs):
+        self._op, self._payload = "update", data
+        return self
+
+    def delete(self, **kwargs):
+        self._op = "delete"
+        return self
+
+    def _filter(self, col: str, op: str, val: Any):
+        self._wh._ensure_columns(self._table, [col])
+        self._where.append(f'"{col}" {op} ?')
+        self._params.append(self._wh._encode_value(self._table, col, val))
+        return self
+
+    def eq(self, col, val):
+        if val is None:
+            return self.is_(col, None)
+        return self._filter(col, "=", val)
+
+    def neq(self, col, val):
+        return self._filter(col, "IS NOT", val)
+
+    def gt(self, col, val):
+        return self._filter(col, ">", val)
+
+    def gte(self, col, val):
+        return self._filter(col, ">=", val)
+
+    def lt(self, col, val):
+        return self._filter(col, "<", val)
+
+    def lte(self, col, val):
+        return self._filter(col, "<=", val)
+
+    def in_(self, col, values):
+        vals = list(values)
+        self._wh._ensure_columns(self._table, [col])
+        if not vals:
+            self._where.append("0")
+            return self
+        self._where.append(f'"{col}" IN ({", ".join("?" for _ in vals)})')
+        self._params.extend(self._wh._encode_value(self._table, col, v) for v in vals)
+        return self
+
+    def is_(self, col, val):
+        self._wh._ensure_columns(self._table, [col])
+        if val in (None, "null"):
+            self._where.append(f'"{col}" IS NULL')
+        else:
+            self._where.append(f'"{col}" IS ?')
+            self._params.append(self._wh._encode_value(self._table, col, val))
+        return self
+
+    def order(self, col, desc: bool = False, **kwargs):
+        self._wh._ensure_columns(self._table, [col])
+        self._order.append(f'"{col}" {"DESC" if desc else "ASC"}')
+        return self
+
+    def limit(self, n: int, **kwargs):
+        self._limit = int(n)
+        return self
+
+    def range(self, start: int, end: int, **kwargs):
+        self._offset = int(start)
+        self._limit = int(end) - int(start) + 1
+        return self
+
+    def _where_sql(self) -> str:
+        return (" WHERE " + " AND ".join(self._where)) if self._where else ""
+
+    def execute(self) -> LocalResponse:
+        wh = self._wh
+        with wh._lock:
+            wh._ensure_table(self._table)
+            if self._op == "insert":
+                return LocalResponse(wh._insert(self._table, self._payload))
+            if self._op == "upsert":
+                return LocalResponse(wh._upsert(self._table, self._payload, self._on_conflict, self._ignore_duplicates))
+            if self._op == "update":
+                payload = dict(self._payload)
+                wh._ensure_columns(self._table, payload.keys(), sample=payload)
+                sets = ", ".join(f'"{k}" = ?' for k in payload)
+                vals = [wh._encode_value(self._table, k, v) for k, v in payload.items()]
+                ids = [r[0] for r in wh._conn.execute(f'SELECT id FROM "{self._table}"{self._where_sql()}', self._params)]
+                with wh._conn:
+                    wh._conn.execute(f'UPDATE "{self._table}" SET {sets}{self._where_sql()}', vals + self._params)
+                return LocalResponse(wh._fetch_ids(self._table, ids))
+            if self._op == "delete":
+                rows = wh._select(self._table, "*", self._where_sql(), self._params, "", None, None)
+                with wh._conn:
+                    wh._conn.execute(f'DELETE FROM "{self._table}"{self._where_sql()}', self._params)
+                return LocalResponse(rows)
+
+            order = (" ORDER BY " + ", ".join(self._order)) if self._order else ""
+            rows = wh._select(self._table, self._columns, self._where_sql(), self._params, order, self._limit, self._offset)
+            count = None
+            if self._count:
+                count = wh._conn.execute(f'SELECT COUNT(*) FROM "{self._table}"{self._where_sql()}', self._params).fetchone()[0]
+            return LocalResponse(rows, count=count)
+
+
+class _LocalRpc:
+    def __init__(self, wh: "LocalWarehouse", name: str, params: Optional[Dict[str, Any]]):
+        self._wh = wh
+        self._name = name
+        self._params = params or {}
+
+    def execute(self) -> LocalResponse:
+        with self._wh._lock:
+            handler = self._wh.rpc_handlers.get(self._name)
+            if handler is None:
+                raise LocalAPIError(f"Could not find the function public.{self._name}", code="PGRST202")
+            return LocalResponse(handler(self._wh, **self._params))
+
+
+class _LocalBucket:
+    def __init__(self, wh: "LocalWarehouse", bucket: str):
+        self._root = wh.storage_dir / bucket
+
+    def _path(self, path: str) -> Path:
+        p = (self._root / path).resolve()
+        if self._root.resolve() not in p.parents:
+            raise LocalAPIError(f"invalid object path: {path}")
+        return p
+
+    def upload(self, path: str, data: Any, file_options: Optional[Dict[str, Any]] = None):
+        """`data` is bytes or a binary file object (copied in blocks, like the hosted client streams it)."""
+        p = self._path(path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        if hasattr(data, "read"):
+            tmp = p.with_name(p.name + ".part")
+            with open(tmp, "wb") as out:
+                shutil.copyfileobj(data, out, 1024 * 1024)
+            os.replace(tmp, p)
+        else:
+            p.write_bytes(bytes(data))
+        return {"Key": f"{self._root.name}/{path}"}
+
+    def download(self, path: str) -> bytes:
+        p = self._path(path)
+        if not p.exists():
+            raise LocalAPIError(f"object not found: {path}", code="404")
+        return p.read_bytes()
+
+    def remove(self, paths: List[str]):
+        for path in paths:
+            try:
+                self._path(path).unlink()
+            except FileNotFoundError:
+                pass
+        return [{"name": p} for p in paths]
+
+
+class _LocalStorage:
+    def __init__(self, wh: "LocalWarehouse"):
+        self._wh = wh
+
+    def from_(self, bucket: str) -> _LocalBucket:
+        return _LocalBucket(self._wh, bucket)
+
+
+class LocalWarehouse:
+    def __init__(self, path: str = LOCAL_WAREHOUSE_PATH):
+        self.path = path
+        self.storage_dir = Path(path).resolve().parent / "storage" if path != ":memory:" else Path("storage").resolve()
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._kinds: Dict[str, Dict[str, str]] = {}
+        self.rpc_handlers: Dict[str, Any] = {name: self._make_promotion(name) for name in PROMOTIONS}
+        self.rpc_handlers.update({f"{name}_range": self._make_range_promotion(name) for name in PROMOTIONS})
+        self.rpc_handlers.update({
+            "claim_staging_chunks": LocalWarehouse._claim_staging_chunks,
+            "complete_staging_chunks": LocalWarehouse._complete_staging_chunks,
+            "release_staging_chunks": LocalWarehouse._release_staging_chunks,
+            "extend_staging_leases": LocalWarehouse._extend_staging_leases,
+        })
+        self.storage = _LocalStorage(self)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS "_local_columns" (tbl TEXT, col TEXT, kind TEXT, PRIMARY KEY (tbl, col))'
+        )
+        for tbl, col, kind in self._conn.execute('SELECT tbl, col, kind FROM "_local_columns"'):
+            self._kinds.setdefault(tbl, {})[col] = kind
+        for table in SCHEMA:
+            self._ensure_table(table)
+            # columns added to SCHEMA after this warehouse file was created
+            for name, kind in SCHEMA[table]:
+                if name not in self._kinds.get(table, {}):
+                    with self._conn:
+                        self._conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{name}"')
+                        self._record_kind(table, name, kind.split()[0])
+            if any(n == "row_key" for n, _ in SCHEMA[table]):
+                # idempotent writes upsert on row_key (also for warehouses created before it existed)
+                self._ensure_columns(table, ["row_key"])
+                with self._conn:
+                    self._conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "ux_{table}_row_key" ON "{table}" (row_key)')
+
+    # ---- public client surface ----
+    def table(self, name: str) -> _LocalQuery:
+        return _LocalQuery(self, name)
+
+    def from_(self, name: str) -> _LocalQuery:
+        return _LocalQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> _LocalRpc:
+        return _LocalRpc(self, name, params)
+
+    # ---- schema ----
+    def _ensure_table(self, table: str) -> None:
+        if table in self._kinds and "id" in self._kinds[table]:
+            return
+        cols = SCHEMA.get(table, [])
+        defs = ['"id" INTEGER PRIMARY KEY AUTOINCREMENT']
+        for name, kind in cols:
+            base = kind.split()[0]
+            sql_type = {"JSON": "TEXT", "BOOL": "INTEGER"}.get(base, base)
+            defs.append(f'"{name}" {sql_type}{" UNIQUE" if "UNIQUE" in kind else ""}')
+        with self._conn:
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({", ".join(defs)})')
+            self._record_kind(table, "id", "INTEGER")
+            for name, kind in cols:
+                self._record_kind(table, name, kind.split()[0])
+            if any(n == "upload_id" for n, _ in cols):
+                self._conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{table}_upload_id" ON "{table}" (upload_id)')
+
+    def _record_kind(self, table: str, col: str, kind: str) -> None:
+        self._kinds.setdefault(table, {})[col] = kind
+        self._conn.execute('INSERT OR IGNORE INTO "_local_columns" (tbl, col, kind) VALUES (?, ?, ?)', (table, col, kind))
+
+    def _ensure_columns(self, table: str, cols, sample: Optional[Dict[str, Any]] = None) -> None:
+        """Unknown columns are added on the fly so local mode accepts whatever the ETL sends."""
+        self._ensure_table(table)
+        known = self._kinds.get(table, {})
+        for c in cols:
+            if c in known:
+                continue
+            v = (sample or {}).get(c)
+            kind = "JSON" if isinstance(v, (dict, list)) else "BOOL" if isinstance(v, bool) else "TEXT"
+            with self._conn:
+                self._conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{c}"')
+                self._record_kind(table, c, kind)
+
+    # ---- value coding ----
+    def _encode_value(self, table: str, col: str, v: Any) -> Any:
+        kind = self._kinds.get(table, {}).get(col)
+        if v is None:
+            return None
+        if kind == "JSON" or isinstance(v, (dict, list)):
+            return json.dumps(_json_safe(v), default=str)
+        if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
+            return None
+        if isinstance(v, bool):
+            return 1 if v else 0
+        if hasattr(v, "isoformat"):
+            return v.isoformat()
+        return v
+
+    def _decode_row(self, table: str, names: List[str], values) -> Dict[str, Any]:
+        kinds = self._kinds.get(table, {})
+        out = {}
+        for n, v in zip(names, values):
+            kind = kinds.get(n)
+            if v is not None and kind == "JSON":
+                try:
+                    v = json.loads(v)
+                except Exception:
+                    pass
+            elif v is not None and kind == "BOOL":
+                v = bool(v)
+            out[n] = v
+        return out
+
+    def _select(self, table, columns, where, params, order, limit, offset=None) -> List[Dict[str, Any]]:
+        cols = "*" if columns.strip() == "*" else ", ".join(f'"{c.strip()}"' for c in columns.split(","))
+        tail = ""
+        if limit is not None:
+            tail = f" LIMIT {int(limit)}" + (f" OFFSET {int(offset)}" if offset else "")
+        cur = self._conn.execute(f'SELECT {cols} FROM "{table}"{where}{order}{tail}', params)
+        names = [d[0] for d in cur.description]
+        return [self._decode_row(table, names, r) for r in cur.fetchall()]
+
+    def _fetch_ids(self, table: str, ids: List[int]) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        for i in range(0, len(ids), 500):
+            part = ids[i : i + 500]
+            out += self._select(table, "*", f' WHERE id IN ({", ".join("?" for _ in part)})', part, " ORDER BY id", None)
+        return out
+
+    # ---- writes ----
+    def _insert(self, table: str, payload: Any) -> List[Dict[str, Any]]:
+        records = payload if isinstance(payload, list) else [payload]
+        if not records:
+            return []
+        cols: List[str] = []
+        sample: Dict[str, Any] = {}
+        for r in records:
+            for k, v in r.items():
+                if k not in sample:
+                    cols.append(k)
+                if sample.get(k) is None:
+                    sample[k] = v
+        self._ensure_columns(table, cols, sample=sample)
+        stamps = [c for c in ("insertedat", "createdat", "startedat") if c in self._kinds.get(table, {}) and c not in cols]
+        cols += stamps
+        now = _now()
+        rows = [[self._encode_value(table, c, r.get(c, now if c in stamps else None)) for c in cols] for r in records]
+        col_sql = ", ".join(f'"{c}"' for c in cols)
+        marks = "(" + ", ".join("?" for _ in cols) + ")"
+        # multi-row INSERT ... RETURNING id: the ids come from the statement itself, so they
+        # stay right when other processes (etl/worker.py) write the same warehouse file
+        per_stmt = max(1, _MAX_SQL_VARIABLES // max(1, len(cols)))
+        ids: List[int] = []
+        with self._conn:
+            for i in range(0, len(rows), per_stmt):
+                part = rows[i : i + per_stmt]
+                cur = self._conn.execute(
+                    f'INSERT INTO "{table}" ({col_sql}) VALUES {", ".join(marks for _ in part)} RETURNING id',
+                    [v for row in part for v in row],
+                )
+                ids += [r[0] for r in cur.fetchall()]
+        return self._fetch_ids(table, sorted(ids))
+
+    def _upsert(self, table: str, payload: Any, on_conflict: Optional[str], ignore_duplicates: bool) -> List[Dict[str, Any]]:
+        records = payload if isinstance(payload, list) else [payload]
+        keys = [k.strip() for k in (on_conflict or "id").split(",") if k.strip()]
+        if not records:
+            return []
+        fresh: List[Dict[str, Any]] = []
+        touched: List[int] = []
+        self._ensure_columns(table, {k for r in records for k in r}, sample=records[0])
+        with self._conn:
+            for r in records:
+                if any(r.get(k) is None for k in keys):
+                    fresh.append(r)
+                    continue
+                where = " AND ".join(f'"{k}" = ?' for k in keys)
+                kv = [self._encode_value(table, k, r.get(k)) for k in keys]
+                hit = self._conn.execute(f'SELECT id FROM "{table}" WHERE {where} LIMIT 1', kv).fetchone()
+                if hit is None:
+                    fresh.append(r)
+                    continue
+                if not ignore_duplicates:
+                    upd = {k: v for k, v in r.items() if k not in keys and k != "id"}
+                    if upd:
+                        sets = ", ".join(f'"{k}" = ?' for k in upd)
+                        self._conn.execute(f'UPDATE "{table}" SET {sets} WHERE id = ?',
+                                           [self._encode_value(table, k, v) for k, v in upd.items()] + [hit[0]])
+                    touched.append(hit[0])
+        out = self._fetch_ids(table, touched)
+        # collapse duplicate keys inside the batch (last one wins) before appending
+        pending: Dict[Any, Dict[str, Any]] = {}
+        keyless: List[Dict[str, Any]] = []
+        for r in fresh:
+            if any(r.get(k) is None for k in keys):
+                keyless.append(r)
+            else:
+                pending[tuple(r.get(k) for k in keys)] = r
+        return out + self._insert(table, list(pending.values()) + keyless)
+
+    # ---- process_cleaned_* ----
+    def _make_promotion(self, rpc_name: str):
+        spec = PROMOTIONS[rpc_name]
+
+        def handler(wh: "LocalWarehouse", p_upload_id: Optional[int] = None, **_ignored) -> List[Dict[str, int]]:
+            return [{rpc_name: wh._promote(spec, p_upload_id)}]
+
+        return handler
+
+    def _make_range_promotion(self, rpc_name: str):
+        spec = PROMOTIONS[rpc_name]
+
+        def handler(wh: "LocalWarehouse", p_upload_id: Optional[int] = None, p_min_id: Optional[int] = None,
+                    p_max_id: Optional[int] = None, **_ignored) -> List[Dict[str, int]]:
+            return [{f"{rpc_name}_range": wh._promote(spec, p_upload_id, id_range=(p_min_id, p_max_id))}]
+
+        return handler
+
+    def _materialize_staging(self, spec: Dict[str, Any], upload_id: Optional[int]) -> None:
+        cleaned = spec["cleaned"]
+        has_cleaned = self._conn.execute(
+            f'SELECT 1 FROM "{cleaned}" WHERE upload_id IS ? LIMIT 1', (upload_id,)
+        ).fetchone()
+        if upload_id is None or has_cleaned:
+            return
+        staged = self._select("staging_raw", "raw", " WHERE upload_id = ?", [upload_id], " ORDER BY id", None)
+        records = []
+        for s in staged:
+            raw = s.get("raw")
+            rows = raw.get("rows") if isinstance(raw, dict) and isinstance(raw.get("rows"), list) else [raw]
+            for r in rows:
+                if not isinstance(r, dict):
+                    continue
+                rec = {col: next((r.get(a) for a in aliases if r.get(a) not in (None, "")), None)
+                       for col, aliases in spec["columns"].items()}
+                if rec.get(spec["key"]) is None:
+                    continue
+                rec.update({"rawjson": r, "upload_id": upload_id, "processed": False})
+                records.append(rec)
+        self._insert(cleaned, records)
+
+    def _promote(self, spec: Dict[str, Any], upload_id: Optional[int], id_range: Optional[Tuple[int, int]] = None) -> int:
+        cleaned, dim, key = spec["cleaned"], spec["dim"], spec["key"]
+        dim_cols = [c for c, _ in SCHEMA[dim] if c != "createdat"] if dim else []
+        if id_range is None:
+            self._materialize_staging(spec, upload_id)
+        self._ensure_columns(cleaned, dim_cols)
+        scope = "upload_id = ?" if upload_id is not None else "1"
+        params = [upload_id] if upload_id is not None else []
+        if id_range is not None:
+            # process_cleaned_*_range: only ids in [min, max]
+            scope += " AND id BETWEEN ? AND ?"
+            params += [int(id_range[0]), int(id_range[1])]
+        aliases = spec.get("cleaned_aliases", {})
+        self._ensure_columns(cleaned, [a for names in aliases.values() for a in names])
+
+        def source(c: str) -> str:
+            # typed cleaned column first, then ETL-specific column names, then the raw json keys
+            exprs = [f'"{x}"' for x in [c] + aliases.get(c, [])]
+            exprs += [f"json_extract(\"rawjson\", '$.{x}')" for x in spec["columns"].get(c, [])]
+            return f'COALESCE({", ".join(exprs)})'
+
+        col_sql = ", ".join(f'"{c}"' for c in dim_cols)
+        src_sql = ", ".join(source(c) for c in dim_cols)
+        updates = ", ".join(f'"{c}" = excluded."{c}"' for c in dim_cols if c != key)
+        with self._conn:
+            n = self._conn.execute(
+                f'SELECT COUNT(*) FROM "{cleaned}" WHERE {scope} AND COALESCE(processed, 0) = 0', params
+            ).fetchone()[0]
+            # later rows of the same key overwrite earlier ones (ORDER BY id)
+            if dim:
+                self._conn.execute(
+                    f'INSERT INTO "{dim}" ({col_sql}, "createdat") '
+                    f'SELECT {src_sql}, ? FROM "{cleaned}" WHERE {scope} AND COALESCE(processed, 0) = 0 '
+                    f'AND {source(key)} IS NOT NULL ORDER BY id '
+                    f'ON CONFLICT("{key}") DO UPDATE SET {updates}',
+                    [_now()] + params,
+                )
+            self._conn.execute(f'UPDATE "{cleaned}" SET processed = 1 WHERE {scope} AND COALESCE(processed, 0) = 0', params)
+        return n
+
+    # ---- staging leases (worker.py; same contract as sql/staging_leases.sql) ----
+    def _leased(self, sql: str, params: List[Any], ids: List[int], worker: str) -> int:
+        """Run `sql` on the rows of `ids` still leased to `worker`; returns the rows changed."""
+        if not ids:
+            return 0
+        with self._conn:
+            cur = self._conn.execute(f'{sql} WHERE id IN ({", ".join("?" for _ in ids)}) AND lease_owner = ?',
+                                     params + [int(i) for i in ids] + [worker])
+        return cur.rowcount
+
+    def _claim_staging_chunks(self, p_worker: str, p_limit: int = 10, p_lease_seconds: int = 300,
+                              p_entities: Optional[List[str]] = None, p_max_attempts: int = 5,
+                              **_ignored) -> List[Dict[str, Any]]:
+        # BEGIN IMMEDIATE takes SQLite's write lock up front: claims from several processes
+        # sharing the file serialize instead of handing out the same chunk (SKIP LOCKED stand-in)
+        now = datetime.now(timezone.utc)
+        expires = (now + timedelta(seconds=int(p_lease_seconds))).isoformat()
+        scope = ("COALESCE(processed, 0) = 0 AND (lease_expires_at IS NULL OR lease_expires_at < ?) "
+                 "AND COALESCE(attempts, 0) < ?")
+        params: List[Any] = [now.isoformat(), int(p_max_attempts)]
+        if p_entities:
+            scope += f' AND LOWER(COALESCE(detected_entity, entity)) IN ({", ".join("?" for _ in p_entities)})'
+            params += [e.lower() for e in p_entities]
+        if self._conn.in_transaction:
+            self._conn.commit()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [r[0] for r in self._conn.execute(
+                f'SELECT id FROM "staging_raw" WHERE {scope} ORDER BY id LIMIT ?', params + [int(p_limit)])]
+            if ids:
+                self._conn.execute(
+                    'UPDATE "staging_raw" SET lease_owner = ?, lease_expires_at = ?, attempts = COALESCE(attempts, 0) + 1 '
+                    f'WHERE id IN ({", ".join("?" for _ in ids)})', [p_worker, expires] + ids)
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        rows = self._fetch_ids("staging_raw", ids)
+        keep = ("id", "entity", "detected_entity", "upload_id", "raw", "attempts")
+        return [{k: r.get(k) for k in keep} for r in rows]
+
+    def _complete_staging_chunks(self, p_worker: str, p_ids: List[int], **_ignored) -> int:
+        return self._leased('UPDATE "staging_raw" SET processed = 1, lease_owner = NULL, lease_expires_at = NULL',
+                            [], p_ids, p_worker)
+
+    def _release_staging_chunks(self, p_worker: str, p_ids: List[int], p_delay_seconds: int = 0, p_failed: bool = True,
+                                **_ignored) -> int:
+        retry_at = (datetime.now(timezone.utc) + timedelta(seconds=int(p_delay_seconds))).isoformat() if p_delay_seconds else None
+        # never started (p_failed false): give back the attempt the claim counted
+        attempts = "" if p_failed else ", attempts = MAX(COALESCE(attempts, 0) - 1, 0)"
+        return self._leased(f'UPDATE "staging_raw" SET lease_owner = NULL, lease_expires_at = ?{attempts}', [retry_at],
+                            p_ids, p_worker)
+
+    def _extend_staging_leases(self, p_worker: str, p_ids: List[int], p_lease_seconds: int = 300, **_ignored) -> int:
+        expires = (datetime.now(timezone.utc) + timedelta(seconds=int(p_lease_seconds))).isoformat()
+        return self._leased('UPDATE "staging_raw" SET lease_expires_at = ?', [expires], p_ids, p_worker)
+
+    # ---- sync to the hosted project ----
+    def sync_to(self, remote, batch_size: int = 500) -> Dict[str, int]:
+        """
+        Push unsynced cleaned_* rows to `remote` (a supabase client) and run the remote
+        promotion for everything unprocessed. Local ids/upload_ids are not portable, so
+        rows are sent without them; the local upload id is kept in rawjson._local_upload_id.
+        row_key is prefixed with the warehouse name and used as upsert key, so re-running
+        an interrupted sync does not push rows twice.
+        """
+        pushed: Dict[str, int] = {}
+        for rpc_name, spec in PROMOTIONS.items():
+            cleaned = spec["cleaned"]
+            total = 0
+            while True:
+                with self._lock:
+                    rows = self._select(cleaned, "*", " WHERE synced_at IS NULL", [], " ORDER BY id", batch_size)
+                if not rows:
+                    break
+                out = []
+                for r in rows:
+                    rec = {k: v for k, v in r.items() if k not in ("id", "upload_id", "synced_at", "processed")}
+                    raw = rec.get("rawjson") if isinstance(rec.get("rawjson"), dict) else {}
+                    rec["rawjson"] = dict(raw, _local_upload_id=r.get("upload_id"))
+                    if rec.get("row_key"):
+                        rec["row_key"] = f"local:{Path(self.path).stem}:{rec['row_key']}"
+                    out.append({k: v for k, v in rec.items() if v is not None})
+                res = remote.table(cleaned).upsert(out, on_conflict="row_key", ignore_duplicates=True).execute()
+                if hasattr(res, "error") and res.error:
+                    raise RuntimeError(f"sync of {cleaned} failed: {res.error}")
+                with self._lock, self._conn:
+                    ids = [r["id"] for r in rows]
+                    self._conn.execute(
+                        f'UPDATE "{cleaned}" SET synced_at = ? WHERE id IN ({", ".join("?" for _ in ids)})', [_now()] + ids
+                    )
+                total += len(rows)
+            if total:
+                remote.rpc(rpc_name, {"p_upload_id": None}).execute()
+            pushed[cleaned] = total
+        return pushed
+
+
+if __name__ == "__main__":
+    import sys
+
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    wh = LocalWarehouse(LOCAL_WAREHOUSE_PATH)
+    if cmd == "sync":
+        from supabase import create_client
+
+        url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+        if not url or not key:
+            raise SystemExit("sync needs SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY")
+        print("Synced:", wh.sync_to(create_client(url, key)))
+    else:
+        print("Warehouse:", wh.path)
+        for t in SCHEMA:
+            n = wh._conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0]
+            print(f"  {t:<24} {n}")
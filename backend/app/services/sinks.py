@@ -0,0 +1,377 @@
+# backend/app/services/sinks.py
+"""
+Storage sinks used by main.batch_insert and the ETL _upsert_* helpers. The ETL
+runtime handlers write one sink call per batch of rows (write_in_batches), not per row:
+with the COPY sink every call is a temp table, a COPY and a merge.
+
+Two implementations:
+  - SupabaseSink   (default): chunked PostgREST insert/upsert through `sb`
+  - PostgresCopySink:         streams rows over a direct Postgres connection with
+                              COPY (csv or binary). Plain inserts COPY straight into the
+                              target; upserts COPY into a temp table and merge with one
+                              set-based INSERT ... ON CONFLICT statement.
+
+In csv mode every value is sent as a quoted CSV field and None as an unquoted empty
+field, which COPY ... (FORMAT CSV) reads as NULL (a quoted "" stays an empty string).
+
+Selection (env):
+  STORAGE_SINK   = supabase | pgcopy      (default supabase)
+  DATABASE_URL   = postgresql://...       (required for pgcopy)
+  PGCOPY_FORMAT  = csv | binary           (default csv; binary needs typed python values)
+"""
+from __future__ import annotations
+import json
+import os
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+try:
+    import psycopg
+    from psycopg import sql
+    from psycopg.types.json import Json, Jsonb
+except Exception:
+    psycopg = None
+
+STORAGE_SINK = os.getenv("STORAGE_SINK", "supabase").lower().strip()
+DATABASE_URL = os.getenv("DATABASE_URL")
+PGCOPY_FORMAT = os.getenv("PGCOPY_FORMAT", "csv").lower().strip()
+SINK_BATCH_SIZE = int(os.getenv("BATCH_INSERT_SIZE", "200"))
+# csv rows buffered per copy.write() call
+COPY_WRITE_ROWS = 1000
+
+JSON_OID = 114
+JSONB_OID = 3802
+
+
+def _check_response(res, table_name: str, action: str) -> None:
+    if isinstance(res, dict) and res.get("error"):
+        raise RuntimeError(f"Error {action} {table_name}: {res.get('error')}")
+    if hasattr(res, "error") and res.error:
+        raise RuntimeError(f"Error {action} {table_name}: {res.error}")
+
+
+def _columns_of(records: Sequence[Dict[str, Any]]) -> List[str]:
+    """Union of record keys, in order of first appearance."""
+    cols: List[str] = []
+    seen = set()
+    for r in records:
+        for k in r.keys():
+            if k not in seen:
+                seen.add(k)
+                cols.append(k)
+    return cols
+
+
+def _conflict_keys(on_conflict: Optional[str]) -> List[str]:
+    return [k.strip() for k in (on_conflict or "").split(",") if k.strip()]
+
+
+def _last_per_key(records: List[Dict[str, Any]], keys: List[str]) -> List[Dict[str, Any]]:
+    """Last record of each conflict key, in input order (one statement cannot upsert a key twice)."""
+    if not keys:
+        return records
+    last = {tuple(r.get(k) for k in keys): i for i, r in enumerate(records)}
+    return [r for i, r in enumerate(records) if last[tuple(r.get(k) for k in keys)] == i]
+
+
+def write_in_batches(write: Callable[[List[Any]], Any], items: List[Any],
+                     on_error: Callable[[Any, Exception], None], batch_size: int = SINK_BATCH_SIZE) -> int:
+    """
+    Call write(batch) once per batch_size items instead of once per item (the ETL
+    runtime handlers pass a function doing one sink call per batch). A batch that
+    raises is retried item by item, so only the failing items go to on_error(item, exc),
+    as with per-row writes. Returns the number of items written.
+    """
+    written = 0
+    for i in range(0, len(items), max(1, batch_size)):
+        batch = items[i : i + max(1, batch_size)]
+        try:
+            write(batch)
+            written += len(batch)
+            continue
+        except Exception as e:
+            if len(batch) == 1:
+                on_error(batch[0], e)
+                continue
+        for item in batch:
+            try:
+                write([item])
+                written += 1
+            except Exception as e:
+                on_error(item, e)
+    return written
+
+
+# -----------------------
+# PostgREST (supabase-py)
+# -----------------------
+class SupabaseSink:
+    name = "supabase"
+
+    def insert(self, table_name: str, records: List[Dict[str, Any]], batch_size: int = SINK_BATCH_SIZE) -> int:
+        from .supabase_client import sb
+
+        if not records:
+            return 0
+        inserted = 0
+        for i in range(0, len(records), batch_size):
+            chunk = records[i : i + batch_size]
+            res = sb.table(table_name).insert(chunk).execute()
+            _check_response(res, table_name, "inserting into")
+            inserted += len(chunk)
+        return inserted
+
+    def upsert(
+        self,
+        table_name: str,
+        records: List[Dict[str, Any]],
+        on_conflict: Optional[str] = None,
+        batch_size: int = SINK_BATCH_SIZE,
+        ignore_duplicates: bool = False,
+    ) -> int:
+        from .supabase_client import sb
+
+        if not records:
+            return 0
+        # last occurrence of a key wins, as with the COPY sink and row-by-row upserts
+        unique = _last_per_key(records, _conflict_keys(on_conflict))
+        for i in range(0, len(unique), batch_size):
+            chunk = unique[i : i + batch_size]
+            kwargs: Dict[str, Any] = {"ignore_duplicates": ignore_duplicates}
+            if on_conflict:
+                kwargs["on_conflict"] = on_conflict
+            res = sb.table(table_name).upsert(chunk, **kwargs).execute()
+            _check_response(res, table_name, "upserting into")
+        return len(records)
+
+
+# -----------------------
+# Direct Postgres COPY
+# -----------------------
+class PostgresCopySink:
+    name = "pgcopy"
+
+    def __init__(self, dsn: str, fmt: str = "csv"):
+        if psycopg is None:
+            raise RuntimeError("STORAGE_SINK=pgcopy requires psycopg (pip install 'psycopg[binary]').")
+        if not dsn:
+            raise RuntimeError("STORAGE_SINK=pgcopy requires DATABASE_URL.")
+        if fmt not in ("csv", "binary"):
+            raise ValueError(f"PGCOPY_FORMAT must be csv or binary, got {fmt!r}")
+        self.dsn = dsn
+        self.fmt = fmt
+        self._local = threading.local()
+
+    # one connection per thread; the ETL runtime and request handlers may share the sink
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.closed:
+            conn = psycopg.connect(self.dsn)
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and not conn.closed:
+            conn.close()
+        self._local.conn = None
+
+    def _column_oids(self, cur, table_name: str, cols: List[str]) -> List[int]:
+        cur.execute(
+            "SELECT a.attname, a.atttypid FROM pg_attribute a "
+            "WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped",
+            (table_name,),
+        )
+        oids = {name: oid for name, oid in cur.fetchall()}
+        missing = [c for c in cols if c not in oids]
+        if missing:
+            raise RuntimeError(f"Unknown columns for {table_name}: {missing}")
+        return [oids[c] for c in cols]
+
+    def _adapt_text(self, v: Any) -> Any:
+        if isinstance(v, (dict, list)):
+            return json.dumps(v, default=str)
+        if isinstance(v, (datetime, date)):
+            return v.isoformat()
+        return v
+
+    def _csv_field(self, v: Any) -> str:
+        if v is None:
+            return ""  # unquoted empty field = NULL
+        v = self._adapt_text(v)
+        if isinstance(v, bool):
+            v = "true" if v else "false"
+        return '"' + str(v).replace('"', '""') + '"'
+
+    def _csv_line(self, row: List[Any]) -> str:
+        return ",".join(self._csv_field(v) for v in row) + "\n"
+
+    def _adapt_binary(self, v: Any, oid: int) -> Any:
+        if v is None:
+            return None
+        if oid == JSONB_OID:
+            return Jsonb(v)
+        if oid == JSON_OID:
+            return Json(v)
+        return v
+
+    def _copy_rows(self, cur, target, cols: List[str], records, oids: Optional[List[int]], ordinal: bool = False) -> None:
+        copy_cols = cols + (["__ord"] if ordinal else [])
+        stmt = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT {})").format(
+            target,
+            sql.SQL(", ").join(sql.Identifier(c) for c in copy_cols),
+            sql.SQL(self.fmt.upper()),
+        )
+        with cur.copy(stmt) as copy:
+            if self.fmt == "binary":
+                copy.set_types(oids + ([20] if ordinal else []))  # 20 = int8
+                for n, r in enumerate(records):
+                    row = [self._adapt_binary(r.get(c), oid) for c, oid in zip(cols, oids)]
+                    copy.write_row(row + [n] if ordinal else row)
+            else:
+                # write_row() would emit COPY TEXT (tabs, \N); FORMAT CSV needs real CSV lines
+                buf: List[str] = []
+                for n, r in enumerate(records):
+                    row = [r.get(c) for c in cols]
+                    buf.append(self._csv_line(row + [n] if ordinal else row))
+                    if len(buf) >= COPY_WRITE_ROWS:
+                        copy.write("".join(buf))
+                        buf = []
+                if buf:
+                    copy.write("".join(buf))
+
+    def insert(self, table_name: str, records: List[Dict[str, Any]], batch_size: int = SINK_BATCH_SIZE) -> int:
+        if not records:
+            return 0
+        cols = _columns_of(records)
+        conn = self._conn()
+        try:
+            with conn.cursor() as cur:
+                oids = self._column_oids(cur, table_name, cols) if self.fmt == "binary" else None
+                self._copy_rows(cur, sql.Identifier(table_name), cols, records, oids)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise RuntimeError(f"Error inserting into {table_name}: {e}")
+        return len(records)
+
+    def upsert(
+        self,
+        table_name: str,
+        records: List[Dict[str, Any]],
+        on_conflict: Optional[str] = None,
+        batch_size: int = SINK_BATCH_SIZE,
+        ignore_duplicates: bool = False,
+    ) -> int:
+        if not records:
+            return 0
+        keys = _conflict_keys(on_conflict)
+        if not keys:
+            return self.insert(table_name, records, batch_size)
+        cols = _columns_of(records)
+        missing = [k for k in keys if k not in cols]
+        if missing:
+            raise ValueError(f"on_conflict columns missing from records: {missing}")
+
+        stage = sql.Identifier(f"_sink_stage_{table_name}")
+        target = sql.Identifier(table_name)
+        col_list = sql.SQL(", ").join(sql.Identifier(c) for c in cols)
+        key_list = sql.SQL(", ").join(sql.Identifier(k) for k in keys)
+        updates = [c for c in cols if c not in keys]
+        if ignore_duplicates or not updates:
+            action = sql.SQL("DO NOTHING")
+        else:
+            action = sql.SQL("DO UPDATE SET {}").format(
+                sql.SQL(", ").join(sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(c)) for c in updates)
+            )
+
+        conn = self._conn()
+        try:
+            with conn.cursor() as cur:
+                # temp table with the target's column types but none of its constraints
+                cur.execute(sql.SQL(
+                    "CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {cols} FROM {target} WITH NO DATA"
+                ).format(stage=stage, cols=col_list, target=target))
+                cur.execute(sql.SQL("ALTER TABLE {} ADD COLUMN __ord bigint").format(stage))
+                oids = self._column_oids(cur, f"pg_temp._sink_stage_{table_name}", cols) if self.fmt == "binary" else None
+                self._copy_rows(cur, stage, cols, records, oids, ordinal=True)
+                # last occurrence of a key inside the batch wins, as with row-by-row upserts
+                cur.execute(sql.SQL(
+                    "INSERT INTO {target} ({cols}) "
+                    "SELECT DISTINCT ON ({keys}) {cols} FROM {stage} ORDER BY {keys}, __ord DESC "
+                    "ON CONFLICT ({keys}) {action}"
+                ).format(target=target, cols=col_list, keys=key_list, stage=stage, action=action))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise RuntimeError(f"Error upserting into {table_name}: {e}")
+        return len(records)
+
+
+# -----------------------
+# Selection
+# -----------------------
+_SINK = None
+_SINK_LOCK = threading.Lock()
+
+
+def get_sink():
+    """Return the process-wide sink selected by STORAGE_SINK (created on first use)."""
+    global _SINK
+    if _SINK is None:
+        with _SINK_LOCK:
+            if _SINK is None:
+                if STORAGE_SINK == "pgcopy":
+                    _SINK = PostgresCopySink(DATABASE_URL, PGCOPY_FORMAT)
+                elif STORAGE_SINK in ("", "supabase", "postgrest"):
+                    _SINK = SupabaseSink()
+                else:
+                    raise RuntimeError(f"Unknown STORAGE_SINK: {STORAGE_SINK}")
+    return _SINK
+
+
+def set_sink(sink) -> None:
+    """Override the process-wide sink (harnesses, scripts)."""
+    global _SINK
+    with _SINK_LOCK:
+        _SINK = sink
+
+
+# Quick local check against a Postgres you control:
+#   DATABASE_URL=postgresql://localhost/etl PGCOPY_FORMAT=csv python -m backend.app.services.sinks 100000
+if __name__ == "__main__":
+    import sys
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    sink = PostgresCopySink(DATABASE_URL, PGCOPY_FORMAT)
+    conn = sink._conn()
+    with conn.cursor() as cur:
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS sink_smoke_test ("
+            " id bigserial PRIMARY KEY, airlinekey text UNIQUE, airlinename text, country text, rawjson jsonb,"
+            " upload_id bigint)"
+        )
+        cur.execute("TRUNCATE sink_smoke_test")
+    conn.commit()
+
+    # country: NULL, empty string and a value with a quote, comma and tab
+    countries = [None, "", 'Côte d\'Ivoire, "CI"\t']
+    rows = [{"airlinekey": f"K{i}", "airlinename": f"Airline {i}", "country": countries[i % 3], "rawjson": {"i": i},
+             "upload_id": 1} for i in range(n)]
+    t0 = time.perf_counter()
+    sink.insert("sink_smoke_test", rows)
+    t1 = time.perf_counter()
+    sink.upsert("sink_smoke_test", [dict(r, airlinename=r["airlinename"].upper()) for r in rows], on_conflict="airlinekey")
+    t2 = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT count(*), count(*) FILTER (WHERE airlinename LIKE 'AIRLINE %%'),"
+            " count(*) FILTER (WHERE country IS NULL), count(*) FILTER (WHERE country = '') FROM sink_smoke_test"
+        )
+        total, updated, nulls, empty = cur.fetchone()
+    print(f"insert {n} rows: {t1 - t0:.3f}s  upsert {n} rows: {t2 - t1:.3f}s  rows={total} updated={updated} "
+          f"null={nulls} empty={empty}")
+    sink.close()
@@ -0,0 +1,247 @@
+# backend/app/services/spool.py
+"""
+Content-addressed file spool for uploaded files.
+
+Uploads are moved into the spool as blobs named by the sha256 of their bytes (plus
+the original extension, which the readers use to pick a format), and staging_raw
+.file_pointer stores a node-independent pointer instead of a temp path:
+
+    spool://<sha256><ext>        e.g. spool://9f2c...e1.csv
+
+SPOOL_BACKEND picks where blobs live:
+
+  local     SPOOL_DIR only. Node-independent when SPOOL_DIR is shared storage
+            (NFS, a mounted volume); otherwise replicas fall back to staged rows.
+  storage   the SPOOL_BUCKET storage bucket (the local warehouse writes buckets to
+            disk, so this also works with SUPABASE_BACKEND=local). SPOOL_DIR is then
+            a read-through cache: local_path() downloads a missing blob on first use.
+
+Blobs in SPOOL_DIR are evicted after SPOOL_TTL_SECONDS without use, and least
+recently used first once the directory holds more than SPOOL_MAX_BYTES (evict() runs
+at most every SPOOL_EVICT_EVERY seconds from put_file()). Bucket objects are not
+evicted here; give the bucket its own retention. A pointer whose blob is gone
+resolves to None, and /api/process then uses the staged rows as before.
+
+mapped(pointer) gives a read-only memory map of a blob (bytes-like), so hashing does
+not read the file into Python memory chunk by chunk first. Storage uploads are given
+the open file, so the client streams it.
+
+A blob can back several uploads with the same content, so after a failed upload
+main.drop_upload_file only discards it when no other staging_raw row points at it.
+"""
+from __future__ import annotations
+import contextlib
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Union
+
+SPOOL_BACKEND = os.getenv("SPOOL_BACKEND", "local").lower().strip()  # local | storage
+SPOOL_DIR = Path(os.getenv("SPOOL_DIR", os.path.join(tempfile.gettempdir(), "etl_spool")))
+SPOOL_BUCKET = os.getenv("SPOOL_BUCKET", "spool")
+SPOOL_TTL_SECONDS = int(os.getenv("SPOOL_TTL_SECONDS", str(7 * 24 * 3600)))
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", str(5 * 1024 * 1024 * 1024)))  # default 5GB
+SPOOL_EVICT_EVERY = float(os.getenv("SPOOL_EVICT_EVERY", "60"))
+
+SCHEME = "spool://"
+
+_lock = threading.Lock()
+_last_evict = 0.0
+STATS: Dict[str, Any] = {"puts": 0, "dedup_hits": 0, "hits": 0, "misses": 0, "downloads": 0,
+                         "evicted": 0, "evicted_bytes": 0}
+
+
+def is_pointer(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(SCHEME)
+
+
+def _name(pointer: str) -> str:
+    name = pointer[len(SCHEME):]
+    if not name or "/" in name or "\\" in name or name.startswith("."):
+        raise ValueError(f"invalid spool pointer: {pointer}")
+    return name
+
+
+def _blob_path(name: str) -> Path:
+    return SPOOL_DIR / name[:2] / name
+
+
+def _bucket():
+    from .supabase_client import sb
+
+    return sb.storage.from_(SPOOL_BUCKET)
+
+
+@contextlib.contextmanager
+def mapped(path_or_pointer: Union[str, Path]) -> Iterator[Union[mmap.mmap, bytes]]:
+    """Read-only memory map of a file or spool blob (b"" for an empty file)."""
+    path = local_path(str(path_or_pointer)) if is_pointer(str(path_or_pointer)) else str(path_or_pointer)
+    if path is None:
+        raise FileNotFoundError(str(path_or_pointer))
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            yield b""
+            return
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+
+def digest(path: Union[str, Path]) -> str:
+    with mapped(path) as data:
+        return hashlib.sha256(data).hexdigest()
+
+
+def put_file(path: Union[str, Path], suffix: Optional[str] = None, keep_source: bool = False) -> str:
+    """
+    Move the file at `path` into the spool and return its pointer. The source file is
+    gone afterwards (moved, or removed when the same content is already spooled),
+    unless keep_source, which copies it instead.
+    """
+    path = Path(path)
+    ext = (suffix if suffix is not None else path.suffix).lower()
+    name = digest(path) + ext
+    dest = _blob_path(name)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if dest.exists():
+        os.utime(dest)
+        if not keep_source:
+            path.unlink()
+        STATS["dedup_hits"] += 1
+    else:
+        moved = False
+        if not keep_source:
+            try:
+                os.replace(path, dest)
+                moved = True
+            except OSError:
+                pass  # different filesystem
+        if not moved:
+            # copy next to the target, then rename (readers never see a partial blob)
+            tmp = dest.with_name(dest.name + ".part")
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, dest)
+            if not keep_source:
+                path.unlink()
+    if SPOOL_BACKEND == "storage":
+        try:
+            with open(dest, "rb") as fh:
+                _bucket().upload(name, fh, {"upsert": "true"})
+        except Exception as e:
+            print("Warning: spool upload to storage failed:", str(e))
+    STATS["puts"] += 1
+    maybe_evict()
+    return SCHEME + name
+
+
+def local_path(pointer: Optional[str]) -> Optional[str]:
+    """
+    Local file for a pointer (downloading it when SPOOL_BACKEND=storage), or None when
+    the blob is gone. Legacy file_pointer values (plain paths) pass through if they exist.
+    """
+    if not pointer:
+        return None
+    if not is_pointer(pointer):
+        return pointer if os.path.exists(pointer) else None
+    name = _name(pointer)
+    path = _blob_path(name)
+    if path.exists():
+        os.utime(path)  # mtime doubles as last use for TTL / LRU eviction
+        STATS["hits"] += 1
+        return str(path)
+    STATS["misses"] += 1
+    if SPOOL_BACKEND != "storage":
+        return None
+    try:
+        data = _bucket().download(name)
+    except Exception:
+        return None
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".part")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    STATS["downloads"] += 1
+    return str(path)
+
+
+def discard(pointer: Optional[str]) -> None:
+    """Drop a blob from SPOOL_DIR (e.g. its upload failed and nothing else uses it). Bucket copies stay."""
+    if not is_pointer(pointer):
+        return
+    try:
+        _blob_path(_name(pointer)).unlink()
+    except (FileNotFoundError, ValueError):
+        pass
+
+
+def _blobs():
+    if not SPOOL_DIR.exists():
+        return []
+    out = []
+    for sub in SPOOL_DIR.iterdir():
+        if not sub.is_dir():
+            continue
+        for p in sub.iterdir():
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            out.append((st.st_mtime, st.st_size, p))
+    return out
+
+
+def evict(now: Optional[float] = None) -> Dict[str, int]:
+    """Remove blobs unused for SPOOL_TTL_SECONDS, then LRU blobs until under SPOOL_MAX_BYTES."""
+    global _last_evict
+    now = time.time() if now is None else now
+    removed = removed_bytes = 0
+    with _lock:
+        _last_evict = time.monotonic()
+        blobs = sorted(_blobs(), key=lambda b: b[0])
+        total = sum(size for _, size, _ in blobs)
+        for mtime, size, p in blobs:
+            expired = now - mtime > SPOOL_TTL_SECONDS
+            over_quota = total > SPOOL_MAX_BYTES
+            if p.name.endswith(".part"):
+                # a copy in progress, or one left behind by a crashed process
+                expired, over_quota = now - mtime > 3600, False
+            if not (expired or over_quota):
+                continue
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            removed += 1
+            removed_bytes += size
+            total -= size
+        STATS["evicted"] += removed
+        STATS["evicted_bytes"] += removed_bytes
+    return {"removed": removed, "removed_bytes": removed_bytes, "bytes": total}
+
+
+def maybe_evict() -> None:
+    if time.monotonic() - _last_evict >= SPOOL_EVICT_EVERY:
+        try:
+            evict()
+        except Exception as e:
+            print("Warning: spool eviction failed:", str(e))
+
+
+def stats() -> Dict[str, Any]:
+    blobs = _blobs()
+    return {
+        "backend": SPOOL_BACKEND,
+        "dir": str(SPOOL_DIR),
+        "blobs": len(blobs),
+        "bytes": sum(size for _, size, _ in blobs),
+        "max_bytes": SPOOL_MAX_BYTES,
+        "ttl_seconds": SPOOL_TTL_SECONDS,
+        **STATS,
+    }
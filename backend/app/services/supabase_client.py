@@ -1,8 +1,22 @@
 # backend/app/services/supabase_client.py
+"""
+Shared database client.
+
+`sb` is a proxy: the real client (supabase-py, or the embedded LocalWarehouse when
+SUPABASE_BACKEND=local) is created, and the credentials checked, on first attribute
+access. Importing this module is therefore cheap and works without credentials, so
+endpoints and workers that never touch the database start fast.
+
+Query and RPC builders obtained through `sb` run their execute() under the shared
+throttle (adaptive concurrency, backoff, retry budget; see throttle.py).
+"""
 import os
+import threading
+import time
 from pathlib import Path
 from dotenv import load_dotenv
-from supabase import create_client
+
+from .throttle import wrap
 
 # Determine path to backend/.env relative to this file
 # this file is expected at backend/app/services/supabase_client.py
@@ -19,15 +33,67 @@ else:
     load_dotenv()
 
 # Now read environment variables
+SUPABASE_BACKEND = os.getenv("SUPABASE_BACKEND", "supabase").lower().strip()  # supabase | local
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")  # server-only key
 
-if not SUPABASE_URL or not SUPABASE_KEY or "REPLACE_WITH" in (SUPABASE_KEY or ""):
-    # helpful error message that shows where we looked
-    raise RuntimeError(
-        "Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in backend/.env.\n"
-        f"Tried to load: {DOTENV_PATH}\n"
-        "Open backend/.env and paste your SUPABASE service role key into SUPABASE_SERVICE_ROLE_KEY."
-    )
+# seconds spent creating the client (None until first use); reported by /api/startup
+CLIENT_INIT_SECONDS = None
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _create_client():
+    if SUPABASE_BACKEND == "local":
+        # embedded SQLite warehouse; no credentials needed (see local_warehouse.py)
+        from .local_warehouse import LocalWarehouse, LOCAL_WAREHOUSE_PATH
+
+        return LocalWarehouse(LOCAL_WAREHOUSE_PATH)
+
+    if not SUPABASE_URL or not SUPABASE_KEY or "REPLACE_WITH" in (SUPABASE_KEY or ""):
+        # helpful error message that shows where we looked
+        raise RuntimeError(
+            "Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in backend/.env.\n"
+            f"Tried to load: {DOTENV_PATH}\n"
+            "Open backend/.env and paste your SUPABASE service role key into SUPABASE_SERVICE_ROLE_KEY,\n"
+            "or set SUPABASE_BACKEND=local to run against the embedded local warehouse."
+        )
+
+    from supabase import create_client
+
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+def get_client():
+    """The real client, created on first call (thread-safe)."""
+    global _client, CLIENT_INIT_SECONDS
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                t0 = time.perf_counter()
+                _client = _create_client()
+                CLIENT_INIT_SECONDS = time.perf_counter() - t0
+    return _client
+
+
+class _LazyClient:
+    """Forwards every attribute to get_client(), so `sb.table(...)` works unchanged."""
+
+    def __getattr__(self, name):
+        return getattr(get_client(), name)
+
+    def table(self, name):
+        return wrap(get_client().table(name))
+
+    def from_(self, name):
+        return wrap(get_client().from_(name))
+
+    def rpc(self, name, params=None):
+        return wrap(get_client().rpc(name, params or {}), op="rpc")
+
+    def __repr__(self) -> str:
+        return f"<lazy {SUPABASE_BACKEND} client{' (not created)' if _client is None else ''}>"
+
 
-sb = create_client(SUPABASE_URL, SUPABASE_KEY)
\ No newline at end of file
+sb = _LazyClient()
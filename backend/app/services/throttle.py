@@ -0,0 +1,225 @@
+# backend/app/services/throttle.py
+"""
+Adaptive concurrency, retries and backoff for database calls.
+
+supabase_client wraps every `sb.table(...)`, `sb.from_(...)` and `sb.rpc(...)` builder,
+so each `.execute()` in the app (batch_insert, sinks, the ETL _upsert_* helpers,
+call_rpc_once, import_errors writes, ...) goes through Throttle.run():
+
+  - concurrency limit (AIMD): at most int(limit) calls in flight across threads.
+    The limit grows by 1/limit per success (about +1 per round of calls) up to
+    THROTTLE_MAX_CONCURRENCY, and halves when the backend throttles (429/503),
+    at most once per THROTTLE_DECREASE_COOLDOWN seconds.
+  - retries: exponential backoff with full jitter (THROTTLE_BASE_DELAY doubling up to
+    THROTTLE_MAX_DELAY). A Retry-After from the backend is honoured and also pauses
+    the other callers until it has passed.
+  - retry budget: retries spend tokens that successes refill (THROTTLE_RETRY_RATIO per
+    success, at most THROTTLE_RETRY_BUDGET), so an outage does not turn into a retry
+    storm; without tokens the error is raised at once.
+
+Only transient errors are retried: 429, 408, 5xx, timeouts, connection errors and a
+locked local warehouse. Inserts are retried only when the request was certainly not
+applied (429/503 or a failed connect), since repeating one could duplicate rows;
+select/update/upsert/delete and RPCs are retried on any transient error.
+
+Counters for /api/throttle: stats().
+"""
+from __future__ import annotations
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "true").lower() in ("1", "true", "yes")
+THROTTLE_INITIAL_CONCURRENCY = float(os.getenv("THROTTLE_INITIAL_CONCURRENCY", "8"))
+THROTTLE_MIN_CONCURRENCY = float(os.getenv("THROTTLE_MIN_CONCURRENCY", "1"))
+THROTTLE_MAX_CONCURRENCY = float(os.getenv("THROTTLE_MAX_CONCURRENCY", "32"))
+THROTTLE_DECREASE_COOLDOWN = float(os.getenv("THROTTLE_DECREASE_COOLDOWN", "1.0"))
+THROTTLE_MAX_ATTEMPTS = int(os.getenv("THROTTLE_MAX_ATTEMPTS", "5"))
+THROTTLE_BASE_DELAY = float(os.getenv("THROTTLE_BASE_DELAY", "0.2"))
+THROTTLE_MAX_DELAY = float(os.getenv("THROTTLE_MAX_DELAY", "20"))
+THROTTLE_RETRY_BUDGET = float(os.getenv("THROTTLE_RETRY_BUDGET", "20"))
+THROTTLE_RETRY_RATIO = float(os.getenv("THROTTLE_RETRY_RATIO", "0.2"))
+
+THROTTLE_STATUSES = {429, 503}
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+_TRANSIENT_NAMES = ("Timeout", "ConnectError", "ConnectionError", "RemoteProtocolError", "ReadError",
+                    "WriteError", "PoolTimeout", "NetworkError")
+_STATUS_IN_TEXT = re.compile(r"(?:status|code|HTTP)\D{0,12}\b(408|429|500|502|503|504)\b", re.I)
+
+
+def _status_of(exc: BaseException) -> Optional[int]:
+    """HTTP status of a client error, from the response, a status/code attribute or the message."""
+    for holder in (getattr(exc, "response", None), exc):
+        for attr in ("status_code", "status", "code"):
+            v = getattr(holder, attr, None)
+            if isinstance(v, int) or (isinstance(v, str) and v.isdigit()):
+                return int(v)
+    if re.search(r"too many requests|rate limit", str(exc), re.I):
+        return 429
+    m = _STATUS_IN_TEXT.search(str(exc))
+    return int(m.group(1)) if m else None
+
+
+def _retry_after_of(exc: BaseException) -> Optional[float]:
+    v = getattr(exc, "retry_after", None)
+    if v is None:
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+        v = headers.get("retry-after") if headers is not None else None
+    try:
+        return max(0.0, float(v)) if v is not None else None
+    except (TypeError, ValueError):
+        return None  # HTTP-date form: fall back to computed backoff
+
+
+def classify(exc: BaseException, op: str) -> Optional[str]:
+    """'throttle', 'transient' or None (not retryable) for an error raised by op."""
+    status = _status_of(exc)
+    name = type(exc).__name__
+    connect_failed = "Connect" in name
+    if status in THROTTLE_STATUSES:
+        return "throttle"
+    if op == "insert" and not connect_failed:
+        return None
+    if status in TRANSIENT_STATUSES or any(n in name for n in _TRANSIENT_NAMES):
+        return "transient"
+    if name == "OperationalError" and "locked" in str(exc):
+        return "transient"
+    return None
+
+
+class Throttle:
+    def __init__(self):
+        self.limit = THROTTLE_INITIAL_CONCURRENCY
+        self.in_flight = 0
+        self.tokens = THROTTLE_RETRY_BUDGET
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self.counters: Dict[str, int] = {
+            "calls": 0, "succeeded": 0, "failed": 0, "retries": 0, "throttled": 0,
+            "transient_errors": 0, "budget_exhausted": 0, "decreases": 0,
+        }
+
+    # ---- concurrency gate ----
+    def _acquire(self) -> None:
+        with self._cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < max(1, int(self.limit)):
+                    self.in_flight += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def _release(self, outcome: Optional[str]) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if outcome == "ok":
+                self.limit = min(THROTTLE_MAX_CONCURRENCY, self.limit + 1.0 / max(self.limit, 1.0))
+                self.tokens = min(THROTTLE_RETRY_BUDGET, self.tokens + THROTTLE_RETRY_RATIO)
+            elif outcome == "throttle" and now - self._last_decrease >= THROTTLE_DECREASE_COOLDOWN:
+                self.limit = max(THROTTLE_MIN_CONCURRENCY, self.limit / 2.0)
+                self._last_decrease = now
+                self.counters["decreases"] += 1
+            self._cond.notify_all()
+
+    def _pause(self, seconds: float) -> None:
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def _take_token(self) -> bool:
+        with self._cond:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+    def _count(self, key: str) -> None:
+        with self._cond:
+            self.counters[key] += 1
+
+    # ---- calls ----
+    def run(self, fn: Callable[[], Any], op: str = "select") -> Any:
+        """Call fn() under the concurrency limit, retrying transient failures."""
+        if not THROTTLE_ENABLED:
+            return fn()
+        self._count("calls")
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                kind = classify(e, op)
+                self._release(kind)
+                if kind is None:
+                    self._count("failed")
+                    raise
+                self._count("throttled" if kind == "throttle" else "transient_errors")
+                attempt += 1
+                if attempt >= THROTTLE_MAX_ATTEMPTS:
+                    self._count("failed")
+                    raise
+                if not self._take_token():
+                    self._count("budget_exhausted")
+                    self._count("failed")
+                    raise
+                delay = random.uniform(0, min(THROTTLE_MAX_DELAY, THROTTLE_BASE_DELAY * (2 ** attempt)))
+                retry_after = _retry_after_of(e)
+                if retry_after is not None:
+                    delay = max(delay, min(retry_after, THROTTLE_MAX_DELAY))
+                    self._pause(delay)
+                self._count("retries")
+                time.sleep(delay)
+                continue
+            self._release("ok")
+            self._count("succeeded")
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "enabled": THROTTLE_ENABLED,
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "retry_tokens": round(self.tokens, 2),
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2),
+                **self.counters,
+            }
+
+
+throttle = Throttle()
+
+_BUILDER_OPS = {"select", "insert", "upsert", "update", "delete"}
+
+
+class ThrottledBuilder:
+    """
+    Proxy for a query/RPC builder: chained calls return proxies, execute() runs through
+    the throttle. Remembers the operation (insert/upsert/...) to decide what is safe to retry.
+    """
+
+    def __init__(self, target: Any, op: str):
+        self._target = target
+        self._op = op
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if name == "execute":
+            return lambda *a, **k: throttle.run(lambda: attr(*a, **k), self._op)
+        if not callable(attr):
+            return attr
+        op = name if name in _BUILDER_OPS else self._op
+
+        def call(*a, **k):
+            out = attr(*a, **k)
+            return ThrottledBuilder(out, op) if hasattr(out, "execute") or hasattr(out, "select") else out
+
+        return call
+
+
+def wrap(builder: Any, op: str = "select") -> Any:
+    return ThrottledBuilder(builder, op) if THROTTLE_ENABLED else builder
@@ -0,0 +1,125 @@
+# backend/app/staging.py
+"""
+Chunked staging_raw records.
+
+Instead of one staging_raw row per parsed CSV line, an upload is staged as one
+record per chunk of N rows:
+
+    raw = {
+        "format": "chunk",
+        "chunk_index": 3,          # 0-based chunk number inside the upload
+        "row_offset": 1500,        # ordinal of rows[0] inside the upload
+        "rows": [{...}, ...],      # parsed rows (normalized keys)
+        "validation": [None, "missing required fields: ...", ...],   # parallel to rows
+        "references": [None, "orphan references: ...", ...],         # only when a row has orphan keys
+    }
+
+entity / original_filename / detected_entity / notes are stored once per chunk, and
+file_pointer only on the first chunk. Every record carries a deterministic row_key
+("<upload_id>:c<chunk_index>") and is written with an upsert on it, so a retried or
+replayed batch cannot stage a chunk twice. Cleaned rows written by /api/process use
+"<upload_id>:<row ordinal>" the same way (row_key()). The shape is also what the ETL runtime
+handlers (process_*_upload) already accept ({"rows": [...]}), so staged chunks can be
+dispatched as-is. Legacy one-row records are still understood by iter_staged_rows.
+
+A hosted process_cleaned_* RPC that reads staging_raw.raw itself sees one record per
+chunk; backend/sql/staging_raw_rows.sql has an opt-in row-level view (and a
+materialize_staged_rows helper) such an RPC can read instead.
+"""
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+CHUNK_FORMAT = "chunk"
+
+
+def chunk_row_key(upload_id: Any, chunk_index: int) -> str:
+    return f"{upload_id}:c{chunk_index}"
+
+
+def row_key(upload_id: Any, ordinal: int) -> str:
+    return f"{upload_id}:{ordinal}"
+
+
+def is_chunk(raw: Any) -> bool:
+    return isinstance(raw, dict) and raw.get("format") == CHUNK_FORMAT and isinstance(raw.get("rows"), list)
+
+
+def build_chunk_records(
+    dataset_key: str,
+    upload_id: int,
+    filename: str,
+    rows: List[Dict[str, Any]],
+    validation: List[Optional[str]],
+    file_pointer: Optional[str] = None,
+    references: Optional[List[Optional[str]]] = None,
+    chunk_rows: int = 500,
+    first_chunk_index: int = 0,
+    first_row_offset: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Group parsed rows (and their parallel validation results) into staging_raw records.
+    first_chunk_index / first_row_offset let streaming callers stage an upload in several calls.
+    """
+    chunk_rows = max(1, int(chunk_rows))
+    staged_at = datetime.now(timezone.utc).isoformat()
+    records: List[Dict[str, Any]] = []
+    for n, start in enumerate(range(0, len(rows), chunk_rows)):
+        part = rows[start : start + chunk_rows]
+        checks = validation[start : start + chunk_rows]
+        invalid = sum(1 for e in checks if e)
+        refs = references[start : start + chunk_rows] if references else []
+        orphans = sum(1 for o in refs if o)
+        chunk_index = first_chunk_index + n
+        raw = {
+            "format": CHUNK_FORMAT,
+            "chunk_index": chunk_index,
+            "row_offset": first_row_offset + start,
+            "rows": part,
+            "validation": checks,
+        }
+        if orphans:
+            raw["references"] = refs
+        records.append({
+            "row_key": chunk_row_key(upload_id, chunk_index),
+            "entity": dataset_key,
+            "raw": raw,
+            "processed": False,
+            "upload_id": upload_id,
+            "original_filename": filename,
+            # keep file pointer on the first chunk for debugging/reference
+            "file_pointer": file_pointer if chunk_index == 0 else None,
+            "detected_entity": dataset_key,
+            "notes": {
+                "staged_at": staged_at,
+                "rows": len(part),
+                "valid_rows": len(part) - invalid,
+                "invalid_rows": invalid,
+                "orphan_rows": orphans,
+            },
+        })
+    return records
+
+
+def iter_staged_rows(staging_rows: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the parsed row dicts held by staging_raw records, expanding chunk records
+    and passing legacy one-row records through unchanged.
+    """
+    for rec in staging_rows:
+        raw = rec.get("raw")
+        if is_chunk(raw):
+            for r in raw["rows"]:
+                yield r
+        elif isinstance(raw, dict):
+            yield raw
+        elif raw is not None:
+            yield {"rawjson": raw}
+
+
+def count_staged_rows(staging_rows: Iterable[Dict[str, Any]]) -> int:
+    total = 0
+    for rec in staging_rows:
+        raw = rec.get("raw")
+        total += len(raw["rows"]) if is_chunk(raw) else 1
+    return total
@@ -0,0 +1,54 @@
+# backend/app/startup.py
+"""
+Startup timing for /api/startup.
+
+backend.main wraps its import groups in timed("<group>") and calls mark_ready() once
+the app object is built. Lazy loads that happen later (ETL modules, the database
+client, pyarrow/openpyxl) are reported separately, so a slow first request can be
+told apart from a slow boot. For a per-module breakdown run:
+
+    python -X importtime -c "import backend.main" 2> imports.txt
+"""
+from __future__ import annotations
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+PROCESS_T0 = time.perf_counter()
+IMPORT_SECONDS: Dict[str, float] = {}
+READY_SECONDS: Optional[float] = None
+
+
+@contextmanager
+def timed(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        IMPORT_SECONDS[name] = IMPORT_SECONDS.get(name, 0.0) + time.perf_counter() - t0
+
+
+def mark_ready() -> None:
+    global READY_SECONDS
+    READY_SECONDS = time.perf_counter() - PROCESS_T0
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def report() -> Dict[str, Any]:
+    from .etl import LOAD_SECONDS
+    from .services import supabase_client
+
+    heavy = ("pandas", "numpy", "pyarrow", "openpyxl", "docx", "supabase", "psycopg")
+    return {
+        "ready_ms": _ms(READY_SECONDS),
+        "imports_ms": {k: _ms(v) for k, v in IMPORT_SECONDS.items()},
+        "lazy_ms": {
+            **{f"etl.{k}": _ms(v) for k, v in LOAD_SECONDS.items()},
+            "db_client": _ms(supabase_client.CLIENT_INIT_SECONDS),
+        },
+        "loaded": {m: m in sys.modules for m in heavy},
+    }
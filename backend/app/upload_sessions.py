@@ -0,0 +1,203 @@
+# backend/app/upload_sessions.py
+"""
+Resumable upload sessions.
+
+Protocol (endpoints live in backend/main.py):
+  POST /api/uploads                      create a session -> {session_id, upload_id, received}
+  PUT  /api/uploads/{id}                 append bytes; Content-Range: bytes <start>-<end>/<total>
+  GET  /api/uploads/{id}                 current received offset (resume point)
+  POST /api/uploads/{id}/finalize        stage the remainder and close the session
+
+A PUT or finalize that arrives while another request holds the session waits for it
+(up to SESSION_LOCK_WAIT seconds). Every 409 carries the received offset to resume
+from; a GET taken mid-PUT can report a partial offset, and the next PUT corrects it.
+
+Each session is a spool file plus a small JSON metadata file in UPLOAD_SESSION_DIR, so an
+interrupted client can resume after a server restart. On finalize the spool file moves
+into the upload spool (services/spool.py); the JSON stays so a repeated finalize or GET
+still answers, and is removed FINALIZED_SESSION_TTL seconds later. Chunks are appended straight to
+the spool file. For CSV uploads, every complete line that has arrived (up to the last
+newline outside a quoted field) can be taken with take_complete_segment() and staged
+before the upload finishes.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+UPLOAD_SESSION_DIR = Path(os.getenv("UPLOAD_SESSION_DIR", os.path.join(tempfile.gettempdir(), "etl_upload_sessions")))
+MAX_RESUMABLE_BYTES = int(os.getenv("MAX_RESUMABLE_BYTES", str(2 * 1024 * 1024 * 1024)))  # default 2GB
+# seconds a finalized session's JSON is kept (for repeated finalize / status calls)
+FINALIZED_SESSION_TTL = int(os.getenv("FINALIZED_SESSION_TTL", str(24 * 3600)))
+# seconds a PUT / finalize waits for a chunk of the same session that is still in flight
+SESSION_LOCK_WAIT = float(os.getenv("SESSION_LOCK_WAIT", "30"))
+
+_CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+class SessionError(Exception):
+    """Raised for protocol errors; status_code is the HTTP status the endpoint should return."""
+
+    def __init__(self, message: str, status_code: int = 400, received: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.received = received
+
+
+def session_lock(session_id: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(session_id, threading.Lock())
+
+
+async def acquire_session_lock(session_id: str, wait: Optional[float] = None) -> Optional[threading.Lock]:
+    """
+    Wait (without blocking the event loop) until no other request holds the session,
+    then return its acquired lock; None after `wait` seconds. A client that resynced
+    from a GET taken mid-PUT then queues behind that PUT and gets its real offset.
+    """
+    lock = session_lock(session_id)
+    deadline = asyncio.get_running_loop().time() + (SESSION_LOCK_WAIT if wait is None else wait)
+    while not lock.acquire(blocking=False):
+        if asyncio.get_running_loop().time() >= deadline:
+            return None
+        await asyncio.sleep(0.05)
+    return lock
+
+
+def _meta_path(session_id: str) -> Path:
+    return UPLOAD_SESSION_DIR / f"{session_id}.json"
+
+
+def _check_id(session_id: str) -> None:
+    if not re.fullmatch(r"[0-9a-f]{32}", session_id or ""):
+        raise SessionError("invalid session id", status_code=404)
+
+
+def create_session(dataset: str, filename: str, upload_id: int, total_size: Optional[int] = None,
+                   content_type: str = "") -> Dict[str, Any]:
+    if total_size is not None and total_size > MAX_RESUMABLE_BYTES:
+        raise SessionError(f"File too large. Max {MAX_RESUMABLE_BYTES} bytes.", status_code=413)
+    UPLOAD_SESSION_DIR.mkdir(parents=True, exist_ok=True)
+    prune_finalized()
+    session_id = uuid.uuid4().hex
+    suffix = "." + (filename.split(".")[-1] if "." in filename else "tmp")
+    spool_path = UPLOAD_SESSION_DIR / f"{session_id}{suffix.lower()}"
+    spool_path.touch()
+    session = {
+        "session_id": session_id,
+        "dataset": dataset,
+        "filename": filename,
+        "content_type": content_type,
+        "upload_id": upload_id,
+        "total_size": total_size,
+        "received": 0,
+        "spool_path": str(spool_path),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        # incremental CSV staging state
+        "parsed_offset": 0,
+        "header": None,
+        "delimiter": None,
+        "chunk_index": 0,
+        "row_offset": 0,
+        "staged_rows": 0,
+        "staged_chunks": 0,
+        "error_rows": 0,
+        "finalized": False,
+    }
+    save_session(session)
+    return session
+
+
+def save_session(session: Dict[str, Any]) -> None:
+    path = _meta_path(session["session_id"])
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(session), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def load_session(session_id: str) -> Dict[str, Any]:
+    _check_id(session_id)
+    path = _meta_path(session_id)
+    if not path.exists():
+        raise SessionError("upload session not found", status_code=404)
+    session = json.loads(path.read_text(encoding="utf-8"))
+    if session.get("finalized"):
+        return session  # its spool file has moved into the upload spool
+    # the spool file is the source of truth for the received offset
+    try:
+        session["received"] = os.path.getsize(session["spool_path"])
+    except OSError:
+        raise SessionError("upload session spool file is missing", status_code=410)
+    return session
+
+
+def prune_finalized(max_age: Optional[int] = None) -> int:
+    """Remove the JSON of sessions finalized more than max_age seconds ago. Returns how many."""
+    max_age = FINALIZED_SESSION_TTL if max_age is None else max_age
+    cutoff = datetime.now(timezone.utc).timestamp() - max_age
+    removed = 0
+    for path in UPLOAD_SESSION_DIR.glob("*.json"):
+        try:
+            if path.stat().st_mtime >= cutoff or not json.loads(path.read_text(encoding="utf-8")).get("finalized"):
+                continue
+            path.unlink()
+            removed += 1
+        except (OSError, ValueError):
+            continue
+    return removed
+
+
+def parse_content_range(header: Optional[str], received: int) -> Tuple[int, Optional[int]]:
+    """Return (start, total) from a Content-Range header; no header means 'append at received'."""
+    if not header:
+        return received, None
+    m = _CONTENT_RANGE.match(header.strip())
+    if not m:
+        raise SessionError(f"malformed Content-Range: {header}")
+    start = int(m.group(1))
+    total = None if m.group(3) == "*" else int(m.group(3))
+    return start, total
+
+
+def is_csv_session(session: Dict[str, Any]) -> bool:
+    name = (session.get("filename") or "").lower()
+    if name.endswith((".gz", ".zip", ".zst")):
+        return False  # compressed feeds are staged at finalize by streaming decompression
+    return name.endswith(".csv") or "text/csv" in (session.get("content_type") or "")
+
+
+def take_complete_segment(session: Dict[str, Any], final: bool = False) -> Optional[bytes]:
+    """
+    Return the bytes between parsed_offset and the last newline that is not inside a
+    quoted field (or everything remaining when final=True) and advance parsed_offset.
+    Returns None when no complete line is available yet.
+    """
+    start = session["parsed_offset"]
+    end = session["received"]
+    if end <= start:
+        return None
+    with open(session["spool_path"], "rb") as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+    if final:
+        cut = len(data)
+    else:
+        # a newline ends a record only when the quotes before it are balanced
+        pos = data.rfind(b"\n")
+        while pos >= 0 and data.count(b'"', 0, pos) % 2:
+            pos = data.rfind(b"\n", 0, pos)
+        if pos < 0:
+            return None
+        cut = pos + 1
+    session["parsed_offset"] = start + cut
+    return data[:cut]
@@ -1,10 +1,17 @@
 # backend/convert_router.py
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import PlainTextResponse
-from typing import List
-from docx import Document
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import Iterator, List, Tuple
 from io import BytesIO, BufferedReader
 import io
+import itertools
+import os
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+
+from backend.app import compression
+from backend.app.export import ChunkSink
 
 router = APIRouter()
 
@@ -33,6 +40,8 @@ def docx_to_csv_text_with_paragraph_fallback(file_like: BufferedReader, table_se
     If tables exist, use first table (or all).
     If no tables, attempt a paragraph fallback (lines).
     """
+    from docx import Document  # python-docx is loaded only when a DOCX is converted
+
     doc = Document(file_like)
 
     # 1) If tables exist, convert them
@@ -63,11 +72,148 @@ def docx_to_csv_text_with_paragraph_fallback(file_like: BufferedReader, table_se
         rows.append(",".join(escaped))
     return "\n".join(rows)
 
-def looks_like_csv(content: bytes, max_probe: int = 4096) -> bool:
-    """Try to decode a portion and heuristically decide whether it's CSV-like."""
+# -----------------------
+# Streaming DOCX table reader (word/document.xml parsed incrementally)
+# -----------------------
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_BODY, _W_TBL, _W_TR, _W_TC, _W_P, _W_T = (W_NS + t for t in ("body", "tbl", "tr", "tc", "p", "t"))
+_W_TAB, _W_BR, _W_GRIDSPAN, _W_VAL = W_NS + "tab", W_NS + "br", W_NS + "gridSpan", W_NS + "val"
+
+STREAM_BATCH_ROWS = 200  # CSV rows per yielded chunk
+
+
+def iter_docx_table_rows(path: str) -> Iterator[Tuple[int, List[str]]]:
+    """
+    Yield (table_index, cell_texts) for every row of every top-level table, in document
+    order, while word/document.xml is being parsed. Finished elements are cleared, so
+    memory does not grow with the document. Like python-docx, a horizontally merged cell
+    (gridSpan=n) is repeated n times; nested tables are skipped.
+    """
+    with zipfile.ZipFile(path) as zf, zf.open("word/document.xml") as xml:
+        body = None
+        depth = 0  # table nesting level
+        table_index = -1
+        row: List[str] = []
+        parts: List[str] = []
+        span = 1
+        in_cell = False
+        for event, el in ET.iterparse(xml, events=("start", "end")):
+            tag = el.tag
+            if event == "start":
+                if tag == _W_BODY:
+                    body = el
+                elif tag == _W_TBL:
+                    depth += 1
+                    if depth == 1:
+                        table_index += 1
+                elif depth == 1 and tag == _W_TR:
+                    row = []
+                elif depth == 1 and tag == _W_TC:
+                    parts, span, in_cell = [], 1, True
+                continue
+
+            if depth == 1 and in_cell:
+                if tag == _W_T:
+                    parts.append(el.text or "")
+                elif tag == _W_TAB:
+                    parts.append("\t")
+                elif tag in (_W_BR, _W_P):
+                    parts.append("\n")
+                elif tag == _W_GRIDSPAN:
+                    span = max(1, int(el.get(_W_VAL, "1") or 1))
+            if tag == _W_TC and depth == 1:
+                row.extend(["".join(parts).strip()] * span)
+                in_cell = False
+            elif tag == _W_TR and depth == 1:
+                yield table_index, row
+            elif tag == _W_TBL:
+                depth -= 1
+            if depth == 0 and body is not None and tag in (_W_TBL, _W_P):
+                body.clear()  # drop finished top-level blocks
+
+
+def _csv_lines(rows: Iterator[List[str]]) -> Iterator[bytes]:
+    """Encode rows with escape_csv_cell, STREAM_BATCH_ROWS rows per chunk."""
+    batch: List[str] = []
+    for cells in rows:
+        batch.append(",".join(escape_csv_cell(c) for c in cells))
+        if len(batch) >= STREAM_BATCH_ROWS:
+            yield ("\n".join(batch) + "\n").encode("utf-8")
+            batch = []
+    if batch:
+        yield ("\n".join(batch) + "\n").encode("utf-8")
+
+
+def stream_docx_csv(path: str) -> Iterator[bytes]:
+    """CSV of the first table, streamed; paragraph fallback when the document has no tables."""
+    # stop parsing as soon as the second table starts
+    rows = (cells for _, cells in itertools.takewhile(lambda t: t[0] == 0, iter_docx_table_rows(path)))
+    emitted = False
+    for chunk in _csv_lines(rows):
+        emitted = True
+        yield chunk
+    if not emitted:
+        with open(path, "rb") as fh:
+            yield docx_to_csv_text_with_paragraph_fallback(fh).encode("utf-8")
+
+
+def stream_docx_zip(path: str, stem: str) -> Iterator[bytes]:
+    """Every table as its own CSV member of a zip that is written (and yielded) as rows are read."""
+    sink = ChunkSink()
+    emitted = False
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for idx, group in itertools.groupby(iter_docx_table_rows(path), key=lambda t: t[0]):
+            emitted = True
+            with zf.open(f"{stem}_table{idx + 1}.csv", "w", force_zip64=True) as member:
+                for chunk in _csv_lines(cells for _, cells in group):
+                    member.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+        if not emitted:
+            with open(path, "rb") as fh:
+                zf.writestr(f"{stem}.csv", docx_to_csv_text_with_paragraph_fallback(fh))
+    yield sink.drain()
+
+
+def _stream_file(path: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _stream_decompressed(path: str, kind: str, filename: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """First member of a compressed CSV, decompressed on the fly (MAX_DECOMPRESSED_BYTES applies)."""
+    for _member, stream in compression.iter_members(path, kind, filename):
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _cleanup_after(chunks: Iterator[bytes], path: str) -> Iterator[bytes]:
+    try:
+        yield from chunks
+    finally:
+        try:
+            os.remove(path)
+        except Exception:
+            pass
+
+
+def looks_like_csv(content: bytes, max_probe: int = 4096, filename: str = "") -> bool:
+    """Try to decode a portion and heuristically decide whether it's CSV-like.
+    Compressed content (gzip/zip/zstd) is judged by its decompressed head."""
     if not content:
         return False
-    sample = content[:max_probe]
+    kind = compression.detect_compression(content[:8], filename)
+    sample = compression.decompress_head(content, kind, max_probe, filename) if kind else content[:max_probe]
+    if not sample:
+        return False
     try:
         text = sample.decode("utf-8")
     except UnicodeDecodeError:
@@ -78,48 +224,84 @@ def looks_like_csv(content: bytes, max_probe: int = 4096) -> bool:
     # require at least one newline and one delimiter (comma, semicolon, or tab)
     return ("\n" in text) and any(d in text for d in [",", ";", "\t"])
 
-@router.post("/api/convert-or-ingest", response_class=PlainTextResponse)
-async def convert_or_ingest(file: UploadFile = File(...)):
+@router.post("/api/convert-or-ingest")
+async def convert_or_ingest(file: UploadFile = File(...), tables: str = Form("first")):
     """
-    Accepts a CSV or DOCX. If CSV -> returns the CSV text back.
-    If DOCX -> converts first table (or paragraph fallback) to CSV and returns CSV text.
-    Response content-type is text/csv.
+    Accepts a CSV or DOCX and streams CSV back.
+    - CSV (also .gz/.zip/.zst, first member) -> the CSV bytes, streamed
+    - DOCX, tables=first -> CSV of the first table (or paragraph fallback), text/csv,
+      emitted while the document XML is being parsed
+    - DOCX, tables=all   -> a zip with one CSV member per table, written as a stream
     """
     filename = file.filename or "uploaded"
     content_type = file.content_type or ""
+    if tables not in ("first", "all"):
+        raise HTTPException(status_code=400, detail="tables must be 'first' or 'all'")
 
-    content = await file.read()
-    size = len(content)
-    if size == 0:
-        raise HTTPException(status_code=400, detail="Empty file uploaded.")
-    if size > MAX_DOCX_SIZE:
+    # spool to a temp file (DOCX needs random access; the response outlives the request body)
+    suffix = "." + (filename.split(".")[-1] if "." in filename else "tmp")
+    size = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp_path = tmp.name
+        while True:
+            part = await file.read(1024 * 1024)
+            if not part:
+                break
+            size += len(part)
+            if size > MAX_DOCX_SIZE:
+                break
+            tmp.write(part)
+    if size == 0 or size > MAX_DOCX_SIZE:
+        os.remove(tmp_path)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty file uploaded.")
         raise HTTPException(status_code=413, detail=f"File too large. Max {MAX_DOCX_SIZE} bytes.")
 
+    with open(tmp_path, "rb") as fh:
+        head = fh.read(4096)
     lower = filename.lower()
+    stem = os.path.basename(filename).rsplit(".", 1)[0]
 
     # 1) Strong DOCX detection: check for ZIP header + extension or known content-type
-    is_zip_like = content.startswith(b'PK')
+    is_zip_like = head.startswith(b'PK')
     docx_ext = lower.endswith(".docx")
     docx_ct = content_type in ALLOWED_DOCX_CONTENT_TYPES
     if (docx_ext or docx_ct) and is_zip_like:
+        if tables == "all":
+            chunks = stream_docx_zip(tmp_path, stem)
+            media_type, out_name = "application/zip", f"{stem}_tables.zip"
+        else:
+            chunks = stream_docx_csv(tmp_path)
+            media_type, out_name = "text/csv", f"{stem}.csv"
+        # pull the first chunk now so a broken document still gets a 400 instead of a cut-off stream
         try:
-            bio = BytesIO(content)
-            csv_text = docx_to_csv_text_with_paragraph_fallback(bio, table_selection="first")
+            first = next(chunks, b"")
         except Exception as e:
+            os.remove(tmp_path)
             raise HTTPException(status_code=400, detail=f"DOCX conversion failed: {e}")
-        return PlainTextResponse(content=csv_text, media_type="text/csv", headers={
-            "Content-Disposition": f'attachment; filename="{filename.rsplit(".",1)[0]}.csv"'
+        return StreamingResponse(_cleanup_after(itertools.chain([first], chunks), tmp_path), media_type=media_type, headers={
+            "Content-Disposition": f'attachment; filename="{out_name}"'
         })
 
-    # 2) If it looks like CSV (heuristic), return as text
-    if looks_like_csv(content):
-        try:
-            csv_text = content.decode("utf-8")
-        except UnicodeDecodeError:
-            csv_text = content.decode("latin-1")
-        return PlainTextResponse(content=csv_text, media_type="text/csv", headers={
-            "Content-Disposition": f'attachment; filename="{filename if filename.endswith('.csv') else 'data.csv'}"'
+    # 2) If it looks like CSV (heuristic, decompressed head for .gz/.zip/.zst), stream it back
+    kind = compression.detect_compression(head[:8], filename)
+    probe = head
+    if kind:
+        # archives need their central directory to be probed; the input is capped at MAX_DOCX_SIZE
+        with open(tmp_path, "rb") as fh:
+            probe = fh.read()
+    if looks_like_csv(probe, filename=filename):
+        if kind:
+            members = compression.member_names(tmp_path, kind, filename)
+            filename = members[0] if members else "data.csv"
+            chunks = _stream_decompressed(tmp_path, kind, file.filename or "")
+        else:
+            chunks = _stream_file(tmp_path)
+        out_name = os.path.basename(filename) if filename.endswith(".csv") else "data.csv"
+        return StreamingResponse(_cleanup_after(chunks, tmp_path), media_type="text/csv", headers={
+            "Content-Disposition": f'attachment; filename="{out_name}"'
         })
 
     # 3) Not recognized
-    raise HTTPException(status_code=415, detail=f"Unsupported or unrecognized file type: {content_type} / {filename}")
\ No newline at end of file
+    os.remove(tmp_path)
+    raise HTTPException(status_code=415, detail=f"Unsupported or unrecognized file type: {content_type} / {filename}")
@@ -0,0 +1,234 @@
+# backend/loadtest.py
+"""
+Load-test harness for /api/upload and /api/process.
+
+Runs the FastAPI app in-process against the fake supabase client
+(backend/app/services/fake_supabase.py), so nothing touches the real project.
+For every concurrency level it drives concurrent uploads of generated CSV files
+(optionally followed by /api/process) and reports p50/p95/p99 latency,
+rows/sec, error count and server RSS.
+
+Usage (from the repo root):
+    python -m backend.loadtest --dataset airline --rows 5000 --concurrency 1,4,16 --requests 32
+    python -m backend.loadtest --latency-ms 20 --error-rate 0.01 --process
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import random
+import resource
+import sys
+import time
+import types
+from typing import Any, Dict, List, Optional
+
+from backend.app.services.fake_supabase import FakeSupabase
+
+
+# -----------------------
+# Fake client wiring
+# -----------------------
+def install_fake_client(fake: FakeSupabase) -> None:
+    """
+    Make `from backend.app.services.supabase_client import sb` resolve to the fake.
+    Must run before backend.main (or any ETL module) is imported.
+    """
+    mod = types.ModuleType("backend.app.services.supabase_client")
+    mod.sb = fake
+    # the module-level settings other code reads (startup.report, key_cache.backend_identity)
+    mod.CLIENT_INIT_SECONDS = None
+    mod.SUPABASE_BACKEND = "fake"
+    mod.SUPABASE_URL = f"fake://{id(fake):x}"
+    sys.modules["backend.app.services.supabase_client"] = mod
+
+
+# -----------------------
+# Generated input files
+# -----------------------
+def _airline_row(i: int) -> List[Any]:
+    return [f"A{i:05d}", f"airline {i}", random.choice(["Star Alliance", "oneworld", "SkyTeam", ""])]
+
+
+def _airport_row(i: int) -> List[Any]:
+    return [f"P{i:04d}", f"Airport {i}", f"City {i % 300}", random.choice(["USA", "UK", "Philippines", "Japan"])]
+
+
+def _flight_row(i: int) -> List[Any]:
+    return [f"FL{i:06d}", f"P{i % 500:04d}", f"P{(i * 7) % 500:04d}", random.choice(["A320", "B737", "A330"])]
+
+
+def _passenger_row(i: int) -> List[Any]:
+    return [f"PX{i:06d}", f"Passenger {i}", f"p{i}@example.com", random.choice(["Gold", "Silver", ""])]
+
+
+def _travelagency_row(i: int) -> List[Any]:
+    return [f"AG{i % 50:03d}", f"Agency {i % 50}", f"BK{i:07d}", f"FL{i % 1000:06d}",
+            f"{random.uniform(50, 2000):.2f}", "USD", f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}"]
+
+
+def _corporatesales_row(i: int) -> List[Any]:
+    return [f"INV{i:07d}", f"TX{i:07d}", f"{random.uniform(100, 9000):.2f}", "USD", f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}"]
+
+
+GENERATORS = {
+    "airline": (["airlinekey", "airlinename", "alliance"], _airline_row),
+    "airport": (["airportkey", "airportname", "city", "country"], _airport_row),
+    "flight": (["flightkey", "originairportkey", "destinationairportkey", "aircrafttype"], _flight_row),
+    "passenger": (["passengerkey", "fullname", "email", "loyaltystatus"], _passenger_row),
+    "travelagency": (["agencykey", "agencyname", "bookingid", "flightnumber", "saleamount", "currency", "saledate"], _travelagency_row),
+    "corporatesales": (["invoice", "transactionid", "saleamount", "currency", "saledate"], _corporatesales_row),
+}
+
+
+def generate_csv(dataset: str, rows: int, start: int = 0) -> bytes:
+    header, make_row = GENERATORS[dataset]
+    lines = [",".join(header)]
+    for i in range(start, start + rows):
+        lines.append(",".join(str(v) for v in make_row(i)))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# -----------------------
+# Measurement helpers
+# -----------------------
+def current_rss_bytes() -> int:
+    """Resident set size of this process (the in-process server)."""
+    try:
+        with open("/proc/self/status", "r") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except Exception:
+        pass
+    # fallback: peak RSS (KiB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+# -----------------------
+# Driver
+# -----------------------
+async def _one_request(client, dataset: str, payload: bytes, rows: int, do_process: bool, results: Dict[str, Any]) -> None:
+    t0 = time.perf_counter()
+    resp = await client.post(
+        "/api/upload",
+        files={"file": (f"loadtest_{dataset}.csv", payload, "text/csv")},
+        data={"dataset": dataset},
+    )
+    results["upload_lat"].append(time.perf_counter() - t0)
+    if resp.status_code != 200:
+        results["errors"] += 1
+        return
+    results["rows"] += rows
+    upload_id = resp.json().get("upload_id")
+    if not do_process:
+        return
+    t1 = time.perf_counter()
+    presp = await client.post("/api/process", data={"upload_id": str(upload_id), "dataset": dataset})
+    results["process_lat"].append(time.perf_counter() - t1)
+    if presp.status_code != 200:
+        results["errors"] += 1
+
+
+async def run_level(app, dataset: str, rows: int, concurrency: int, requests: int, do_process: bool) -> Dict[str, Any]:
+    import httpx
+
+    payloads = [generate_csv(dataset, rows, start=i * rows) for i in range(min(requests, 8))]
+    results: Dict[str, Any] = {"upload_lat": [], "process_lat": [], "rows": 0, "errors": 0}
+    sem = asyncio.Semaphore(concurrency)
+    rss_peak = current_rss_bytes()
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+        async def guarded(i: int):
+            nonlocal rss_peak
+            async with sem:
+                await _one_request(client, dataset, payloads[i % len(payloads)], rows, do_process, results)
+                rss_peak = max(rss_peak, current_rss_bytes())
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(guarded(i) for i in range(requests)))
+        wall = time.perf_counter() - t0
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": results["errors"],
+        "wall_s": wall,
+        "rows_per_s": results["rows"] / wall if wall > 0 else 0.0,
+        "upload_p50": percentile(results["upload_lat"], 50),
+        "upload_p95": percentile(results["upload_lat"], 95),
+        "upload_p99": percentile(results["upload_lat"], 99),
+        "process_p50": percentile(results["process_lat"], 50),
+        "process_p95": percentile(results["process_lat"], 95),
+        "process_p99": percentile(results["process_lat"], 99),
+        "rss_mb": rss_peak / (1024 * 1024),
+    }
+
+
+def print_report(rows: List[Dict[str, Any]], do_process: bool) -> None:
+    cols = ["concurrency", "requests", "errors", "rows_per_s", "upload_p50", "upload_p95", "upload_p99"]
+    if do_process:
+        cols += ["process_p50", "process_p95", "process_p99"]
+    cols += ["rss_mb"]
+    print("  ".join(f"{c:>12}" for c in cols))
+    for r in rows:
+        cells = []
+        for c in cols:
+            v = r[c]
+            if c.endswith(("_p50", "_p95", "_p99")):
+                cells.append(f"{v * 1000:>10.1f}ms")
+            elif isinstance(v, float):
+                cells.append(f"{v:>12.1f}")
+            else:
+                cells.append(f"{v:>12}")
+        print("  ".join(cells))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Load test /api/upload and /api/process against a fake supabase client.")
+    ap.add_argument("--dataset", default="airline", choices=sorted(GENERATORS))
+    ap.add_argument("--rows", type=int, default=2000, help="rows per generated file")
+    ap.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    ap.add_argument("--requests", type=int, default=16, help="uploads per concurrency level")
+    ap.add_argument("--latency-ms", type=float, default=5.0, help="injected latency per table/storage call")
+    ap.add_argument("--rpc-latency-ms", type=float, default=None, help="injected latency per rpc call (defaults to --latency-ms)")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="extra uniform random latency per call")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="probability that a client call fails")
+    ap.add_argument("--process", action="store_true", help="also call /api/process after each upload")
+    ap.add_argument("--seed", type=int, default=2638)
+    args = ap.parse_args(argv)
+
+    random.seed(args.seed)
+    fake = FakeSupabase(
+        latency=args.latency_ms / 1000.0,
+        rpc_latency=None if args.rpc_latency_ms is None else args.rpc_latency_ms / 1000.0,
+        jitter=args.jitter_ms / 1000.0,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    install_fake_client(fake)
+    os.environ.setdefault("STORE_UPLOADS", "false")
+
+    from backend.main import app  # imported after the fake is installed
+
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    report = []
+    for level in levels:
+        fake.reset()
+        report.append(asyncio.run(run_level(app, args.dataset, args.rows, level, args.requests, args.process)))
+    print_report(report, args.process)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,34 +1,49 @@
+from backend.app import startup
+
 import os
 import tempfile
 import shutil
 import time
 import csv
+import json
+import itertools
 import traceback
-from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
-from fastapi.responses import JSONResponse, PlainTextResponse
-from fastapi.exceptions import RequestValidationError
-from starlette.exceptions import HTTPException as StarletteHTTPException
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+with startup.timed("fastapi"):
+    from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+    from fastapi.concurrency import run_in_threadpool
+    from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+    from fastapi.exceptions import RequestValidationError
+    from starlette.exceptions import HTTPException as StarletteHTTPException
 from dotenv import load_dotenv
 from datetime import datetime, timezone
 from io import BytesIO, StringIO
 
-# DOCX helper
-from docx import Document
-
 # Load .env
 load_dotenv()
 
-# ETL modules and supabase client (your project modules)
-from backend.app.etl import (
-    airlines_etl,
-    passengers_etl,
-    flights_etl,
-    airports_etl,
-    travelagency_etl,
-    corporatesales_etl,
-)
-from backend.app.services.supabase_client import sb
+# Project modules. ETL modules (pandas), python-docx, pyarrow/openpyxl and the database
+# client are all loaded on first use; see backend/app/etl/__init__.py and /api/startup.
+with startup.timed("app"):
+    from backend.app import etl
+    from backend.app.services.supabase_client import sb
+    from backend.app.services.sinks import get_sink
+    from backend.app.services import key_cache
+    from backend.app.services.throttle import throttle
+    from backend.app.services import spool
+    from backend.app.staging import build_chunk_records, iter_staged_rows, row_key
+    from backend.app.datasets import DATASET_MAP, canonical_dataset
+    from backend.app import upload_sessions
+    from backend.app import compression
+    from backend.app import readers
+    from backend.app import export
+    from backend.app import admission
+    from backend.app import promotion
+    from backend.app import pipeline
+    from backend.app.promotion import parse_rpc_count
+    from backend.app.parsers import detect_entity_from_headers
+with startup.timed("convert_router"):
+    from backend.convert_router import router as convert_router, iter_docx_table_rows
 
 # FastAPI + CORS
 from fastapi.middleware.cors import CORSMiddleware
@@ -44,6 +59,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# /api/convert-or-ingest (DOCX/CSV -> streamed CSV or zip of tables)
+app.include_router(convert_router)
+
 # -----------------------
 # Global exception handlers (return JSON consistently)
 # -----------------------
@@ -53,6 +71,7 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"status": "error", "message": exc.detail if exc.detail else "HTTP error"},
+        headers=getattr(exc, "headers", None),
     )
 
 @app.exception_handler(RequestValidationError)
@@ -95,126 +114,64 @@ async def list_routes():
         routes.append({"path": path, "methods": methods, "name": getattr(r, "name", "")})
     return JSONResponse({"status": "ok", "routes": routes})
 
-# dataset -> cleaned table, rpc, module (single-run rpc)
-DATASET_MAP = {
-    "airline": {
-        "cleaned_table": "cleaned_airlines",
-        "rpc": "process_cleaned_airlines",
-        "etl_module": airlines_etl,
-    },
-    "airlines": {
-        "cleaned_table": "cleaned_airlines",
-        "rpc": "process_cleaned_airlines",
-        "etl_module": airlines_etl,
-    },
-    "passenger": {
-        "cleaned_table": "cleaned_passengers",
-        "rpc": "process_cleaned_passengers",
-        "etl_module": passengers_etl,
-    },
-    "passengers": {
-        "cleaned_table": "cleaned_passengers",
-        "rpc": "process_cleaned_passengers",
-        "etl_module": passengers_etl,
-    },
-    "flight": {
-        "cleaned_table": "cleaned_flights",
-        "rpc": "process_cleaned_flights",
-        "etl_module": flights_etl,
-    },
-    "flights": {
-        "cleaned_table": "cleaned_flights",
-        "rpc": "process_cleaned_flights",
-        "etl_module": flights_etl,
-    },
-    "airport": {
-        "cleaned_table": "cleaned_airports",
-        "rpc": "process_cleaned_airports",
-        "etl_module": airports_etl,
-    },
-    "airports": {
-        "cleaned_table": "cleaned_airports",
-        "rpc": "process_cleaned_airports",
-        "etl_module": airports_etl,
-    },
-    "travelagency": {
-        "cleaned_table": "cleaned_travelagency",
-        "rpc": "process_cleaned_travelagency",
-        "etl_module": travelagency_etl,
-    },
-    "travel_agency": {
-        "cleaned_table": "cleaned_travelagency",
-        "rpc": "process_cleaned_travelagency",
-        "etl_module": travelagency_etl,
-    },
-    "corporatesales": {
-        "cleaned_table": "cleaned_corporatesales",
-        "rpc": "process_cleaned_corporatesales",
-        "etl_module": corporatesales_etl,
-    },
-    "corporate_sales": {
-        "cleaned_table": "cleaned_corporatesales",
-        "rpc": "process_cleaned_corporatesales",
-        "etl_module": corporatesales_etl,
-    },
+@app.get("/api/startup")
+async def startup_report():
+    """Import / boot times and which heavy dependencies have been loaded so far."""
+    return JSONResponse({"status": "ok", **startup.report()})
+
+@app.get("/api/admission")
+async def admission_stats():
+    """Upload admission control: active requests, memory in use, queue lengths, rejections."""
+    return JSONResponse({"status": "ok", **admission.controller.stats()})
+
+
+@app.get("/api/throttle")
+async def throttle_stats():
+    """Database call throttle: current concurrency limit, retry tokens and throttle/retry counters."""
+    return JSONResponse({"status": "ok", **throttle.stats()})
+
+# entity -> entities whose dim tables it references (see REFERENCES); /api/pipeline
+# promotes parents before their children. Keys are the canonical DATASET_MAP names.
+DATASET_DEPENDENCIES = {
+    "airline": [],
+    "airport": [],
+    "passenger": [],
+    "flight": ["airport", "airline"],
+    "travelagency": ["flight", "passenger"],
+    "corporatesales": [],
 }
 
+
 # config (env overrides)
 BATCH_INSERT_SIZE = int(os.getenv("BATCH_INSERT_SIZE", "200"))
 MAX_FILE_BYTES = int(os.getenv("MAX_FILE_BYTES", str(10 * 1024 * 1024)))  # default 10MB
 STORE_UPLOADS = os.getenv("STORE_UPLOADS", "false").lower() in ("1", "true", "yes")
+# rows per staging_raw chunk record, and chunk records per insert request
+STAGING_CHUNK_ROWS = int(os.getenv("STAGING_CHUNK_ROWS", "500"))
+STAGING_INSERT_BATCH = int(os.getenv("STAGING_INSERT_BATCH", "10"))
+# rows read, staged, cleaned and written per step of the fused upload path (process=true)
+FUSED_SLICE_ROWS = int(os.getenv("FUSED_SLICE_ROWS", str(STAGING_CHUNK_ROWS * STAGING_INSERT_BATCH)))
+# rows per keyset page for /api/export
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
 
 # -----------------------
 # Helpers
 # -----------------------
 def batch_insert(table_name: str, records: List[Dict[str, Any]], batch_size: int = BATCH_INSERT_SIZE) -> int:
+    # routed through the configured storage sink (STORAGE_SINK=supabase|pgcopy)
     if not records:
         return 0
-    inserted = 0
-    for i in range(0, len(records), batch_size):
-        chunk = records[i : i + batch_size]
-        res = sb.table(table_name).insert(chunk).execute()
-        if isinstance(res, dict) and res.get("error"):
-            raise RuntimeError(f"Error inserting into {table_name}: {res.get('error')}")
-        if hasattr(res, "error") and res.error:
-            raise RuntimeError(f"Error inserting into {table_name}: {res.error}")
-        inserted += len(chunk)
-    return inserted
+    return get_sink().insert(table_name, records, batch_size=batch_size)
 
 
-def parse_rpc_count(res) -> int:
-    try:
-        if hasattr(res, "data"):
-            d = res.data
-            if isinstance(d, list) and d:
-                first = d[0]
-                if isinstance(first, dict):
-                    for v in first.values():
-                        if isinstance(v, int):
-                            return v
-                if isinstance(first, int):
-                    return first
-            if isinstance(d, int):
-                return d
-    except Exception:
-        pass
-    if isinstance(res, dict):
-        if "data" in res:
-            d = res["data"]
-            if isinstance(d, list) and d:
-                first = d[0]
-                if isinstance(first, dict):
-                    for v in first.values():
-                        if isinstance(v, int):
-                            return v
-                if isinstance(first, int):
-                    return first
-            if isinstance(d, int):
-                return d
-        for k in ("count", "rows_affected", "result"):
-            if k in res and isinstance(res[k], int):
-                return res[k]
-    return 0
+def batch_upsert(table_name: str, records: List[Dict[str, Any]], on_conflict: str = "row_key",
+                 batch_size: int = BATCH_INSERT_SIZE, ignore_duplicates: bool = False) -> int:
+    # idempotent writes keyed on a deterministic row identity: safe to retry or replay
+    if not records:
+        return 0
+    return get_sink().upsert(table_name, records, on_conflict=on_conflict, batch_size=batch_size,
+                             ignore_duplicates=ignore_duplicates)
+
 
 # -----------------------
 # Validation: required fields per dataset (upload-time validation)
@@ -240,6 +197,63 @@ REQUIRED_FIELDS = {
     "corporate_sales": [["invoice"], ["transactionid"], ["saleamount", "sale_amount", "saledate", "sale_date"]],
 }
 
+# Foreign keys checked against the dimension key cache (backend/app/services/key_cache.py).
+# Each entry: (OR-group of row columns holding the key, dim table). An orphan does not make the
+# row invalid (the dimension may simply be loaded later); it is flagged in the chunk's
+# "references" vector and counted as orphan_rows.
+REFERENCES = {
+    "flight": [(["originairportkey", "origin_airportkey", "origin"], "dimairport"),
+               (["destinationairportkey", "destination_airportkey", "destination"], "dimairport")],
+    "flights": [(["originairportkey", "origin"], "dimairport"),
+                (["destinationairportkey", "destination"], "dimairport")],
+    "travelagency": [(["flightnumber", "flight_number"], "dimflight")],
+    "travel_agency": [(["flightnumber", "flight_number"], "dimflight")],
+}
+
+# Allowed insert columns per cleaned_table to avoid sending unknown keys to supabase
+# (keeps behavior safe when ETL dictionaries contain extra keys); also the canonical columns for /api/preview
+ALLOWED_COLUMNS = {
+    "cleaned_airlines": {"airlinekey", "airlinename", "alliance", "rawjson", "upload_id"},
+    "cleaned_airports": {"airportkey", "airportname", "city", "country", "rawjson", "upload_id"},
+    "cleaned_flights": {"flightkey", "originairportkey", "destinationairportkey", "aircrafttype", "rawjson", "upload_id"},
+    "cleaned_passengers": {"passengerkey", "fullname", "email", "loyaltystatus", "rawjson", "upload_id"},
+    "cleaned_travelagency": {"agencykey", "agencyname", "bookingid", "passengername", "flightnumber", "saleamount", "currency", "saledate", "rawjson", "upload_id"},
+    "cleaned_corporatesales": {"invoice", "transactionid", "saleamount", "currency", "saledate", "rawjson", "upload_id"},
+}
+
+# header variants the ETL modules rename to canonical columns (beyond dropping underscores)
+COLUMN_ALIASES = {
+    "cleaned_airlines": {"airline": "airlinename", "name": "airlinename"},
+    "cleaned_airports": {"name": "airportname", "airport": "airportname"},
+    "cleaned_flights": {"flight_number": "flightkey", "flight": "flightkey", "flight_no": "flightkey",
+                        "origin": "originairportkey", "originairport": "originairportkey",
+                        "destination": "destinationairportkey", "destinationairport": "destinationairportkey"},
+    "cleaned_passengers": {"passenger_id": "passengerkey", "id": "passengerkey", "name": "fullname"},
+    "cleaned_travelagency": {"agency_id": "agencykey", "agency": "agencyname", "booking": "bookingid",
+                             "amount": "saleamount", "date": "saledate"},
+    "cleaned_corporatesales": {"transaction_id": "transactionid", "amount": "saleamount", "date": "saledate"},
+}
+
+
+def map_canonical_columns(dataset_key: str, headers: List[str]) -> Dict[str, Optional[str]]:
+    """Map normalized headers to the dataset's canonical cleaned columns (None = not mapped)."""
+    table = DATASET_MAP[dataset_key]["cleaned_table"]
+    canonical = ALLOWED_COLUMNS.get(table, set()) - {"rawjson", "upload_id"}
+    aliases = COLUMN_ALIASES.get(table, {})
+    mapping: Dict[str, Optional[str]] = {}
+    for h in headers:
+        squashed = h.replace("_", "")
+        if h in canonical:
+            mapping[h] = h
+        elif h in aliases:
+            mapping[h] = aliases[h]
+        elif squashed in canonical:
+            mapping[h] = squashed
+        else:
+            mapping[h] = None
+    return mapping
+
+
 def validate_required_fields(dataset_key: str, row: Dict[str, Any]) -> Optional[str]:
     """
     Return None if row is valid, otherwise return a short error message describing missing required fields.
@@ -269,6 +283,30 @@ def validate_required_fields(dataset_key: str, row: Dict[str, Any]) -> Optional[
         readable.append("(" + " OR ".join(g) + ")")
     return "missing required fields: " + ", ".join(readable)
 
+def find_orphan_references(dataset_key: str, row: Dict[str, Any]) -> Optional[str]:
+    """
+    Return None if every REFERENCES key of the row exists in its dimension (or cannot be
+    checked), otherwise a short message naming the orphan keys. Lookups hit the in-memory
+    key cache only.
+    """
+    refs = REFERENCES.get((dataset_key or "").lower())
+    if not refs or not key_cache.KEY_CACHE_ENABLED:
+        return None
+    cache = key_cache.get_key_cache()
+    orphans = []
+    for group, dim in refs:
+        for col in group:
+            v = row.get(col)
+            if v is None or str(v).strip() == "":
+                continue
+            if cache.contains(dim, v) is False:
+                orphans.append(f"{col}={v} not in {dim}")
+            break
+    if not orphans:
+        return None
+    return "orphan references: " + ", ".join(orphans)
+
+
 def call_rpc_once(rpc_name: str, p_upload_id: Optional[int] = None) -> int:
     if p_upload_id is None:
         res = sb.rpc(rpc_name, {"p_upload_id": None}).execute()
@@ -342,6 +380,8 @@ def escape_csv_cell(cell_text: str) -> str:
 
 
 def docx_to_csv_text_with_fallback(fileobj: BytesIO, table_selection: str = "first") -> str:
+    from docx import Document  # python-docx is only needed for DOCX uploads
+
     doc = Document(fileobj)
 
     if doc.tables:
@@ -375,82 +415,384 @@ def docx_to_csv_text_with_fallback(fileobj: BytesIO, table_selection: str = "fir
 # -----------------------
 # Utility: parse CSV text into list[dict]
 # -----------------------
-def parse_csv_text_to_dicts(csv_text: str) -> List[Dict[str, Any]]:
+def sniff_delimiter(sample: str) -> str:
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t").delimiter
+    except Exception:
+        return ","
+
+
+def parse_csv_text_to_dicts(csv_text: str, delimiter: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Uses csv.DictReader to parse CSV text into list of dicts.
     Trims keys and values and normalizes empty strings to None.
+    Pass `delimiter` to skip sniffing (e.g. when parsing later segments of one file).
     """
     fh = StringIO(csv_text)
-    # Detect delimiter (prefer comma; but try to infer)
-    sample = fh.read(2048)
-    fh.seek(0)
-    dialect = None
-    try:
-        sniffer = csv.Sniffer()
-        dialect = sniffer.sniff(sample, delimiters=",;\t")
-    except Exception:
-        dialect = csv.get_dialect("excel")
-    reader = csv.DictReader(fh, dialect=dialect)
+    if delimiter:
+        reader = csv.DictReader(fh, delimiter=delimiter)
+    else:
+        # Detect delimiter (prefer comma; but try to infer)
+        sample = fh.read(2048)
+        fh.seek(0)
+        dialect = None
+        try:
+            sniffer = csv.Sniffer()
+            dialect = sniffer.sniff(sample, delimiters=",;\t")
+        except Exception:
+            dialect = csv.get_dialect("excel")
+        reader = csv.DictReader(fh, dialect=dialect)
     rows: List[Dict[str, Any]] = []
     for raw_row in reader:
-        row = {}
-        for k, v in raw_row.items():
-            if k is None:
-                continue
-            key = k.strip().lower().replace(" ", "_")
-            if isinstance(v, str):
-                v2 = v.strip()
-                if v2 == "" or v2.lower() == "nan":
-                    row[key] = None
-                else:
-                    row[key] = v2
-            else:
-                row[key] = v
-        # skip completely-empty rows
-        if any(v is not None and v != "" for v in row.values()):
+        row = _normalize_csv_row(raw_row)
+        if row is not None:
             rows.append(row)
     return rows
 
 
+def _normalize_csv_row(raw_row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Normalize keys/values of one DictReader row; None for completely-empty rows."""
+    row = {}
+    for k, v in raw_row.items():
+        if k is None:
+            continue
+        key = k.strip().lower().replace(" ", "_")
+        if isinstance(v, str):
+            v2 = v.strip()
+            if v2 == "" or v2.lower() == "nan":
+                row[key] = None
+            else:
+                row[key] = v2
+        else:
+            row[key] = v
+    # skip completely-empty rows
+    if any(v is not None and v != "" for v in row.values()):
+        return row
+    return None
+
+
+def iter_csv_stream_to_dicts(text_stream, delimiter: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming variant of parse_csv_text_to_dicts for file-like text (e.g. a decompressing
+    reader): the delimiter is sniffed from the first lines, then rows are yielded one by one.
+    """
+    head_lines: List[str] = []
+    if not delimiter:
+        size = 0
+        while size < 2048:
+            line = text_stream.readline()
+            if not line:
+                break
+            head_lines.append(line)
+            size += len(line)
+        delimiter = sniff_delimiter("".join(head_lines))
+    reader = csv.DictReader(itertools.chain(head_lines, text_stream), delimiter=delimiter)
+    for raw_row in reader:
+        row = _normalize_csv_row(raw_row)
+        if row is not None:
+            yield row
+
+
+# -----------------------
+# Staging helper: validate parsed rows and write them as chunked staging_raw records
+# -----------------------
+def stage_parsed_rows(
+    dataset_key: str,
+    filename: str,
+    run_id: int,
+    parsed_rows: List[Dict[str, Any]],
+    file_pointer: Optional[str] = None,
+    first_chunk_index: int = 0,
+    first_row_offset: int = 0,
+) -> Tuple[int, int, int, int]:
+    """
+    Validate rows, log invalid ones to import_errors, and stage ALL rows (valid or not)
+    as chunk records of STAGING_CHUNK_ROWS rows each. The validation result of every row
+    travels in the chunk's "validation" vector, orphan foreign keys in its "references" vector.
+    Returns (staged_rows, error_rows, staged_chunks, orphan_rows).
+    """
+    validation_map: List[Optional[str]] = []  # parallel to parsed_rows: None or error string
+    reference_map: List[Optional[str]] = []  # parallel to parsed_rows: None or orphan message
+    error_count = 0
+    for r in parsed_rows:
+        err = validate_required_fields(dataset_key, r)
+        validation_map.append(err)
+        reference_map.append(find_orphan_references(dataset_key, r))
+        if not err:
+            continue
+        bad = dict(r)
+        bad["_upload_validation_error"] = err
+        try:
+            sb.table("import_errors").insert({
+                "sourcetable": "staging_raw",
+                "sourceid": None,
+                "raw": bad,
+                "errormessage": err,
+                "createdat": datetime.now(timezone.utc).isoformat()
+            }).execute()
+            error_count += 1
+        except Exception as _e:
+            # log but do not fail the whole upload
+            print("Warning: could not insert import_errors row:", str(_e))
+
+    chunks = build_chunk_records(
+        dataset_key,
+        run_id,
+        filename,
+        parsed_rows,
+        validation_map,
+        references=reference_map,
+        file_pointer=file_pointer,
+        chunk_rows=STAGING_CHUNK_ROWS,
+        first_chunk_index=first_chunk_index,
+        first_row_offset=first_row_offset,
+    )
+    # a chunk that already exists (retried batch) is left as it is
+    batch_upsert("staging_raw", chunks, batch_size=STAGING_INSERT_BATCH, ignore_duplicates=True)
+    orphan_count = sum(1 for o in reference_map if o)
+    return len(parsed_rows), error_count, len(chunks), orphan_count
+
+
+# -----------------------
+# Streamed uploads (compressed archives, XLSX): stage rows in batches as they are read
+# -----------------------
+def new_stage_state(upload_id: int) -> Dict[str, Any]:
+    return {"upload_id": upload_id, "chunk_index": 0, "staged_rows": 0, "error_rows": 0, "staged_chunks": 0, "orphan_rows": 0}
+
+
+def stage_row_stream(
+    dataset_key: str,
+    filename: str,
+    state: Dict[str, Any],
+    rows: Iterator[Dict[str, Any]],
+    file_pointer: Optional[str] = None,
+) -> int:
+    """
+    Stage an iterator of normalized rows in batches of STAGING_CHUNK_ROWS * STAGING_INSERT_BATCH,
+    continuing the chunk numbering kept in `state` (see new_stage_state). Returns rows staged.
+    """
+    batch_rows = STAGING_CHUNK_ROWS * STAGING_INSERT_BATCH
+    before = state["staged_rows"]
+
+    def flush(batch: List[Dict[str, Any]]) -> None:
+        staged, errors, chunks, orphans = stage_parsed_rows(
+            dataset_key, filename, state["upload_id"], batch,
+            file_pointer=file_pointer if state["chunk_index"] == 0 else None,
+            first_chunk_index=state["chunk_index"],
+            first_row_offset=state["staged_rows"],
+        )
+        state["chunk_index"] += chunks
+        state["staged_rows"] += staged
+        state["error_rows"] += errors
+        state["staged_chunks"] += chunks
+        state["orphan_rows"] += orphans
+
+    batch: List[Dict[str, Any]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_rows:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return state["staged_rows"] - before
+
+
+def _member_dataset(member: str, headers: List[str], default: str, single: bool) -> str:
+    """Dataset of one archive member: the form's dataset for single-member files, else name/headers."""
+    if single:
+        return default
+    base = os.path.basename(member).lower().replace("_", "").replace("-", "")
+    for key in DATASET_MAP:
+        if key in base:
+            return key
+    detected = detect_entity_from_headers(headers)
+    if detected in DATASET_MAP:
+        return detected
+    return default
+
+
+def stage_compressed_file(path: str, kind: str, filename: str, dataset_key: str, run_id: int) -> Dict[str, Any]:
+    """
+    Decompress `path` member by member and stage rows as they are parsed. A zip bundle
+    may carry one member per dataset; every dataset other than `dataset_key` gets its
+    own etl_runs row / upload_id.
+    Raises compression.DecompressionLimitError past MAX_DECOMPRESSED_BYTES.
+    """
+    runs: Dict[str, Dict[str, Any]] = {dataset_key: new_stage_state(run_id)}
+    members: List[Dict[str, Any]] = []
+
+    single = len(compression.member_names(path, kind, filename)) <= 1
+    for member, stream in compression.iter_members(path, kind, filename):
+        text = compression.open_text(stream)
+        if readers.detect_format(member) == "ndjson":
+            rows_iter = (r for r in map(_normalize_csv_row, readers.iter_ndjson_lines(text)) if r is not None)
+        else:
+            rows_iter = iter_csv_stream_to_dicts(text)
+        first = next(rows_iter, None)
+        if first is None:
+            members.append({"member": member, "dataset": None, "staged_rows": 0})
+            continue
+        ds = _member_dataset(member, list(first.keys()), dataset_key, single)
+        if ds not in runs:
+            runs[ds] = new_stage_state(insert_etl_run(f"upload_{ds}", "staged", note=f"{filename}:{member}"))
+        # no file_pointer: /api/process must use the staged rows, not re-read the archive
+        staged = stage_row_stream(ds, filename, runs[ds], itertools.chain([first], rows_iter))
+        members.append({"member": member, "dataset": ds, "upload_id": runs[ds]["upload_id"], "staged_rows": staged})
+
+    for ds, st in runs.items():
+        if ds != dataset_key:
+            safe_update_etl_run(st["upload_id"], "staged", note=f"staged_rows={st['staged_rows']} error_rows={st['error_rows']}")
+    return {"runs": runs, "compression": kind, "members": members}
+
+
+def stage_table_file(path: str, fmt: str, filename: str, dataset_key: str, run_id: int, sheet: Optional[str] = None,
+                     file_pointer: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Stage an xlsx / parquet / arrow / ndjson file (see readers.detect_format), reading it
+    row by row (xlsx), by row group (parquet) or by record batch (arrow). Values keep their
+    types. For xlsx the chosen sheet is staged (first by default); file_pointer is kept only
+    for the default sheet, since clean_file() reads the first sheet.
+    """
+    state = new_stage_state(run_id)
+    rows = (r for r in map(_normalize_csv_row, readers.iter_records(path, fmt, sheet)) if r is not None)
+    stage_row_stream(dataset_key, filename, state, rows, file_pointer=(file_pointer or path) if not sheet else None)
+    out: Dict[str, Any] = {"runs": {dataset_key: state}, "format": fmt}
+    if fmt == "xlsx":
+        out["sheet"] = sheet
+    return out
+
+
 # -----------------------
 # Upload endpoint (stage all rows into staging_raw)
 # -----------------------
+def request_content_length(request: Request) -> Optional[int]:
+    try:
+        return int(request.headers.get("content-length") or 0) or None
+    except ValueError:
+        return None
+
+
+async def admit(dataset_key: str, nbytes: Optional[int]) -> "admission.Ticket":
+    """Wait for upload capacity; 429 with Retry-After when the controller rejects."""
+    try:
+        return await admission.controller.acquire(dataset_key, admission.estimate_cost(nbytes, MAX_FILE_BYTES))
+    except admission.Rejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
 @app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...), dataset: str = Form(...)):
+async def upload_file(request: Request, file: UploadFile = File(...), dataset: str = Form(...), sheet: Optional[str] = Form(None),
+                      process: bool = Form(False)):
     """
     Upload endpoint that STAGES ALL ROWS into staging_raw immediately.
     - Accepts .csv or .docx (docx converts first table -> CSV or paragraphs fallback)
-    - Parses CSV into rows (dict per row) and inserts each as a staging_raw row with upload_id
-    - Does NOT call ETL cleaning or RPCs here (explicit /api/process should be used)
+    - Accepts .xlsx: the chosen `sheet` (name or 0-based index; default first) is read
+      row by row in read-only mode
+    - Accepts .parquet (by row group), Arrow IPC (.arrow/.feather, by record batch) and
+      .ndjson/.jsonl; typed values are staged as-is, without a CSV round-trip
+    - Accepts .csv.gz / .zip / .zst: members are decompressed and parsed as a stream;
+      a zip may carry one member per dataset (each gets its own upload_id). The size
+      limit is MAX_DECOMPRESSED_BYTES on the decompressed data.
+    - Parses CSV into rows (dict per row) and stages them as chunk records
+      (STAGING_CHUNK_ROWS rows + validation vector per staging_raw row) with upload_id
+    - Does NOT call ETL cleaning or RPCs here (explicit /api/process should be used),
+      unless `process=true`: trusted feeds then take the fused path (fused_upload), which
+      parses the file once and stages, cleans, writes cleaned rows and promotes in one job
+    - Runs under admission control (app/admission.py): when the upload budget is
+      exhausted the request waits in its dataset queue, or gets 429 + Retry-After
     """
     dataset_key = dataset.lower().strip()
     if dataset_key not in DATASET_MAP:
         raise HTTPException(status_code=400, detail=f"Unsupported dataset: {dataset}")
 
+    ticket = await admit(dataset_key, request_content_length(request))
+    try:
+        return await _stage_upload(file, dataset_key, sheet, process)
+    finally:
+        admission.controller.release(ticket)
+
+
+async def _stage_upload(file: UploadFile, dataset_key: str, sheet: Optional[str], process: bool = False):
     filename = file.filename or "uploaded"
     content_type = file.content_type or ""
 
-    # read uploaded bytes
-    content = await file.read()
-    size = len(content)
-    if size == 0:
+    # compressed feeds are limited on decompressed bytes (enforced while staging), plain files here
+    head = await file.read(8)
+    if not head:
         raise HTTPException(status_code=400, detail="Empty file uploaded.")
-    if size > MAX_FILE_BYTES:
-        raise HTTPException(status_code=413, detail=f"File too large. Max {MAX_FILE_BYTES} bytes.")
+    compression_kind = compression.detect_compression(head, filename)
+    max_bytes = compression.MAX_DECOMPRESSED_BYTES if compression_kind else MAX_FILE_BYTES
 
-    # save original upload to a temporary file (keeps a copy)
+    # save original upload to a temporary file (keeps a copy), streaming it in chunks
     suffix = "." + (filename.split(".")[-1] if "." in filename else "tmp")
     try:
+        size = len(head)
         with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(content)
-            tmp.flush()
             tmp_path = tmp.name
+            tmp.write(head)
+            while True:
+                part = await file.read(1024 * 1024)
+                if not part:
+                    break
+                size += len(part)
+                if size > max_bytes:
+                    break
+                tmp.write(part)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Could not save uploaded file: {e}")
+    if size > max_bytes:
+        try:
+            os.remove(tmp_path)
+        except Exception:
+            pass
+        raise HTTPException(status_code=413, detail=f"File too large. Max {max_bytes} bytes.")
+
+    # staging makes (throttled, possibly backing off) database calls: keep them off the event loop
+    return await run_in_threadpool(_stage_saved_upload, tmp_path, head, filename, content_type, dataset_key, sheet,
+                                   process, compression_kind)
+
+
+def _stage_saved_upload(tmp_path: str, head: bytes, filename: str, content_type: str, dataset_key: str,
+                        sheet: Optional[str], process: bool, compression_kind: Optional[str]):
+    """Stage an upload saved to `tmp_path` (blocking; /api/upload runs it in the threadpool)."""
+    if process and compression_kind:
+        try:
+            os.remove(tmp_path)
+        except Exception:
+            pass
+        raise HTTPException(status_code=400, detail="process=true takes uncompressed files; upload without it and call /api/process")
+
+    # the upload moves into the spool (content-addressed, TTL / quota evicted) and staging rows
+    # point at spool://<sha256><ext>, so /api/process on any replica can re-read the file.
+    # Archives are staged without a file_pointer; their temp file is removed once staged.
+    file_pointer = None
+    if not compression_kind:
+        try:
+            file_pointer = spool.put_file(tmp_path, suffix)
+            tmp_path = spool.local_path(file_pointer)
+        except Exception as e:
+            print("Warning: could not spool upload, keeping the temp file:", str(e))
+            file_pointer = tmp_path
 
     # create an etl_runs row immediately and get its integer id
     run_id = insert_etl_run(f"upload_{dataset_key}", "staged", note=filename)
 
+    if process:
+        return fused_upload(tmp_path, filename, dataset_key, run_id, sheet, file_pointer=file_pointer)
+    if compression_kind:
+        return _stage_streamed_upload(tmp_path, filename, dataset_key, run_id,
+                                      lambda: stage_compressed_file(tmp_path, compression_kind, filename, dataset_key, run_id))
+    table_format = readers.detect_format(filename, head)
+    if table_format:
+        return _stage_streamed_upload(tmp_path, filename, dataset_key, run_id,
+                                      lambda: stage_table_file(tmp_path, table_format, filename, dataset_key, run_id, sheet,
+                                                               file_pointer=file_pointer),
+                                      file_pointer=file_pointer)
+
+    with open(tmp_path, "rb") as fh:
+        content = fh.read()
+
     try:
         lower = filename.lower()
         csv_text: Optional[str] = None
@@ -475,17 +817,11 @@ async def upload_file(file: UploadFile = File(...), dataset: str = Form(...)):
                 csv_text = text
             else:
                 # unsupported type -> cleanup and error
-                try:
-                    os.remove(tmp_path)
-                except Exception:
-                    pass
+                drop_upload_file(tmp_path, file_pointer, run_id)
                 raise HTTPException(status_code=415, detail=f"Unsupported file type: {content_type} / {filename}")
 
         if not csv_text:
-            try:
-                os.remove(tmp_path)
-            except Exception:
-                pass
+            drop_upload_file(tmp_path, file_pointer, run_id)
             raise HTTPException(status_code=400, detail="Could not obtain CSV text from upload.")
 
         # parse CSV into list of dicts
@@ -494,16 +830,17 @@ async def upload_file(file: UploadFile = File(...), dataset: str = Form(...)):
         # if no rows found, still create a staging_raw pointing to file (so UI can show file)
         if not parsed_rows:
             # insert single staging row pointing to file (raw metadata)
-            res = sb.table("staging_raw").insert({
+            res = sb.table("staging_raw").upsert({
+                "row_key": f"{run_id}:file",
                 "entity": dataset_key,
                 "raw": {"filename": filename, "note": "no rows parsed"},
                 "processed": False,
                 "upload_id": run_id,
                 "original_filename": filename,
-                "file_pointer": tmp_path,
+                "file_pointer": file_pointer,
                 "detected_entity": dataset_key,
                 "notes": {"staged_at": datetime.now(timezone.utc).isoformat()}
-            }).execute()
+            }, on_conflict="row_key", ignore_duplicates=True).execute()
             staged_count = 1 if not (isinstance(res, dict) and res.get("error")) else 0
             safe_update_etl_run(run_id, "staged", note=f"staged_rows={staged_count}")
             return JSONResponse({
@@ -515,77 +852,11 @@ async def upload_file(file: UploadFile = File(...), dataset: str = Form(...)):
                 "message": "no rows parsed; staging single file pointer row"
             })
 
-        # --- VALIDATION: compute validation errors for parsed rows (but DO NOT remove them from staging) ---
-        valid_rows: List[Dict[str, Any]] = []
-        invalid_rows: List[Dict[str, Any]] = []
-        validation_map: List[Optional[str]] = []  # parallel to parsed_rows: None or error string
-        for r in parsed_rows:
-            err = validate_required_fields(dataset_key, r)
-            validation_map.append(err)
-            if err:
-                bad = dict(r)
-                bad["_upload_validation_error"] = err
-                invalid_rows.append(bad)
-            else:
-                valid_rows.append(r)
-
-        # Insert invalid rows into import_errors (one row per bad record)
-        error_count = 0
-        for bad_row in invalid_rows:
-            try:
-                sb.table("import_errors").insert({
-                    "sourcetable": "staging_raw",
-                    "sourceid": None,
-                    "raw": bad_row if isinstance(bad_row, dict) else {"raw": bad_row},
-                    "errormessage": bad_row.get("_upload_validation_error", "validation failed"),
-                    "createdat": datetime.now(timezone.utc).isoformat()
-                }).execute()
-                error_count += 1
-            except Exception as _e:
-                # log but do not fail the whole upload
-                print("Warning: could not insert import_errors row:", str(_e))
-                continue
-
-        # --- NEW BEHAVIOR: insert ALL parsed_rows into staging_raw (so UI shows them all),
-        # and attach validation error metadata to staged rows that failed validation.
-        staging_records = []
-        for i, (r, err) in enumerate(zip(parsed_rows, validation_map)):
-            notes = {"staged_at": datetime.now(timezone.utc).isoformat()}
-            if err:
-                # attach the upload validation error into the notes so you can see it in staging_raw
-                notes["_upload_validation_error"] = err
-                notes["_upload_valid"] = False
-            else:
-                notes["_upload_valid"] = True
-
-            staging_records.append({
-                "entity": dataset_key,
-                "raw": r,
-                "processed": False,
-                "upload_id": run_id,
-                "original_filename": filename,
-                # keep file pointer on the first row for debugging/reference; subsequent rows set None
-                "file_pointer": tmp_path if i == 0 else None,
-                "detected_entity": dataset_key,
-                "notes": notes
-            })
-
-        # insert in batches using batch_insert helper
-        staged_count = batch_insert("staging_raw", staging_records)
+        # validate + stage all parsed rows as chunk records (invalid rows also go to import_errors)
+        staged_count, error_count, chunk_count, orphan_count = stage_parsed_rows(dataset_key, filename, run_id, parsed_rows, file_pointer)
 
         # Optionally store original upload to storage (keeps an external copy)
-        if STORE_UPLOADS:
-            try:
-                dest_path = f"uploads/{int(time.time())}_{os.path.basename(filename)}"
-                with open(tmp_path, "rb") as fh:
-                    data_bytes = fh.read()
-                upload_res = sb.storage.from_("uploads").upload(dest_path, data_bytes, {"cacheControl": "3600"})
-                if isinstance(upload_res, dict) and upload_res.get("error"):
-                    print("Warning: storage upload error:", upload_res.get("error"))
-                else:
-                    print("Saved original upload to storage:", dest_path)
-            except Exception as e:
-                print("Warning: storing original upload failed:", str(e))
+        store_original_upload(tmp_path, filename)
 
         # update etl_runs row to staged + note counts (include error_rows)
         safe_update_etl_run(run_id, "staged", note=f"staged_rows={staged_count} error_rows={error_count}")
@@ -597,8 +868,10 @@ async def upload_file(file: UploadFile = File(...), dataset: str = Form(...)):
                 "filename": filename,
                 "upload_id": run_id,
                 "staged_rows": staged_count,
+                "staged_chunks": chunk_count,
                 "error_rows": error_count,
-                "file_pointer": tmp_path,
+                "orphan_rows": orphan_count,
+                "file_pointer": file_pointer,
             }
         )
 
@@ -620,10 +893,7 @@ async def upload_file(file: UploadFile = File(...), dataset: str = Form(...)):
         except Exception:
             pass
         # cleanup temp file on failure
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
+        drop_upload_file(tmp_path, file_pointer, run_id)
 
         # IMPORTANT: always return valid JSON to the frontend (prevents frontend JSON parse errors)
         return JSONResponse(
@@ -635,15 +905,690 @@ async def upload_file(file: UploadFile = File(...), dataset: str = Form(...)):
             },
         )
 
+def spool_blob_in_use(file_pointer: str, upload_id: Optional[int] = None) -> bool:
+    """True when staging rows of another upload point at this (shared, content-addressed) blob."""
+    try:
+        q = sb.table("staging_raw").select("id").eq("file_pointer", file_pointer)
+        if upload_id is not None:
+            q = q.neq("upload_id", upload_id)
+        res = q.limit(1).execute()
+        if isinstance(res, dict) and res.get("error"):
+            raise RuntimeError(res.get("error"))
+        return bool(getattr(res, "data", None))
+    except Exception as e:
+        print("Warning: could not check spool blob references, keeping it:", str(e))
+        return True
+
+
+def drop_upload_file(tmp_path: Optional[str], file_pointer: Optional[str] = None, upload_id: Optional[int] = None) -> None:
+    """
+    Remove a failed upload's file: its spool blob, or the plain temp file. A blob that an
+    earlier upload of the same content still points at is left to spool eviction.
+    """
+    if spool.is_pointer(file_pointer):
+        if not spool_blob_in_use(file_pointer, upload_id):
+            spool.discard(file_pointer)
+        return
+    try:
+        if tmp_path:
+            os.remove(tmp_path)
+    except Exception:
+        pass
+
+
+def store_original_upload(tmp_path: str, filename: str) -> None:
+    """Copy the original upload to the `uploads` storage bucket when STORE_UPLOADS is on."""
+    if not STORE_UPLOADS:
+        return
+    try:
+        dest_path = f"uploads/{int(time.time())}_{os.path.basename(filename)}"
+        with open(tmp_path, "rb") as fh:
+            data_bytes = fh.read()
+        upload_res = sb.storage.from_("uploads").upload(dest_path, data_bytes, {"cacheControl": "3600"})
+        if isinstance(upload_res, dict) and upload_res.get("error"):
+            print("Warning: storage upload error:", upload_res.get("error"))
+        else:
+            print("Saved original upload to storage:", dest_path)
+    except Exception as e:
+        print("Warning: storing original upload failed:", str(e))
+
+
+def _stage_streamed_upload(tmp_path: str, filename: str, dataset_key: str, run_id: int, stage,
+                           file_pointer: Optional[str] = None) -> JSONResponse:
+    """
+    Run a streaming stager (stage_compressed_file / stage_table_file) and build the
+    /api/upload response. Without a file_pointer (archives) the temp file is removed
+    once staged.
+    """
+    try:
+        result = stage()
+    except (compression.DecompressionLimitError, ValueError) as e:
+        # 413: decompressed size over the limit; 400: e.g. unknown sheet
+        status = 413 if isinstance(e, compression.DecompressionLimitError) else 400
+        safe_update_etl_run(run_id, "failed", note=str(e))
+        drop_upload_file(tmp_path, file_pointer, run_id)
+        return JSONResponse(status_code=status, content={"status": "error", "message": "Upload staging failed", "detail": str(e)})
+    except Exception as e:
+        safe_update_etl_run(run_id, "failed", note=str(e))
+        drop_upload_file(tmp_path, file_pointer, run_id)
+        return JSONResponse(status_code=500, content={"status": "error", "message": "Upload staging failed", "detail": str(e)})
+
+    store_original_upload(tmp_path, filename)
+    if file_pointer is None:
+        drop_upload_file(tmp_path)
+    main_run = result.pop("runs")[dataset_key]
+    safe_update_etl_run(run_id, "staged", note=f"staged_rows={main_run['staged_rows']} error_rows={main_run['error_rows']}")
+    out = {
+        "status": "ok",
+        "dataset": dataset_key,
+        "filename": filename,
+        "upload_id": run_id,
+        "staged_rows": main_run["staged_rows"],
+        "staged_chunks": main_run["staged_chunks"],
+        "error_rows": main_run["error_rows"],
+        "orphan_rows": main_run["orphan_rows"],
+        "file_pointer": file_pointer,
+    }
+    out.update(result)
+    return JSONResponse(out)
+
+
+def fused_upload(tmp_path: str, filename: str, dataset_key: str, run_id: int, sheet: Optional[str] = None,
+                 file_pointer: Optional[str] = None) -> JSONResponse:
+    """
+    Single-pass upload + process (/api/upload with process=true). The file is parsed
+    once by the dataset's ETL module (iter_frames); then, FUSED_SLICE_ROWS rows at a time,
+    the raw rows are validated and staged and the same rows are cleaned (clean_records)
+    and upserted into the cleaned table. Finally the upload is promoted into its dim
+    table. Cleaned rows are keyed upload + ordinal, as in /api/process.
+    """
+    from backend.app import schemas  # pandas; the ETL module has loaded it already
+
+    cfg = DATASET_MAP[dataset_key]
+    etl_module = etl.load(cfg["etl_module"])
+    converted_tmp_path = None
+    try:
+        read_path = tmp_path
+        if filename.lower().endswith(".docx"):
+            # same conversion as /api/process: first table (or paragraphs) -> CSV
+            with open(tmp_path, "rb") as fh:
+                csv_text = docx_to_csv_text_with_fallback(fh, table_selection="first")
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp_csv:
+                tmp_csv.write(csv_text.encode("utf-8"))
+                converted_tmp_path = read_path = tmp_csv.name
+        staged_count = error_count = chunk_count = orphan_count = cleaned_count = 0
+        ordinal = offset = 0
+        coercion_errors: Dict[str, Dict[str, int]] = {}
+        # columnar files arrive in FRAME_BATCH_ROWS batches, everything else as one frame
+        for frame in etl_module.iter_frames(read_path, sheet=sheet):
+            for start in range(0, len(frame), FUSED_SLICE_ROWS):
+                part = frame.iloc[start:start + FUSED_SLICE_ROWS]
+                n_staged, n_errors, n_chunks, n_orphans = stage_parsed_rows(
+                    dataset_key, filename, run_id, schemas.to_records(part), file_pointer or tmp_path,
+                    first_chunk_index=chunk_count, first_row_offset=offset)
+                staged_count += n_staged
+                error_count += n_errors
+                chunk_count += n_chunks
+                orphan_count += n_orphans
+                offset += len(part)
+
+                cleaned_rows, _ = etl_module.clean_records(part.reset_index(drop=True), source=filename,
+                                                           errors=coercion_errors)
+                cleaned_count += write_cleaned_rows(cfg["cleaned_table"], cleaned_rows, run_id, first_ordinal=ordinal)
+                ordinal += len(cleaned_rows)
+
+        promoted = promotion.promote(cfg["rpc"], cfg["cleaned_table"], run_id)
+        key_cache.refresh_after_promotion(cfg.get("dim_table"))
+        try:
+            sb.table("staging_raw").update({"processed": True}).eq("upload_id", run_id).execute()
+        except Exception:
+            pass
+    except Exception as e:
+        safe_update_etl_run(run_id, "failed", note=str(e))
+        drop_upload_file(tmp_path, file_pointer, run_id)
+        return JSONResponse(status_code=500, content={"status": "error", "message": "Fused upload failed", "detail": str(e)})
+    finally:
+        if converted_tmp_path:
+            try:
+                os.remove(converted_tmp_path)
+            except Exception:
+                pass
+
+    store_original_upload(tmp_path, filename)
+    note = (f"staged_rows={staged_count} error_rows={error_count} "
+            f"cleaned_inserted={cleaned_count} processed_into_dims={promoted['promoted']}")
+    if coercion_errors:
+        note += f" coercion_errors={json.dumps(coercion_errors, sort_keys=True)}"
+    safe_update_etl_run(run_id, "success", note=note)
+    return JSONResponse({
+        "status": "ok",
+        "mode": "fused",
+        "dataset": dataset_key,
+        "filename": filename,
+        "upload_id": run_id,
+        "staged_rows": staged_count,
+        "staged_chunks": chunk_count,
+        "error_rows": error_count,
+        "orphan_rows": orphan_count,
+        "cleaned_inserted": cleaned_count,
+        "processed_into_dims": promoted["promoted"],
+        "promotion_chunks": promoted["chunks"],
+        "coercion_errors": coercion_errors,
+        "file_pointer": file_pointer,
+    })
+
+
 # ---- ALIAS ROUTE: accept upload at /upload as well as /api/upload ----
 # This wrapper keeps your existing upload logic identical and only adds a second URL
 @app.post("/upload")
-async def upload_file_alias(file: UploadFile = File(...), dataset: str = Form(...)):
+async def upload_file_alias(request: Request, file: UploadFile = File(...), dataset: str = Form(...), sheet: Optional[str] = Form(None),
+                            process: bool = Form(False)):
     """
     Alias for /api/upload to accomodate frontends calling /upload (prevents 404).
     Delegates to the existing upload_file handler.
     """
-    return await upload_file(file=file, dataset=dataset)
+    return await upload_file(request=request, file=file, dataset=dataset, sheet=sheet, process=process)
+
+
+# -----------------------
+# Resumable uploads: create session -> PUT byte ranges -> GET offset -> finalize
+# CSV sessions stage every completed line while the upload is still running.
+# -----------------------
+def _decode_text(data: bytes) -> str:
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+def _stage_session_segment(session: Dict[str, Any], final: bool = False) -> int:
+    """Parse and stage the complete CSV lines received so far. Returns rows staged."""
+    segment = upload_sessions.take_complete_segment(session, final=final)
+    if not segment:
+        return 0
+    text = _decode_text(segment)
+    if session["header"] is None:
+        # first segment carries the header line
+        header, _, text = text.partition("\n")
+        session["header"] = header.rstrip("\r")
+        session["delimiter"] = sniff_delimiter(session["header"] + "\n" + text[:2048])
+    if not text.strip():
+        return 0
+    rows = parse_csv_text_to_dicts(session["header"] + "\n" + text, delimiter=session["delimiter"])
+    if not rows:
+        return 0
+    staged, errors, chunks, orphans = stage_parsed_rows(
+        session["dataset"],
+        session["filename"],
+        session["upload_id"],
+        rows,
+        file_pointer=session["spool_path"],
+        first_chunk_index=session["chunk_index"],
+        first_row_offset=session["row_offset"],
+    )
+    session["chunk_index"] += chunks
+    session["row_offset"] += staged
+    session["staged_rows"] += staged
+    session["staged_chunks"] += chunks
+    session["error_rows"] += errors
+    session["orphan_rows"] = session.get("orphan_rows", 0) + orphans
+    return staged
+
+
+def _session_status(session: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": "ok",
+        "session_id": session["session_id"],
+        "upload_id": session["upload_id"],
+        "dataset": session["dataset"],
+        "filename": session["filename"],
+        "received": session["received"],
+        "total_size": session["total_size"],
+        "staged_rows": session["staged_rows"],
+        "finalized": session["finalized"],
+    }
+
+
+def _session_error(e: "upload_sessions.SessionError") -> JSONResponse:
+    content = {"status": "error", "message": str(e)}
+    if e.received is not None:
+        content["received"] = e.received
+    return JSONResponse(status_code=e.status_code, content=content)
+
+
+def _session_busy(session_id: str, message: str) -> JSONResponse:
+    # still locked after SESSION_LOCK_WAIT: report the offset so far; a PUT from there
+    # waits for the lock again and, if the in-flight chunk moved it, gets a 409 with the final one
+    try:
+        received = upload_sessions.load_session(session_id)["received"]
+    except upload_sessions.SessionError as e:
+        return _session_error(e)
+    return _session_error(upload_sessions.SessionError(message, status_code=409, received=received))
+
+
+@app.post("/api/uploads")
+def create_upload_session(
+    dataset: str = Form(...),
+    filename: str = Form(...),
+    total_size: Optional[int] = Form(None),
+    content_type: Optional[str] = Form(None),
+):
+    dataset_key = dataset.lower().strip()
+    if dataset_key not in DATASET_MAP:
+        raise HTTPException(status_code=400, detail=f"Unsupported dataset: {dataset}")
+    run_id = insert_etl_run(f"upload_{dataset_key}", "receiving", note=filename)
+    try:
+        session = upload_sessions.create_session(dataset_key, filename, run_id, total_size, content_type or "")
+    except upload_sessions.SessionError as e:
+        safe_update_etl_run(run_id, "failed", note=str(e))
+        return _session_error(e)
+    return JSONResponse(_session_status(session), status_code=201)
+
+
+@app.get("/api/uploads/{session_id}")
+async def get_upload_session(session_id: str):
+    try:
+        session = upload_sessions.load_session(session_id)
+    except upload_sessions.SessionError as e:
+        return _session_error(e)
+    return JSONResponse(_session_status(session))
+
+
+@app.put("/api/uploads/{session_id}")
+async def put_upload_chunk(session_id: str, request: Request):
+    """
+    Append a byte range. The range must start at the current received offset
+    (Content-Range: bytes <start>-<end>/<total>); otherwise 409 with the offset to resume from.
+    """
+    lock = await upload_sessions.acquire_session_lock(session_id)
+    if lock is None:
+        return _session_busy(session_id, "another chunk for this session is in progress")
+    try:
+        session = upload_sessions.load_session(session_id)
+        if session["finalized"]:
+            raise upload_sessions.SessionError("upload session already finalized", status_code=409, received=session["received"])
+        start, total = upload_sessions.parse_content_range(request.headers.get("content-range"), session["received"])
+        if start != session["received"]:
+            raise upload_sessions.SessionError("range does not start at received offset", status_code=409, received=session["received"])
+        if total is not None:
+            session["total_size"] = total
+        limit = session["total_size"] or upload_sessions.MAX_RESUMABLE_BYTES
+        limit = min(limit, upload_sessions.MAX_RESUMABLE_BYTES)
+
+        # append the body straight to the spool file as it streams in
+        with open(session["spool_path"], "ab") as fh:
+            async for part in request.stream():
+                if session["received"] + len(part) > limit:
+                    raise upload_sessions.SessionError(f"upload exceeds declared size / max {limit} bytes", status_code=413, received=session["received"])
+                fh.write(part)
+                session["received"] += len(part)
+
+        staged_now = 0
+        if upload_sessions.is_csv_session(session):
+            staged_now = await run_in_threadpool(_stage_session_segment, session)
+        upload_sessions.save_session(session)
+        out = _session_status(session)
+        out["staged_now"] = staged_now
+        return JSONResponse(out)
+    except upload_sessions.SessionError as e:
+        return _session_error(e)
+    finally:
+        lock.release()
+
+
+def _stage_finalized_session(session: Dict[str, Any]) -> None:
+    """Stage the rest of a finished session upload and spool its file (blocking; finalize runs it in the threadpool)."""
+    run_id = session["upload_id"]
+    with open(session["spool_path"], "rb") as fh:
+        compression_kind = compression.detect_compression(fh.read(8), session["filename"])
+    table_format = readers.detect_format(session["filename"])
+    if compression_kind or table_format:
+        if compression_kind:
+            result = stage_compressed_file(session["spool_path"], compression_kind, session["filename"], session["dataset"], run_id)
+        else:
+            result = stage_table_file(session["spool_path"], table_format, session["filename"], session["dataset"], run_id)
+        main_run = result["runs"][session["dataset"]]
+        session["staged_rows"] += main_run["staged_rows"]
+        session["staged_chunks"] += main_run["staged_chunks"]
+        session["error_rows"] += main_run["error_rows"]
+        session["orphan_rows"] = session.get("orphan_rows", 0) + main_run["orphan_rows"]
+    elif upload_sessions.is_csv_session(session):
+        _stage_session_segment(session, final=True)
+    else:
+        # non-CSV (e.g. DOCX) can only be parsed once the whole file is here
+        with open(session["spool_path"], "rb") as fh:
+            content = fh.read()
+        if session["filename"].lower().endswith(".docx"):
+            csv_text = docx_to_csv_text_with_fallback(BytesIO(content), table_selection="first")
+        else:
+            csv_text = _decode_text(content)
+        rows = parse_csv_text_to_dicts(csv_text)
+        staged, errors, chunks, orphans = stage_parsed_rows(
+            session["dataset"], session["filename"], run_id, rows, file_pointer=session["spool_path"])
+        session["staged_rows"] += staged
+        session["staged_chunks"] += chunks
+        session["error_rows"] += errors
+        session["orphan_rows"] = session.get("orphan_rows", 0) + orphans
+    # staged rows point at the session file; move it into the spool and repoint them
+    # (if the repoint fails, /api/process falls back to the staged rows). Archives are
+    # staged without a file_pointer, like on /api/upload, so their file just goes.
+    try:
+        if compression_kind:
+            os.remove(session["spool_path"])
+        else:
+            pointer = spool.put_file(session["spool_path"])
+            session["file_pointer"] = pointer
+            sb.table("staging_raw").update({"file_pointer": pointer}).eq("upload_id", run_id) \
+                .eq("file_pointer", session["spool_path"]).execute()
+    except Exception as e:
+        print("Warning: could not spool session upload:", str(e))
+    session["finalized"] = True
+    upload_sessions.save_session(session)
+
+
+@app.post("/api/uploads/{session_id}/finalize")
+async def finalize_upload_session(session_id: str):
+    lock = await upload_sessions.acquire_session_lock(session_id)
+    if lock is None:
+        return _session_busy(session_id, "a chunk for this session is still in progress")
+    ticket = None
+    try:
+        try:
+            session = upload_sessions.load_session(session_id)
+        except upload_sessions.SessionError as e:
+            return _session_error(e)
+        if session["finalized"]:
+            return JSONResponse(_session_status(session))
+        if session["total_size"] is not None and session["received"] != session["total_size"]:
+            return _session_error(upload_sessions.SessionError(
+                "upload incomplete", status_code=409, received=session["received"]))
+        if session["received"] == 0:
+            raise HTTPException(status_code=400, detail="Empty file uploaded.")
+
+        run_id = session["upload_id"]
+        ticket = await admit(session["dataset"], session["received"])
+        try:
+            await run_in_threadpool(_stage_finalized_session, session)
+        except Exception as e:
+            await run_in_threadpool(safe_update_etl_run, run_id, "failed", str(e))
+            return JSONResponse(status_code=500, content={"status": "error", "message": "Upload staging failed", "detail": str(e)})
+
+        await run_in_threadpool(safe_update_etl_run, run_id, "staged",
+                                f"staged_rows={session['staged_rows']} error_rows={session['error_rows']}")
+        out = _session_status(session)
+        out.update({
+            "staged_chunks": session["staged_chunks"],
+            "error_rows": session["error_rows"],
+            "orphan_rows": session.get("orphan_rows", 0),
+            "file_pointer": session.get("file_pointer") or session["spool_path"],
+        })
+        return JSONResponse(out)
+    finally:
+        if ticket is not None:
+            admission.controller.release(ticket)
+        lock.release()
+
+
+# -----------------------
+# Preview: read only the head of a file and report what /api/upload would do with it
+# -----------------------
+PREVIEW_MAX_BYTES = int(os.getenv("PREVIEW_MAX_BYTES", str(64 * 1024)))
+PREVIEW_MAX_ROWS = int(os.getenv("PREVIEW_MAX_ROWS", "50"))
+
+
+def _complete_lines(data: bytes, eof: bool) -> bytes:
+    """Cut a head sample at its last newline outside a quoted field (whole sample at EOF)."""
+    if eof:
+        return data
+    pos = data.rfind(b"\n")
+    while pos >= 0 and data.count(b'"', 0, pos) % 2:
+        pos = data.rfind(b"\n", 0, pos)
+    return data[: pos + 1] if pos >= 0 else data
+
+
+def _infer_type(values: List[Any]) -> str:
+    """Coarse column type from sample values: integer, number, boolean, date, datetime, string or empty."""
+    kinds = set()
+    for v in values:
+        if v is None or v == "":
+            continue
+        if isinstance(v, bool):
+            kinds.add("boolean")
+        elif isinstance(v, int):
+            kinds.add("integer")
+        elif isinstance(v, float):
+            kinds.add("number")
+        elif isinstance(v, str):
+            t = v.strip()
+            if t.lower() in ("true", "false"):
+                kinds.add("boolean")
+                continue
+            try:
+                int(t)
+                kinds.add("integer")
+                continue
+            except ValueError:
+                pass
+            try:
+                float(t.replace(",", ""))
+                kinds.add("number")
+                continue
+            except ValueError:
+                pass
+            try:
+                datetime.fromisoformat(t)
+                kinds.add("datetime" if ("T" in t or ":" in t) else "date")
+                continue
+            except ValueError:
+                kinds.add("string")
+        else:
+            kinds.add("string")
+    if not kinds:
+        return "empty"
+    if kinds == {"integer", "number"}:
+        return "number"
+    return kinds.pop() if len(kinds) == 1 else "string"
+
+
+def _preview_rows(fh, filename: str, content_type: str, max_rows: int, sheet: Optional[str]) -> Dict[str, Any]:
+    """
+    Read at most PREVIEW_MAX_BYTES (or max_rows rows) from an open upload and return
+    {"format", "rows", "delimiter", "truncated"} with rows normalized like /api/upload.
+    Random-access formats (zip, docx, xlsx, parquet, arrow) only touch the parts they need.
+    """
+    head = fh.read(8)
+    fh.seek(0)
+    lower = filename.lower()
+    kind = compression.detect_compression(head, filename)
+    table_format = readers.detect_format(filename, head)
+    rows: List[Dict[str, Any]] = []
+    out: Dict[str, Any] = {"format": "csv", "delimiter": None}
+
+    if kind:
+        # decompress just the head of the first member
+        for member, stream in compression.iter_members(fh, kind, filename):
+            data = stream.read(PREVIEW_MAX_BYTES + 1)
+            out["member"] = member
+            break
+        else:
+            data = b""
+        out["compression"] = kind
+        lower = out.get("member", "").lower()
+        table_format = readers.detect_format(lower)
+        if table_format not in (None, "ndjson"):
+            raise HTTPException(status_code=415, detail=f"Unsupported archive member: {out.get('member')}")
+    elif table_format:
+        out["format"] = table_format
+        records = readers.iter_records(fh, table_format, sheet) if table_format in ("xlsx", "parquet", "arrow") else None
+        if records is not None:
+            for r in itertools.islice(records, max_rows + 1):
+                row = _normalize_csv_row(r)
+                if row is not None:
+                    rows.append(row)
+            out["truncated"] = len(rows) > max_rows
+            out["rows"] = rows[:max_rows]
+            if table_format == "xlsx":
+                out["sheet"] = sheet
+            return out
+        data = fh.read(PREVIEW_MAX_BYTES + 1)
+    elif lower.endswith(".docx") or (content_type in ALLOWED_DOCX_CONTENT_TYPES and head.startswith(b"PK")):
+        out["format"] = "docx"
+        table_rows = [cells for _, cells in itertools.islice(
+            itertools.takewhile(lambda t: t[0] == 0, iter_docx_table_rows(fh)), max_rows + 2)]
+        if not table_rows:
+            raise HTTPException(status_code=422, detail="No tables found in DOCX to preview.")
+        csv_text = "\n".join(",".join(escape_csv_cell(c) for c in r) for r in table_rows)
+        rows = parse_csv_text_to_dicts(csv_text, delimiter=",")
+        out["truncated"] = len(rows) > max_rows
+        out["rows"] = rows[:max_rows]
+        return out
+    else:
+        data = fh.read(PREVIEW_MAX_BYTES + 1)
+
+    eof = len(data) <= PREVIEW_MAX_BYTES
+    sample = _complete_lines(data[:PREVIEW_MAX_BYTES], eof)
+    text = _decode_text(sample)
+    if table_format == "ndjson":
+        out["format"] = "ndjson"
+        for r in readers.iter_ndjson_lines(StringIO(text)):
+            row = _normalize_csv_row(r)
+            if row is not None:
+                rows.append(row)
+            if len(rows) > max_rows:
+                break
+    else:
+        out["delimiter"] = sniff_delimiter(text[:2048])
+        rows = parse_csv_text_to_dicts(text, delimiter=out["delimiter"])
+    out["truncated"] = (not eof) or len(rows) > max_rows
+    out["rows"] = rows[:max_rows]
+    return out
+
+
+@app.post("/api/preview")
+async def preview_upload(
+    file: UploadFile = File(...),
+    dataset: Optional[str] = Form(None),
+    rows: int = Form(20),
+    sheet: Optional[str] = Form(None),
+):
+    """
+    Preview an upload without staging anything: reads only the first PREVIEW_MAX_BYTES
+    (or first `rows` rows / first DOCX table rows) and returns the format, delimiter,
+    inferred column types, header -> canonical column mapping, entity guess
+    (parsers.detect_entity_from_headers) and validate_required_fields() results for the sample.
+    `dataset` is optional; without it the detected entity is used.
+    """
+    filename = file.filename or "uploaded"
+    max_rows = max(1, min(rows, PREVIEW_MAX_ROWS))
+    try:
+        sample = _preview_rows(file.file, filename, file.content_type or "", max_rows, sheet)
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": "Preview failed", "detail": str(e)})
+
+    sample_rows = sample.pop("rows")
+    headers: List[str] = []
+    for r in sample_rows:
+        for k in r.keys():
+            if k not in headers:
+                headers.append(k)
+    detected = detect_entity_from_headers(headers)
+    dataset_key = (dataset or detected or "").lower().strip()
+    if dataset and dataset_key not in DATASET_MAP:
+        raise HTTPException(status_code=400, detail=f"Unsupported dataset: {dataset}")
+
+    out: Dict[str, Any] = {
+        "status": "ok",
+        "filename": filename,
+        **sample,
+        "detected_dataset": detected,
+        "dataset": dataset_key or None,
+        "headers": headers,
+        "inferred_schema": {h: _infer_type([r.get(h) for r in sample_rows]) for h in headers},
+        "sample_rows": sample_rows,
+    }
+    if dataset_key in DATASET_MAP:
+        mapping = map_canonical_columns(dataset_key, headers)
+        table = DATASET_MAP[dataset_key]["cleaned_table"]
+        mapped = {c for c in mapping.values() if c}
+        validation = [validate_required_fields(dataset_key, r) for r in sample_rows]
+        out.update({
+            "header_mapping": mapping,
+            "unmapped_headers": [h for h, c in mapping.items() if c is None],
+            "missing_columns": sorted(ALLOWED_COLUMNS.get(table, set()) - {"rawjson", "upload_id"} - mapped),
+            "validation": [{"row": i, "error": e} for i, e in enumerate(validation) if e],
+            "valid_rows": sum(1 for e in validation if not e),
+            "invalid_rows": sum(1 for e in validation if e),
+            "orphan_references": [{"row": i, "error": o} for i, o in
+                                  enumerate(find_orphan_references(dataset_key, r) for r in sample_rows) if o],
+        })
+    return JSONResponse(out)
+
+
+# -----------------------
+# Dimension key cache (orphan checks at upload time)
+# -----------------------
+@app.get("/api/key-cache")
+def key_cache_stats():
+    return JSONResponse({"status": "ok", "enabled": key_cache.KEY_CACHE_ENABLED, "dims": key_cache.get_key_cache().stats()})
+
+
+@app.post("/api/key-cache/refresh")
+def key_cache_refresh(rebuild: bool = Form(False)):
+    """Fetch keys added since the last refresh for every dimension; rebuild=true reloads from scratch."""
+    cache = key_cache.get_key_cache()
+    if rebuild:
+        cache.clear()
+    try:
+        added = {dim: cache.refresh(dim) for dim in key_cache.DIM_KEYS}
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"status": "error", "message": "Key cache refresh failed", "detail": str(e)})
+    return JSONResponse({"status": "ok", "added": added, "dims": cache.stats()})
+
+
+# -----------------------
+# Promotion: cleaned_* -> dim* in id-range chunks, several entities in parallel
+# -----------------------
+@app.post("/api/promote")
+def promote_datasets(datasets: str = Form(...), upload_id: Optional[int] = Form(None), chunk_rows: Optional[int] = Form(None)):
+    """
+    Promote unprocessed cleaned rows of the comma-separated `datasets` (optionally one
+    upload) into their dim tables. Entities run in parallel; each one in chunks.
+    """
+    jobs = []
+    for name in [d.strip().lower() for d in datasets.split(",") if d.strip()]:
+        if name not in DATASET_MAP:
+            raise HTTPException(status_code=400, detail=f"Unsupported dataset: {name}")
+        cfg = DATASET_MAP[name]
+        if any(j["rpc"] == cfg["rpc"] for j in jobs):
+            continue  # alias of a dataset already listed
+        jobs.append({"rpc": cfg["rpc"], "cleaned_table": cfg["cleaned_table"], "dim_table": cfg.get("dim_table"),
+                     "upload_id": upload_id})
+    results = promotion.promote_many(jobs, chunk_rows=chunk_rows or promotion.PROMOTION_CHUNK_ROWS)
+    for job in jobs:
+        key_cache.refresh_after_promotion(job["dim_table"])
+    failed = any("error" in r for r in results.values())
+    return JSONResponse(status_code=500 if failed else 200,
+                        content={"status": "error" if failed else "ok", "results": results})
+
+
+@app.get("/api/spool")
+def spool_stats():
+    """Upload spool usage (blobs, bytes, hits, evictions); see app/services/spool.py."""
+    return JSONResponse({"status": "ok", "spool": spool.stats()})
+
+
+@app.post("/api/spool/evict")
+def spool_evict():
+    """Run TTL / quota eviction of the upload spool now."""
+    return JSONResponse({"status": "ok", **spool.evict()})
+
+
+@app.get("/api/promotion")
+def promotion_progress():
+    """Progress of running and recent promotions (chunks done, running totals)."""
+    return JSONResponse({"status": "ok", "promotions": promotion.progress()})
 
 
 # -----------------------
@@ -651,7 +1596,7 @@ async def upload_file_alias(file: UploadFile = File(...), dataset: str = Form(..
 # (unchanged from earlier design, except for a tiny alliance normalization right before inserting cleaned rows)
 # -----------------------
 @app.post("/api/process")
-async def process_staged(staging_id: Optional[int] = Form(None), upload_id: Optional[int] = Form(None), dataset: Optional[str] = Form(None)):
+def process_staged(staging_id: Optional[int] = Form(None), upload_id: Optional[int] = Form(None), dataset: Optional[str] = Form(None)):
     """
     Process a staged upload. Provide either `staging_id` (preferred) OR `upload_id`.
     This will:
@@ -660,20 +1605,75 @@ async def process_staged(staging_id: Optional[int] = Form(None), upload_id: Opti
       - insert cleaned rows into cleaned_table
       - call RPC to promote into dims
     """
-    # locate a staging row (to discover file_pointer, detected_entity, upload_id)
-    staging_row = None
+    return JSONResponse(process_upload(staging_id=staging_id, upload_id=upload_id, dataset=dataset))
+
+
+def find_staging_row(staging_id: Optional[int] = None, upload_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """First staging_raw record of a staging id or upload id (None if there is none)."""
     if staging_id is not None:
         q = sb.table("staging_raw").select("*").eq("id", staging_id).limit(1).execute()
-        if isinstance(q, dict) and q.get("error"):
-            raise HTTPException(status_code=500, detail=str(q.get("error")))
-        if hasattr(q, "data") and q.data:
-            staging_row = q.data[0]
     elif upload_id is not None:
         q = sb.table("staging_raw").select("*").eq("upload_id", upload_id).order("id", desc=False).limit(1).execute()
-        if isinstance(q, dict) and q.get("error"):
-            raise HTTPException(status_code=500, detail=str(q.get("error")))
-        if hasattr(q, "data") and q.data:
-            staging_row = q.data[0]
+    else:
+        return None
+    if isinstance(q, dict) and q.get("error"):
+        raise HTTPException(status_code=500, detail=str(q.get("error")))
+    if hasattr(q, "data") and q.data:
+        return q.data[0]
+    return None
+
+
+def write_cleaned_rows(cleaned_table: str, cleaned_rows: List[Dict[str, Any]], upload_id: int, first_ordinal: int = 0) -> int:
+    """
+    Upsert cleaned rows of one upload into cleaned_table; row_key = upload + ordinal
+    (first_ordinal + position), so writing the same rows again updates instead of duplicating.
+    """
+    if not cleaned_rows:
+        return 0
+    cleaned_records = []
+    for ordinal, r in enumerate(cleaned_rows, start=first_ordinal):
+        rec = dict(r)
+        rec.setdefault("rawjson", r.get("rawjson", r))
+        rec["upload_id"] = upload_id
+        # same upload + same position -> same row: re-running /api/process updates instead of duplicating
+        rec["row_key"] = row_key(rec["upload_id"], ordinal)
+
+        # ---------- Normalize alliance ONLY for cleaned_airlines and set to 'None' if missing ----------
+        if cleaned_table == "cleaned_airlines":
+            try:
+                if "alliance" not in rec or rec.get("alliance") is None or str(rec.get("alliance")).strip() == "":
+                    rec["alliance"] = "None"
+                else:
+                    rec["alliance"] = str(rec.get("alliance")).strip()
+            except Exception:
+                rec["alliance"] = "None"
+        # -----------------------------------------------------------------------------------------------
+
+        # Filter out keys not allowed by the target cleaned_table (prevents unknown-column insert errors)
+        allowed = ALLOWED_COLUMNS.get(cleaned_table, None)
+        if allowed is not None:
+            filtered = {k: v for k, v in rec.items() if k in allowed}
+            # ensure rawjson and upload_id are present
+            if "rawjson" not in filtered:
+                filtered["rawjson"] = rec.get("rawjson")
+            if "upload_id" not in filtered:
+                filtered["upload_id"] = rec.get("upload_id")
+            filtered["row_key"] = rec["row_key"]
+            cleaned_records.append(filtered)
+        else:
+            # no allowed set defined -> send full rec (legacy behavior)
+            cleaned_records.append(rec)
+
+    return batch_upsert(cleaned_table, cleaned_records)
+
+
+def process_upload(staging_id: Optional[int] = None, upload_id: Optional[int] = None, dataset: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Synchronous core of /api/process (also run by /api/pipeline worker threads).
+    Returns the response body; raises HTTPException on failure.
+    """
+    # locate a staging row (to discover file_pointer, detected_entity, upload_id)
+    staging_row = find_staging_row(staging_id, upload_id)
 
     if not staging_row:
         raise HTTPException(status_code=404, detail="staging row not found for provided staging_id/upload_id")
@@ -685,36 +1685,28 @@ async def process_staged(staging_id: Optional[int] = Form(None), upload_id: Opti
     cfg = DATASET_MAP[detected_entity]
     cleaned_table = cfg["cleaned_table"]
     rpc_name = cfg["rpc"]
-    etl_module = cfg["etl_module"]
-
-    # Allowed insert columns per cleaned_table to avoid sending unknown keys to supabase
-    # (keeps behavior safe when ETL dictionaries contain extra keys)
-    ALLOWED_COLUMNS = {
-        "cleaned_airlines": {"airlinekey", "airlinename", "alliance", "rawjson", "upload_id"},
-        "cleaned_airports": {"airportkey", "airportname", "city", "country", "rawjson", "upload_id"},
-        "cleaned_flights": {"flightkey", "originairportkey", "destinationairportkey", "aircrafttype", "rawjson", "upload_id"},
-        "cleaned_passengers": {"passengerkey", "fullname", "email", "loyaltystatus", "rawjson", "upload_id"},
-        "cleaned_travelagency": {"agencykey", "agencyname", "bookingid", "passengername", "flightnumber", "saleamount", "currency", "saledate", "rawjson", "upload_id"},
-        "cleaned_corporatesales": {"invoice", "transactionid", "saleamount", "currency", "saledate", "rawjson", "upload_id"},
-    }
+    etl_module = etl.load(cfg["etl_module"])
 
     # create a processing etl_runs row (or reuse upload_id's etl_runs if provided)
     run_id = insert_etl_run(f"process_{detected_entity}", "started", note=f"staging_id={staging_row.get('id')}")
     try:
-        # First attempt: if there is a file_pointer and the file exists, prefer running etl_module.clean_file(tmp)
-        file_pointer = staging_row.get("file_pointer")
+        # First attempt: if there is a file_pointer and the file exists, clean the file itself (iter_frames + clean_records)
+        # spool:// pointers resolve on any replica (legacy rows carry a plain temp path)
+        file_pointer = spool.local_path(staging_row.get("file_pointer"))
         converted_tmp_path = None
         cleaned_rows: List[Dict[str, Any]] = []
         raw_rows: List[Dict[str, Any]] = []
+        cleaned_count = ordinal = 0
+        coercion_errors: Dict[str, Dict[str, int]] = {}
 
-        if file_pointer and os.path.exists(file_pointer):
+        if file_pointer:
             # detect extension
             _, ext = os.path.splitext(file_pointer.lower())
             tmp_path_for_etl = file_pointer
             if ext == ".docx":
+                # the docx zip is read in place (seekable file), not copied into memory first
                 with open(file_pointer, "rb") as fh:
-                    bio = BytesIO(fh.read())
-                    csv_text = docx_to_csv_text_with_fallback(bio, table_selection="first")
+                    csv_text = docx_to_csv_text_with_fallback(fh, table_selection="first")
                 tmp_csv = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
                 tmp_csv.write(csv_text.encode("utf-8"))
                 tmp_csv.flush()
@@ -722,8 +1714,14 @@ async def process_staged(staging_id: Optional[int] = Form(None), upload_id: Opti
                 tmp_csv.close()
                 tmp_path_for_etl = converted_tmp_path
 
-            # call the ETL module clean_file
-            cleaned_rows, raw_rows = etl_module.clean_file(tmp_path_for_etl)
+            # clean and write batch by batch (iter_frames: parquet / arrow / ndjson are never read whole)
+            upload_key = staging_row.get("upload_id") or run_id
+            cleaned_count = 0
+            for frame in etl_module.iter_frames(tmp_path_for_etl):
+                batch_rows, _ = etl_module.clean_records(frame, source=os.path.basename(file_pointer),
+                                                         errors=coercion_errors)
+                cleaned_count += write_cleaned_rows(cleaned_table, batch_rows, upload_key, first_ordinal=ordinal)
+                ordinal += len(batch_rows)
         else:
             # If no file pointer (or file missing), use previously staged rows (all rows for upload_id)
             q_all = sb.table("staging_raw").select("*").eq("upload_id", staging_row.get("upload_id")).execute()
@@ -734,9 +1732,8 @@ async def process_staged(staging_id: Optional[int] = Form(None), upload_id: Opti
                 rows_data = q_all.data
             # convert staging rows raw-> raw_rows list and also create cleaned_rows by calling etl.cleaner on a temp CSV if possible
             # best-effort: if raw entries look like dicts, pass them as raw_rows and let process_flights_upload or other ETL runtime handle
-            raw_rows = []
-            for r in rows_data:
-                raw_rows.append(r.get("raw") if isinstance(r.get("raw"), dict) else {"rawjson": r.get("raw")})
+            # chunk records expand to their rows; legacy one-row records pass through
+            raw_rows = list(iter_staged_rows(rows_data))
 
             # If ETL module provides a row-based runtime, we'll rely on RPC processing step instead of local clean
             cleaned_rows = []
@@ -752,44 +1749,15 @@ async def process_staged(staging_id: Optional[int] = Form(None), upload_id: Opti
             raw_rows = [raw_rows]
 
         # Insert cleaned rows (attach upload_id) — only if cleaned_rows present
-        cleaned_count = 0
-        if cleaned_rows:
-            cleaned_records = []
-            for r in cleaned_rows:
-                rec = dict(r)
-                rec.setdefault("rawjson", r.get("rawjson", r))
-                rec["upload_id"] = staging_row.get("upload_id") or run_id
-
-                # ---------- Normalize alliance ONLY for cleaned_airlines and set to 'None' if missing ----------
-                if cleaned_table == "cleaned_airlines":
-                    try:
-                        if "alliance" not in rec or rec.get("alliance") is None or str(rec.get("alliance")).strip() == "":
-                            rec["alliance"] = "None"
-                        else:
-                            rec["alliance"] = str(rec.get("alliance")).strip()
-                    except Exception:
-                        rec["alliance"] = "None"
-                # -----------------------------------------------------------------------------------------------
-
-                # Filter out keys not allowed by the target cleaned_table (prevents unknown-column insert errors)
-                allowed = ALLOWED_COLUMNS.get(cleaned_table, None)
-                if allowed is not None:
-                    filtered = {k: v for k, v in rec.items() if k in allowed}
-                    # ensure rawjson and upload_id are present
-                    if "rawjson" not in filtered:
-                        filtered["rawjson"] = rec.get("rawjson")
-                    if "upload_id" not in filtered:
-                        filtered["upload_id"] = rec.get("upload_id")
-                    cleaned_records.append(filtered)
-                else:
-                    # no allowed set defined -> send full rec (legacy behavior)
-                    cleaned_records.append(rec)
-
-            cleaned_count = batch_insert(cleaned_table, cleaned_records)
+        cleaned_count += write_cleaned_rows(cleaned_table, cleaned_rows, staging_row.get("upload_id") or run_id,
+                                            first_ordinal=ordinal)
 
         # If cleaned_rows empty, we still want to run the RPC using upload_id so the server-side RPC can consume staged rows
-        processed_count = 0
-        processed_count = call_rpc_once(rpc_name, p_upload_id=staging_row.get("upload_id") or run_id)
+        # promoted in id-range chunks (short transactions), see app/promotion.py
+        promoted = promotion.promote(rpc_name, cleaned_table, staging_row.get("upload_id") or run_id)
+        processed_count = promoted["promoted"]
+        # pick up the keys the RPC just promoted so later uploads see them
+        key_cache.refresh_after_promotion(cfg.get("dim_table"))
 
         # Mark staging rows processed (for this upload_id)
         try:
@@ -797,15 +1765,20 @@ async def process_staged(staging_id: Optional[int] = Form(None), upload_id: Opti
         except Exception:
             pass
 
-        safe_update_etl_run(run_id, "success", note=f"cleaned_inserted={cleaned_count} processed_into_dims={processed_count}")
+        note = f"cleaned_inserted={cleaned_count} processed_into_dims={processed_count}"
+        if coercion_errors:
+            note += f" coercion_errors={json.dumps(coercion_errors, sort_keys=True)}"
+        safe_update_etl_run(run_id, "success", note=note)
 
-        return JSONResponse({
+        return {
             "status": "ok",
             "dataset": detected_entity,
             "staging_id": staging_row.get("id"),
             "cleaned_inserted": cleaned_count,
             "processed_into_dims": processed_count,
-        })
+            "promotion_chunks": promoted["chunks"],
+            "coercion_errors": coercion_errors,
+        }
 
     except Exception as e:
         try:
@@ -832,4 +1805,115 @@ async def process_staged(staging_id: Optional[int] = Form(None), upload_id: Opti
         except Exception:
             pass
 
+
+# -----------------------
+# Pipeline endpoint: process several uploads in entity dependency order
+# (DATASET_DEPENDENCIES); independent entities run in parallel
+# -----------------------
+@app.post("/api/pipeline")
+def run_pipeline(upload_ids: str = Form(...), workers: Optional[int] = Form(None)):
+    """
+    Process the comma-separated staged `upload_ids` like /api/process, but each entity
+    only after the entities it references (flights after airports and airlines, ...).
+    Uploads of one entity run one after another in upload id order; entities whose
+    parents are done run concurrently. An entity whose parent failed is skipped.
+    """
+    try:
+        ids = sorted({int(u) for u in upload_ids.split(",") if u.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="upload_ids must be a comma-separated list of integers")
+    if not ids:
+        raise HTTPException(status_code=400, detail="No upload_ids given")
+
+    by_entity: Dict[str, List[int]] = {}
+    for uid in ids:
+        staging_row = find_staging_row(upload_id=uid)
+        if not staging_row:
+            raise HTTPException(status_code=404, detail=f"No staged rows for upload_id {uid}")
+        entity = (staging_row.get("detected_entity") or "").lower()
+        if entity not in DATASET_MAP:
+            raise HTTPException(status_code=400, detail=f"Upload {uid} has unsupported dataset: {entity}")
+        by_entity.setdefault(canonical_dataset(entity), []).append(uid)
+
+    def run_entity(entity: str) -> List[Dict[str, Any]]:
+        return [dict(process_upload(upload_id=uid), upload_id=uid) for uid in by_entity[entity]]
+
+    try:
+        out = pipeline.run_dag(by_entity, DATASET_DEPENDENCIES, run_entity,
+                               workers=workers or pipeline.PIPELINE_WORKERS)
+    except pipeline.CycleError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    failed = any(r["status"] != "ok" for r in out["results"].values())
+    return JSONResponse(status_code=500 if failed else 200,
+                        content={"status": "error" if failed else "ok", "uploads": by_entity, **out})
+
+
+# -----------------------
+# Export endpoint: stream cleaned_* / dim* rows back out (keyset pagination, constant memory)
+# -----------------------
+@app.get("/api/export/{dataset}")
+def export_dataset(
+    dataset: str,
+    table: str = "cleaned",
+    format: str = "csv",
+    upload_id: Optional[int] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    columns: Optional[str] = None,
+    gzip: bool = False,
+    page_size: int = EXPORT_PAGE_SIZE,
+):
+    """
+    Stream a dataset's cleaned table (table=cleaned) or dimension table (table=dim)
+    as csv, ndjson or parquet. table=dim is 400 for entities without a dim table
+    (travel agency, corporate sales).
+    - upload_id filters cleaned rows of one upload
+    - since / until (ISO timestamps, until exclusive) filter on insertedat (cleaned) or createdat (dim)
+    - columns: comma-separated subset; gzip=true compresses the stream (.gz download)
+    Rows are read page by page (id > last id ORDER BY id), so memory stays flat.
+    """
+    dataset_key = dataset.lower().strip()
+    if dataset_key not in DATASET_MAP:
+        raise HTTPException(status_code=400, detail=f"Unsupported dataset: {dataset}")
+    if table not in ("cleaned", "dim"):
+        raise HTTPException(status_code=400, detail="table must be 'cleaned' or 'dim'")
+    fmt = format.lower().strip()
+    if fmt not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format} (csv, ndjson, parquet)")
+    if fmt == "parquet":
+        try:
+            export.require_pyarrow()
+        except RuntimeError:
+            raise HTTPException(status_code=400, detail="parquet export requires pyarrow on the server")
+    if table == "dim" and upload_id is not None:
+        raise HTTPException(status_code=400, detail="upload_id filter applies to cleaned tables only")
+
+    table_name = DATASET_MAP[dataset_key]["cleaned_table" if table == "cleaned" else "dim_table"]
+    if table_name is None:
+        raise HTTPException(status_code=400, detail=f"{dataset_key} has no dim table")
+    col_list = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+    pages = export.iter_pages(
+        sb,
+        table_name,
+        page_size=max(1, min(page_size, 10000)),
+        columns=col_list,
+        upload_id=upload_id,
+        time_column="insertedat" if table == "cleaned" else "createdat",
+        since=since,
+        until=until,
+    )
+    chunks = export.encode(fmt, pages, col_list)
+    media_type, ext = export.EXPORT_FORMATS[fmt]
+    download = f"{table_name}.{ext}"
+    if gzip:
+        chunks = export.gzip_chunks(chunks)
+        media_type, download = "application/gzip", download + ".gz"
+    # sync generator: Starlette iterates it in a worker thread, so the blocking client calls don't stall the loop
+    return StreamingResponse(chunks, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{download}"'
+    })
+
+
+startup.mark_ready()
+
 # End of file
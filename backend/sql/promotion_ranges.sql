@@ -0,0 +1,97 @@
+-- backend/sql/promotion_ranges.sql
+-- Id-range variants of the process_cleaned_* promotion RPCs.
+--
+-- backend/app/promotion.py promotes an upload in chunks:
+--   select process_cleaned_<x>_range(p_upload_id, p_min_id, p_max_id)
+-- for consecutive id ranges of PROMOTION_CHUNK_ROWS ids, one short transaction each.
+-- If a range function is missing, the app makes the single process_cleaned_<x> call.
+--
+-- The range functions do not reimplement promotion: process_cleaned_<x> stays the
+-- behaviour of record. A range call moves the unprocessed cleaned rows of
+-- [p_min_id, p_max_id] under a temporary upload id (-p_min_id), runs the unchanged
+-- process_cleaned_<x> for that upload id, and moves the rows back. All of it happens
+-- in the caller's transaction, so other sessions never see the temporary id.
+-- Returns the number of the range's rows that ended up processed.
+-- p_upload_id = null means rows of any upload.
+--
+-- Needs from each cleaned table only the id, upload_id and processed columns the app
+-- already uses, and from process_cleaned_<x> that it promotes the cleaned rows of
+-- its p_upload_id.
+
+create or replace function public._promote_cleaned_range(
+    p_rpc text,
+    p_cleaned text,
+    p_upload_id bigint,
+    p_min_id bigint,
+    p_max_id bigint
+) returns integer
+language plpgsql
+as $$
+declare
+    n integer;
+    tmp_upload bigint := -p_min_id;
+begin
+    create temp table if not exists _promote_range_uploads (id bigint primary key, upload_id bigint) on commit drop;
+    truncate _promote_range_uploads;
+
+    execute format(
+        'insert into _promote_range_uploads (id, upload_id) '
+        'select id, upload_id from public.%I '
+        'where id between $1 and $2 and coalesce(processed, false) = false and ($3 is null or upload_id = $3) '
+        'for update',
+        p_cleaned
+    ) using p_min_id, p_max_id, p_upload_id;
+    get diagnostics n = row_count;
+    if n = 0 then
+        return 0;
+    end if;
+
+    execute format(
+        'update public.%I c set upload_id = $1 from _promote_range_uploads r where c.id = r.id',
+        p_cleaned
+    ) using tmp_upload;
+
+    execute format('select public.%I(p_upload_id => %s)', p_rpc, tmp_upload);
+
+    execute format(
+        'select count(*) from public.%I c join _promote_range_uploads r on c.id = r.id where coalesce(c.processed, false)',
+        p_cleaned
+    ) into n;
+
+    execute format(
+        'update public.%I c set upload_id = r.upload_id from _promote_range_uploads r where c.id = r.id',
+        p_cleaned
+    );
+    return n;
+end;
+$$;
+
+create or replace function public.process_cleaned_airlines_range(p_upload_id bigint, p_min_id bigint, p_max_id bigint)
+returns integer language sql as $$
+    select public._promote_cleaned_range('process_cleaned_airlines', 'cleaned_airlines', p_upload_id, p_min_id, p_max_id)
+$$;
+
+create or replace function public.process_cleaned_airports_range(p_upload_id bigint, p_min_id bigint, p_max_id bigint)
+returns integer language sql as $$
+    select public._promote_cleaned_range('process_cleaned_airports', 'cleaned_airports', p_upload_id, p_min_id, p_max_id)
+$$;
+
+create or replace function public.process_cleaned_flights_range(p_upload_id bigint, p_min_id bigint, p_max_id bigint)
+returns integer language sql as $$
+    select public._promote_cleaned_range('process_cleaned_flights', 'cleaned_flights', p_upload_id, p_min_id, p_max_id)
+$$;
+
+create or replace function public.process_cleaned_passengers_range(p_upload_id bigint, p_min_id bigint, p_max_id bigint)
+returns integer language sql as $$
+    select public._promote_cleaned_range('process_cleaned_passengers', 'cleaned_passengers', p_upload_id, p_min_id, p_max_id)
+$$;
+
+create or replace function public.process_cleaned_travelagency_range(p_upload_id bigint, p_min_id bigint, p_max_id bigint)
+returns integer language sql as $$
+    select public._promote_cleaned_range('process_cleaned_travelagency', 'cleaned_travelagency', p_upload_id, p_min_id, p_max_id)
+$$;
+
+create or replace function public.process_cleaned_corporatesales_range(p_upload_id bigint, p_min_id bigint, p_max_id bigint)
+returns integer language sql as $$
+    select public._promote_cleaned_range('process_cleaned_corporatesales', 'cleaned_corporatesales', p_upload_id, p_min_id, p_max_id)
+$$;
@@ -0,0 +1,29 @@
+-- backend/sql/row_keys.sql
+-- Deterministic row identities for idempotent writes.
+--
+-- /api/upload upserts staging_raw chunk records on row_key = '<upload_id>:c<chunk_index>'
+-- (ignore duplicates), and /api/process upserts cleaned rows on
+-- row_key = '<upload_id>:<row ordinal>'. A batch retried after a timeout, or a
+-- re-run of /api/process, then updates or skips rows instead of adding copies.
+--
+-- PostgREST's on_conflict needs a plain (non-partial) unique index on the column.
+-- Rows written before this migration keep row_key = null; nulls never conflict.
+-- Run once in the SQL editor; it is safe to run again.
+
+alter table public.staging_raw add column if not exists row_key text;
+create unique index if not exists ux_staging_raw_row_key on public.staging_raw (row_key);
+
+do $$
+declare
+    t text;
+begin
+    foreach t in array array[
+        'cleaned_airlines', 'cleaned_airports', 'cleaned_flights',
+        'cleaned_passengers', 'cleaned_travelagency', 'cleaned_corporatesales'
+    ]
+    loop
+        execute format('alter table public.%I add column if not exists row_key text', t);
+        execute format('create unique index if not exists %I on public.%I (row_key)', 'ux_' || t || '_row_key', t);
+    end loop;
+end
+$$;
@@ -0,0 +1,110 @@
+-- backend/sql/staging_leases.sql
+-- Lease-based claiming of staging_raw chunks for distributed workers.
+--
+-- backend/app/etl/worker.py runs on any number of nodes. Each worker calls
+--   select * from claim_staging_chunks(p_worker, p_limit, p_lease_seconds, p_entities, p_max_attempts)
+-- to lease up to p_limit unprocessed chunks. The candidate rows are locked with
+-- FOR UPDATE SKIP LOCKED, so concurrent claims never block each other and never get
+-- the same chunk. A chunk is claimable while its lease is empty or expired, so the
+-- chunks of a crashed worker go back to the pool once lease_expires_at passes.
+--
+--   complete_staging_chunks(p_worker, p_ids)            processed = true, lease cleared
+--   release_staging_chunks(p_worker, p_ids, p_delay, p_failed)
+--                                                       lease cleared; claimable again after p_delay seconds.
+--                                                       p_failed = false (claimed, never started) gives
+--                                                       back the attempt the claim counted
+--   extend_staging_leases(p_worker, p_ids, p_seconds)   heartbeat for long batches
+--
+-- complete / release / extend only touch rows still leased to p_worker and return
+-- the number of rows they changed (less than requested = the lease was lost).
+-- The local warehouse implements the same four RPCs (local_warehouse.py).
+-- Run once in the SQL editor; it is safe to run again.
+
+alter table public.staging_raw add column if not exists lease_owner text;
+alter table public.staging_raw add column if not exists lease_expires_at timestamptz;
+alter table public.staging_raw add column if not exists attempts integer not null default 0;
+
+create index if not exists ix_staging_raw_claimable
+    on public.staging_raw (id)
+    where coalesce(processed, false) = false;
+
+create or replace function public.claim_staging_chunks(
+    p_worker text,
+    p_limit integer default 10,
+    p_lease_seconds integer default 300,
+    p_entities text[] default null,
+    p_max_attempts integer default 5
+) returns table (id bigint, entity text, detected_entity text, upload_id bigint, raw jsonb, attempts integer)
+language sql
+as $$
+    with candidates as (
+        select s.id
+          from public.staging_raw s
+         where coalesce(s.processed, false) = false
+           and (s.lease_expires_at is null or s.lease_expires_at < now())
+           and s.attempts < p_max_attempts
+           and (p_entities is null or lower(coalesce(s.detected_entity, s.entity)) = any(p_entities))
+         order by s.id
+         limit p_limit
+           for update skip locked
+    )
+    update public.staging_raw s
+       set lease_owner = p_worker,
+           lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+           attempts = s.attempts + 1
+      from candidates c
+     where s.id = c.id
+    returning s.id::bigint, s.entity::text, s.detected_entity::text, s.upload_id::bigint, s.raw::jsonb, s.attempts;
+$$;
+
+create or replace function public.complete_staging_chunks(p_worker text, p_ids bigint[])
+returns integer
+language plpgsql
+as $$
+declare
+    n integer;
+begin
+    update public.staging_raw
+       set processed = true, lease_owner = null, lease_expires_at = null
+     where id = any(p_ids) and lease_owner = p_worker;
+    get diagnostics n = row_count;
+    return n;
+end;
+$$;
+
+drop function if exists public.release_staging_chunks(text, bigint[], integer);
+create or replace function public.release_staging_chunks(
+    p_worker text,
+    p_ids bigint[],
+    p_delay_seconds integer default 0,
+    p_failed boolean default true
+) returns integer
+language plpgsql
+as $$
+declare
+    n integer;
+begin
+    update public.staging_raw
+       set lease_owner = null,
+           lease_expires_at = case when p_delay_seconds > 0 then now() + make_interval(secs => p_delay_seconds) end,
+           attempts = case when p_failed then attempts else greatest(attempts - 1, 0) end
+     where id = any(p_ids) and lease_owner = p_worker;
+    get diagnostics n = row_count;
+    return n;
+end;
+$$;
+
+create or replace function public.extend_staging_leases(p_worker text, p_ids bigint[], p_lease_seconds integer default 300)
+returns integer
+language plpgsql
+as $$
+declare
+    n integer;
+begin
+    update public.staging_raw
+       set lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+     where id = any(p_ids) and lease_owner = p_worker;
+    get diagnostics n = row_count;
+    return n;
+end;
+$$;
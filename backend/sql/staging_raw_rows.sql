@@ -0,0 +1,71 @@
+-- backend/sql/staging_raw_rows.sql
+-- Row-level view over staging_raw for the process_cleaned_* RPCs.
+--
+-- /api/upload stages one staging_raw record per chunk of STAGING_CHUNK_ROWS rows:
+--   raw = {"format": "chunk", "chunk_index": n, "row_offset": k,
+--          "rows": [{...}, ...], "validation": [null | "error", ...]}
+-- Server-side functions that used to read staging_raw.raw per line should read this
+-- view instead; it unnests chunk records and passes legacy one-row records through.
+--
+-- Both objects here are opt-in: nothing in this file changes the process_cleaned_*
+-- RPCs. A hosted RPC that should see the rows inside chunk records reads the view,
+-- or calls materialize_staged_rows('cleaned_<x>', p_upload_id) first. That copies
+-- the staged rows of an upload that has no cleaned rows yet into cleaned_<x> (one
+-- cleaned row per row inside each chunk, rawjson only, row_key =
+-- '<upload_id>:<ordinal>'; needs row_keys.sql) and returns the number inserted.
+-- Run once in the SQL editor; it is safe to run again.
+
+create or replace view public.staging_raw_rows as
+select
+    s.id                                                   as staging_id,
+    s.upload_id,
+    s.entity,
+    s.detected_entity,
+    s.processed,
+    coalesce((s.raw ->> 'row_offset')::bigint, 0) + r.ordinality - 1 as row_ordinal,
+    r.value                                                as raw,
+    s.raw -> 'validation' ->> (r.ordinality - 1)::int      as validation_error
+from public.staging_raw s
+cross join lateral jsonb_array_elements(s.raw -> 'rows') with ordinality as r(value, ordinality)
+where s.raw ->> 'format' = 'chunk'
+union all
+select
+    s.id,
+    s.upload_id,
+    s.entity,
+    s.detected_entity,
+    s.processed,
+    0,
+    s.raw,
+    s.notes ->> '_upload_validation_error'
+from public.staging_raw s
+where coalesce(s.raw ->> 'format', '') <> 'chunk';
+
+create or replace function public.materialize_staged_rows(p_cleaned text, p_upload_id bigint)
+returns integer
+language plpgsql
+as $$
+declare
+    n integer := 0;
+begin
+    if p_upload_id is null then
+        return 0;
+    end if;
+    execute format('select count(*) from (select 1 from public.%I where upload_id = $1 limit 1) t', p_cleaned)
+       into n using p_upload_id;
+    if n > 0 then
+        return 0;  -- the ETL already wrote cleaned rows for this upload
+    end if;
+    execute format(
+        'insert into public.%I (rawjson, upload_id, processed, row_key) '
+        'select r.raw, r.upload_id, false, r.upload_id || '':'' || r.row_ordinal '
+        'from public.staging_raw_rows r '
+        'where r.upload_id = $1 and jsonb_typeof(r.raw) = ''object'' '
+        'order by r.staging_id, r.row_ordinal '
+        'on conflict (row_key) do nothing',
+        p_cleaned
+    ) using p_upload_id;
+    get diagnostics n = row_count;
+    return n;
+end;
+$$;
@@ -0,0 +1,58 @@
+# backend/tests/conftest.py
+"""
+The tests run against the SQLite local warehouse (SUPABASE_BACKEND=local) in a temp
+directory, so they need no hosted project. Settings are read at import time, so the
+environment is set here, before backend.main or any service module is imported.
+
+    python -m pytest -q backend/tests
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+TMP = Path(tempfile.mkdtemp(prefix="etl_tests_"))
+os.environ.update(
+    SUPABASE_BACKEND="local",
+    LOCAL_WAREHOUSE_PATH=str(TMP / "warehouse.db"),
+    SPOOL_BACKEND="local",
+    SPOOL_DIR=str(TMP / "spool"),
+    UPLOAD_SESSION_DIR=str(TMP / "sessions"),
+    KEY_CACHE_PATH=str(TMP / "key_cache.json"),
+)
+
+
+@pytest.fixture(scope="session")
+def app():
+    from backend.main import app
+
+    return app
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture(scope="session")
+def warehouse():
+    from backend.app.services.supabase_client import get_client
+
+    return get_client()
+
+
+def airline_csv(n: int, prefix: str = "K") -> bytes:
+    return b"airlinekey,airlinename\n" + b"".join(b"%s%d,Air %d\n" % (prefix.encode(), i, i) for i in range(n))
+
+
+def rows_of(warehouse, table: str, upload_id: int):
+    return warehouse.table(table).select("*").eq("upload_id", upload_id).execute().data
@@ -0,0 +1,51 @@
+"""Decompression budget (MAX_DECOMPRESSED_BYTES) for .gz / .zip uploads."""
+import gzip
+import io
+import zipfile
+
+import pytest
+
+from backend.app import compression
+from conftest import airline_csv
+
+
+def _read_all(source, kind, max_bytes, filename="data.csv.gz"):
+    total = 0
+    for _, stream in compression.iter_members(source, kind, filename, max_bytes=max_bytes):
+        while True:
+            chunk = stream.read(64 * 1024)
+            if not chunk:
+                break
+            total += len(chunk)
+    return total
+
+
+def test_gzip_within_budget():
+    data = b"x" * 100_000
+    assert _read_all(io.BytesIO(gzip.compress(data)), "gzip", max_bytes=100_000) == 100_000
+
+
+def test_gzip_over_budget_stops_while_reading():
+    bomb = gzip.compress(b"\0" * 5_000_000)
+    with pytest.raises(compression.DecompressionLimitError):
+        _read_all(io.BytesIO(bomb), "gzip", max_bytes=1_000_000)
+
+
+def test_zip_budget_is_shared_by_members():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("a.csv", b"a" * 600)
+        zf.writestr("b.csv", b"b" * 600)
+    buf.seek(0)
+    assert _read_all(buf, "zip", max_bytes=1200, filename="bundle.zip") == 1200
+    buf.seek(0)
+    with pytest.raises(compression.DecompressionLimitError):
+        _read_all(buf, "zip", max_bytes=1000, filename="bundle.zip")
+
+
+def test_upload_over_budget_is_413(client, monkeypatch):
+    monkeypatch.setattr(compression, "MAX_DECOMPRESSED_BYTES", 1000)
+    payload = gzip.compress(airline_csv(1000))
+    r = client.post("/api/upload", data={"dataset": "airline"},
+                    files={"file": ("airlines.csv.gz", payload, "application/gzip")})
+    assert r.status_code == 413
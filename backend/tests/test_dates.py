@@ -0,0 +1,32 @@
+"""Date parsing diagnostics travel with each result (dates.parse_info)."""
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from backend.app import dates
+
+
+@pytest.fixture(autouse=True)
+def no_cache_file(monkeypatch):
+    monkeypatch.setattr(dates, "DATE_FORMAT_CACHE_PATH", "")
+    monkeypatch.setattr(dates, "_cache", None)
+
+
+def test_format_cache_and_residue():
+    s = pd.Series(["01/02/2024", "13/02/2024", "not a date"], name="saledate")
+    first = dates.parse_dates(s, source="sales_1.csv", columns=["saledate"])
+    again = dates.parse_dates(s, source="sales_2.csv", columns=["saledate"])
+    assert dates.parse_info(first) == {"format": "%d/%m/%Y", "cached": False, "residue": 1}
+    assert dates.parse_info(again) == {"format": "%d/%m/%Y", "cached": True, "residue": 1}
+    assert first.iloc[0] == pd.Timestamp("2024-02-01")
+    assert s.attrs == {}
+
+
+def test_concurrent_calls_keep_their_own_info():
+    day_first = pd.Series(["31/01/2024", "15/03/2024"] * 50, name="d")
+    iso = pd.Series(["2024-01-31", "2024-03-15"] * 50, name="d")
+    jobs = [day_first, iso] * 20
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        formats = [dates.parse_info(r)["format"] for r in pool.map(dates.parse_dates, jobs)]
+    assert formats == ["%d/%m/%Y", "%Y-%m-%d"] * 20
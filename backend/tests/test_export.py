@@ -0,0 +1,13 @@
+"""/api/export/{dataset}: cleaned and dim tables."""
+
+
+def test_dim_export_needs_a_dim_table(client):
+    r = client.get("/api/export/travelagency", params={"table": "dim"})
+    assert r.status_code == 400
+    assert client.get("/api/export/corporate_sales", params={"table": "dim"}).status_code == 400
+    assert client.get("/api/export/airport", params={"table": "dim"}).status_code == 200
+
+
+def test_cleaned_export_of_an_entity_without_dim(client):
+    r = client.get("/api/export/travelagency", params={"table": "cleaned", "format": "ndjson"})
+    assert r.status_code == 200
@@ -0,0 +1,85 @@
+"""Staging chunk leases (claim / complete / release / extend) on the local warehouse."""
+import time
+
+import pytest
+
+from backend.app.promotion import parse_rpc_count
+from backend.app.services.local_warehouse import LocalWarehouse
+
+
+@pytest.fixture
+def wh(tmp_path):
+    wh = LocalWarehouse(str(tmp_path / "leases.db"))
+    wh.table("staging_raw").insert([
+        {"entity": "airline", "detected_entity": "airline", "upload_id": 1, "raw": {"n": i}, "processed": False}
+        for i in range(6)
+    ]).execute()
+    return wh
+
+
+def _claim(wh, worker, limit=10, lease=300, **params):
+    return wh.rpc("claim_staging_chunks", {"p_worker": worker, "p_limit": limit, "p_lease_seconds": lease,
+                                           **params}).execute().data
+
+
+def _call(wh, rpc, worker, ids, **params):
+    return parse_rpc_count(wh.rpc(rpc, {"p_worker": worker, "p_ids": ids, **params}).execute())
+
+
+def test_claims_do_not_overlap(wh):
+    a = _claim(wh, "a", limit=4)
+    b = _claim(wh, "b", limit=4)
+    assert [c["id"] for c in a] == [1, 2, 3, 4]
+    assert [c["id"] for c in b] == [5, 6]
+    assert all(c["attempts"] == 1 for c in a + b)
+    assert _claim(wh, "c") == []
+
+
+def test_complete_only_touches_own_leases(wh):
+    ids = [c["id"] for c in _claim(wh, "a", limit=3)]
+    assert _call(wh, "complete_staging_chunks", "b", ids) == 0
+    assert _call(wh, "complete_staging_chunks", "a", ids) == 3
+    rows = wh.table("staging_raw").select("*").eq("processed", True).execute().data
+    assert sorted(r["id"] for r in rows) == ids
+    assert all(r["lease_owner"] is None for r in rows)
+    assert [c["id"] for c in _claim(wh, "b")] == [4, 5, 6]
+
+
+def test_release_returns_chunks_to_the_pool(wh):
+    ids = [c["id"] for c in _claim(wh, "a", limit=2)]
+    assert _call(wh, "release_staging_chunks", "a", ids) == 2
+    again = _claim(wh, "b", limit=2)
+    assert [c["id"] for c in again] == ids
+    assert all(c["attempts"] == 2 for c in again)
+
+    # released with a delay: not claimable until it passes
+    assert _call(wh, "release_staging_chunks", "b", ids, p_delay_seconds=60) == 2
+    assert [c["id"] for c in _claim(wh, "c")] == [3, 4, 5, 6]
+
+
+def test_expired_lease_is_lost_to_another_worker(wh):
+    ids = [c["id"] for c in _claim(wh, "a", limit=2, lease=0)]
+    time.sleep(0.01)
+    taken = _claim(wh, "b", limit=2)
+    assert [c["id"] for c in taken] == ids
+    # the stalled worker can neither extend nor complete what it lost
+    assert _call(wh, "extend_staging_leases", "a", ids, p_lease_seconds=300) == 0
+    assert _call(wh, "complete_staging_chunks", "a", ids) == 0
+    assert _call(wh, "extend_staging_leases", "b", ids, p_lease_seconds=300) == 2
+    assert _call(wh, "complete_staging_chunks", "b", ids) == 2
+
+
+def test_max_attempts_parks_a_chunk(wh):
+    for _ in range(2):
+        ids = [c["id"] for c in _claim(wh, "a", limit=1, p_max_attempts=2)]
+        assert ids == [1]
+        _call(wh, "release_staging_chunks", "a", ids)
+    assert [c["id"] for c in _claim(wh, "a", limit=1, p_max_attempts=2)] == [2]
+
+
+def test_release_of_unstarted_chunks_keeps_the_attempt(wh):
+    for _ in range(3):
+        ids = [c["id"] for c in _claim(wh, "a", limit=1, p_max_attempts=2)]
+        assert ids == [1]
+        _call(wh, "release_staging_chunks", "a", ids, p_failed=False)
+    assert _claim(wh, "a", limit=1)[0]["attempts"] == 1
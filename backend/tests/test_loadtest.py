@@ -0,0 +1,27 @@
+"""The load test's fake client stands in for the whole supabase_client module."""
+import json
+import subprocess
+import sys
+
+from conftest import ROOT
+
+# a fresh interpreter: install_fake_client must run before backend.main is imported
+SCRIPT = """
+import json
+from backend.loadtest import install_fake_client
+from backend.app.services.fake_supabase import FakeSupabase
+install_fake_client(FakeSupabase())
+from backend.main import app
+from backend.app import startup
+from backend.app.services import key_cache
+print(json.dumps({"db_client": startup.report()["lazy_ms"]["db_client"],
+                  "identity": key_cache.backend_identity()}))
+"""
+
+
+def test_fake_client_module_serves_startup_report():
+    proc = subprocess.run([sys.executable, "-c", SCRIPT], cwd=str(ROOT), capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    out = json.loads(proc.stdout.strip().splitlines()[-1])
+    assert out["db_client"] is None
+    assert out["identity"].startswith("supabase:fake://")
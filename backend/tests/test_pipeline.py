@@ -0,0 +1,52 @@
+"""Dependency-ordered runs (pipeline.run_dag): order, parallel levels, skip on failure."""
+import threading
+
+import pytest
+
+from backend.app import pipeline
+
+DEPENDENCIES = {"flights": ["airports", "airlines"], "passengers": [], "travelagency": ["flights", "passengers"]}
+STEPS = ["airlines", "airports", "flights", "passengers", "travelagency"]
+
+
+def test_order_levels():
+    assert pipeline.order_levels(STEPS, DEPENDENCIES) == [
+        ["airlines", "airports", "passengers"], ["flights"], ["travelagency"]]
+
+
+def test_cycle_is_rejected():
+    with pytest.raises(pipeline.CycleError):
+        pipeline.order_levels(["a", "b"], {"a": ["b"], "b": ["a"]})
+
+
+def test_steps_run_after_their_parents():
+    done = []
+    lock = threading.Lock()
+
+    def run_step(step):
+        with lock:
+            done.append(step)
+        return step.upper()
+
+    out = pipeline.run_dag(STEPS, DEPENDENCIES, run_step, workers=3)
+    assert {s: r["status"] for s, r in out["results"].items()} == {s: "ok" for s in STEPS}
+    assert out["results"]["flights"]["result"] == "FLIGHTS"
+    for step, parents in DEPENDENCIES.items():
+        assert all(done.index(p) < done.index(step) for p in parents)
+
+
+def test_failed_parent_skips_its_descendants():
+    ran = []
+
+    def run_step(step):
+        ran.append(step)
+        if step == "airports":
+            raise RuntimeError("bad airports file")
+        return "ok"
+
+    out = pipeline.run_dag(STEPS, DEPENDENCIES, run_step, workers=2)
+    status = {s: r["status"] for s, r in out["results"].items()}
+    assert status == {"airlines": "ok", "airports": "failed", "passengers": "ok",
+                      "flights": "skipped", "travelagency": "skipped"}
+    assert "flights" not in ran and "travelagency" not in ran
+    assert "bad airports file" in out["results"]["airports"]["error"]
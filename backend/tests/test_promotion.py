@@ -0,0 +1,61 @@
+"""Range promotion: cleaned rows go into the dim table in id-range chunks."""
+from backend import main
+from backend.app import promotion
+from conftest import rows_of
+
+
+def _stage_cleaned(upload_id: int, n: int, prefix: str) -> None:
+    rows = [{"airlinekey": f"{prefix}{i}", "airlinename": f"Air {i}"} for i in range(n)]
+    assert main.write_cleaned_rows("cleaned_airlines", rows, upload_id) == n
+
+
+def _dim_keys(warehouse, prefix: str):
+    return {r["airlinekey"] for r in warehouse.table("dimairline").select("airlinekey").execute().data
+            if r["airlinekey"].startswith(prefix)}
+
+
+def test_promote_in_ranges(warehouse):
+    upload_id = 990200
+    _stage_cleaned(upload_id, 25, "PR")
+    progress = []
+
+    out = promotion.promote("process_cleaned_airlines", "cleaned_airlines", upload_id, chunk_rows=10,
+                            on_progress=progress.append)
+    assert out["mode"] == "range"
+    assert out["chunks"] == 3
+    assert out["promoted"] == 25
+    assert progress[-1]["status"] == "done"
+    assert progress[-1]["chunks_done"] == 3
+    assert len(_dim_keys(warehouse, "PR")) == 25
+    assert all(r["processed"] for r in rows_of(warehouse, "cleaned_airlines", upload_id))
+
+    # everything is processed already: nothing is promoted twice
+    assert promotion.promote("process_cleaned_airlines", "cleaned_airlines", upload_id, chunk_rows=10)["promoted"] == 0
+
+
+def test_missing_range_rpc_falls_back_to_single_call(warehouse, monkeypatch):
+    upload_id = 990201
+    _stage_cleaned(upload_id, 12, "PS")
+    monkeypatch.delitem(warehouse.rpc_handlers, "process_cleaned_airlines_range")
+
+    out = promotion.promote("process_cleaned_airlines", "cleaned_airlines", upload_id, chunk_rows=5)
+    assert out["mode"] == "single"
+    assert out["promoted"] == 12
+    assert len(_dim_keys(warehouse, "PS")) == 12
+
+
+def test_no_pending_rows_is_a_single_call(warehouse):
+    out = promotion.promote("process_cleaned_airlines", "cleaned_airlines", 990299)
+    assert out == {"promoted": 0, "chunks": 1, "mode": "single", "seconds": out["seconds"]}
+
+
+def test_progress_drops_finished_entries(monkeypatch):
+    monkeypatch.setattr(promotion, "PROGRESS", promotion.OrderedDict())
+    monkeypatch.setattr(promotion, "PROMOTION_PROGRESS_MAX", 2)
+    for upload_id in (1, 2, 3):
+        promotion._record(f"rpc:{upload_id}", status="running")
+    assert list(promotion.progress()) == ["rpc:2", "rpc:3"]
+
+    promotion._record("rpc:2", status="done")
+    monkeypatch.setattr(promotion, "PROMOTION_PROGRESS_TTL", -1)
+    assert list(promotion.progress()) == ["rpc:3"]
@@ -0,0 +1,36 @@
+"""Batched frames for the ETL clean paths (readers.iter_etl_frames)."""
+import pandas as pd
+import pytest
+
+from backend.app import readers
+from backend.app.etl import airlines_etl, airports_etl
+
+pytest.importorskip("pyarrow")
+
+
+def test_parquet_is_cleaned_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(readers, "FRAME_BATCH_ROWS", 1000)
+    path = tmp_path / "airlines.parquet"
+    pd.DataFrame({"airlinekey": [f"B{i}" for i in range(2500)],
+                  "airlinename": [f"Air {i}" for i in range(2500)]}).to_parquet(path, row_group_size=2500)
+
+    frames = list(airlines_etl.iter_frames(str(path)))
+    assert [len(f) for f in frames] == [1000, 1000, 500]
+    assert len(airlines_etl.read_frame(str(path))) == 2500
+
+
+def test_batches_go_through_the_module_conversion(tmp_path, monkeypatch):
+    monkeypatch.setattr(readers, "FRAME_BATCH_ROWS", 2)
+    path = tmp_path / "airports.ndjson"
+    path.write_text("".join(f'{{"airportkey": "P{i}", "airportname": "Port {i}", "city": {i}}}\n' for i in range(3)))
+
+    frames = list(airports_etl.iter_frames(str(path)))
+    assert [len(f) for f in frames] == [2, 1]
+    assert frames[1]["city"].tolist() == ["2"]
+
+
+def test_csv_is_one_frame(tmp_path):
+    path = tmp_path / "airlines.csv"
+    path.write_text("airlinekey,airlinename\nA1,One\nA2,Two\n")
+    frames = list(airlines_etl.iter_frames(str(path)))
+    assert len(frames) == 1 and len(frames[0]) == 2
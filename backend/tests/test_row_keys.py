@@ -0,0 +1,35 @@
+"""row_key idempotency: writing or processing the same upload again does not add rows."""
+from backend import main
+from backend.app import staging
+from conftest import airline_csv, rows_of
+
+
+def _upload(client, body: bytes) -> int:
+    r = client.post("/api/upload", data={"dataset": "airline"}, files={"file": ("airlines.csv", body, "text/csv")})
+    assert r.status_code == 200, r.text
+    return r.json()["upload_id"]
+
+
+def test_reprocessing_does_not_duplicate_cleaned_rows(client, warehouse):
+    upload_id = _upload(client, airline_csv(300, prefix="RK"))
+    for _ in range(2):
+        r = client.post("/api/process", data={"upload_id": str(upload_id)})
+        assert r.status_code == 200, r.text
+
+    rows = rows_of(warehouse, "cleaned_airlines", upload_id)
+    assert len(rows) == 300
+    keys = {r["row_key"] for r in rows}
+    assert len(keys) == 300
+    assert staging.row_key(upload_id, 0) in keys
+
+
+def test_write_cleaned_rows_upserts_on_row_key(warehouse):
+    upload_id = 990001
+    rows = [{"airlinekey": f"W{i}", "airlinename": f"Air {i}"} for i in range(10)]
+    assert main.write_cleaned_rows("cleaned_airlines", rows, upload_id) == 10
+    renamed = [dict(r, airlinename=r["airlinename"] + " (v2)") for r in rows[5:]]
+    main.write_cleaned_rows("cleaned_airlines", renamed, upload_id, first_ordinal=5)
+
+    stored = sorted(rows_of(warehouse, "cleaned_airlines", upload_id), key=lambda r: r["row_key"])
+    assert len(stored) == 10
+    assert sum(r["airlinename"].endswith("(v2)") for r in stored) == 5
@@ -0,0 +1,73 @@
+"""Content-addressed spool: dedup, eviction, and discarding blobs other uploads share."""
+import os
+import time
+
+import pytest
+
+from backend import main
+from backend.app.services import spool
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, "SPOOL_DIR", tmp_path / "spool")
+    monkeypatch.setattr(spool, "SPOOL_EVICT_EVERY", 3600)
+    monkeypatch.setattr(spool, "_last_evict", time.monotonic())
+    return tmp_path / "spool"
+
+
+def _file(tmp_path, name: str, data: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_same_content_is_stored_once(tmp_path, spool_dir):
+    hits = spool.STATS["dedup_hits"]
+    a = spool.put_file(_file(tmp_path, "a.csv", b"k,v\n1,2\n"))
+    b = spool.put_file(_file(tmp_path, "b.csv", b"k,v\n1,2\n"))
+    c = spool.put_file(_file(tmp_path, "c.csv", b"k,v\n3,4\n"))
+    assert a == b != c
+    assert spool.STATS["dedup_hits"] == hits + 1
+    assert not os.path.exists(tmp_path / "a.csv") and not os.path.exists(tmp_path / "b.csv")
+    assert open(spool.local_path(a), "rb").read() == b"k,v\n1,2\n"
+    assert spool.stats()["blobs"] == 2
+
+
+def test_keep_source_copies(tmp_path, spool_dir):
+    src = _file(tmp_path, "a.csv", b"x,y\n")
+    pointer = spool.put_file(src, keep_source=True)
+    assert os.path.exists(src)
+    assert spool.local_path(pointer) != src
+
+
+def test_evict_by_ttl_then_lru(tmp_path, spool_dir, monkeypatch):
+    old = spool.put_file(_file(tmp_path, "old.csv", b"o" * 100))
+    lru = spool.put_file(_file(tmp_path, "lru.csv", b"l" * 100))
+    new = spool.put_file(_file(tmp_path, "new.csv", b"n" * 100))
+    now = time.time()
+    os.utime(spool.local_path(old), (now - 7200, now - 7200))
+    os.utime(spool.local_path(lru), (now - 60, now - 60))
+    os.utime(spool.local_path(new), (now, now))
+
+    monkeypatch.setattr(spool, "SPOOL_TTL_SECONDS", 3600)
+    monkeypatch.setattr(spool, "SPOOL_MAX_BYTES", 150)
+    out = spool.evict(now=now)
+    assert out == {"removed": 2, "removed_bytes": 200, "bytes": 100}
+    assert spool.local_path(old) is None and spool.local_path(lru) is None
+    assert spool.local_path(new) is not None
+
+
+def test_failed_upload_keeps_a_shared_blob(tmp_path, spool_dir, warehouse):
+    pointer = spool.put_file(_file(tmp_path, "a.csv", b"k\nshared\n"))
+    warehouse.table("staging_raw").insert({"entity": "airline", "upload_id": 990301, "file_pointer": pointer}).execute()
+
+    # a later upload of the same content fails: the blob still backs upload 990301
+    assert spool.put_file(_file(tmp_path, "b.csv", b"k\nshared\n")) == pointer
+    main.drop_upload_file(None, pointer, upload_id=990302)
+    assert spool.local_path(pointer) is not None
+
+    # a failed upload whose blob nothing else uses drops it
+    unique = spool.put_file(_file(tmp_path, "c.csv", b"k\nunique\n"))
+    main.drop_upload_file(None, unique, upload_id=990303)
+    assert spool.local_path(unique) is None
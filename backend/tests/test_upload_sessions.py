@@ -0,0 +1,78 @@
+"""Resumable uploads (/api/uploads): Content-Range offsets, resume and 409s."""
+from backend.app import upload_sessions
+from conftest import airline_csv
+
+
+def _create(client, body: bytes) -> str:
+    r = client.post("/api/uploads", data={"dataset": "airline", "filename": "airlines.csv",
+                                          "total_size": str(len(body))})
+    assert r.status_code == 201
+    return r.json()["session_id"]
+
+
+def _put(client, session_id: str, body: bytes, start: int, end: int):
+    return client.put(f"/api/uploads/{session_id}", content=body[start:end],
+                      headers={"content-range": f"bytes {start}-{end - 1}/{len(body)}"})
+
+
+def test_resume_from_received_offset(client):
+    body = airline_csv(500)
+    sid = _create(client, body)
+    half = len(body) // 2
+
+    r = _put(client, sid, body, 0, half)
+    assert r.status_code == 200
+    assert r.json()["received"] == half
+
+    # a retry of a range the server already has: 409 with the offset to resume from
+    r = _put(client, sid, body, 0, half)
+    assert r.status_code == 409
+    assert r.json()["received"] == half
+
+    received = client.get(f"/api/uploads/{sid}").json()["received"]
+    r = _put(client, sid, body, received, len(body))
+    assert r.status_code == 200
+    assert r.json()["received"] == len(body)
+
+    r = client.post(f"/api/uploads/{sid}/finalize")
+    assert r.status_code == 200
+    assert r.json()["staged_rows"] == 500
+    assert r.json()["finalized"] is True
+
+    # finalize and status stay answerable after the session file moved into the spool
+    assert client.post(f"/api/uploads/{sid}/finalize").status_code == 200
+    r = _put(client, sid, body, 0, half)
+    assert r.status_code == 409
+    assert r.json()["received"] == len(body)
+
+
+def test_incomplete_finalize_reports_received(client):
+    body = airline_csv(50)
+    sid = _create(client, body)
+    _put(client, sid, body, 0, 100)
+    r = client.post(f"/api/uploads/{sid}/finalize")
+    assert r.status_code == 409
+    assert r.json()["received"] == 100
+
+
+def test_busy_session_returns_received(client, monkeypatch):
+    body = airline_csv(50)
+    sid = _create(client, body)
+    _put(client, sid, body, 0, 100)
+    monkeypatch.setattr(upload_sessions, "SESSION_LOCK_WAIT", 0.1)
+
+    lock = upload_sessions.session_lock(sid)
+    lock.acquire()  # a chunk in flight
+    try:
+        r = _put(client, sid, body, 100, len(body))
+        assert r.status_code == 409
+        assert r.json()["received"] == 100
+        r = client.post(f"/api/uploads/{sid}/finalize")
+        assert r.status_code == 409
+        assert r.json()["received"] == 100
+    finally:
+        lock.release()
+
+    r = _put(client, sid, body, 100, len(body))
+    assert r.status_code == 200
+    assert r.json()["received"] == len(body)
@@ -27,6 +27,9 @@ export function uploadFile(file, dataset, onProgress) {
     if (!file) {
       return resolve({ success: false, error: "no file provided" });
     }
+    if (file.size > RESUMABLE_THRESHOLD) {
+      return resolve(uploadFileResumable(file, dataset, onProgress));
+    }
 
     const url = "/api/upload";
     const form = new FormData();
@@ -80,6 +83,108 @@ export function uploadFile(file, dataset, onProgress) {
   });
 }
 
+// Files above this size go through the resumable protocol (/api/uploads/...)
+export const RESUMABLE_THRESHOLD = 8 * 1024 * 1024;
+const RESUMABLE_CHUNK_SIZE = 4 * 1024 * 1024;
+const RESUMABLE_MAX_RETRIES = 8;
+
+function _sleep(ms) {
+  return new Promise((r) => setTimeout(r, ms));
+}
+
+function _putChunk(url, blob, start, total, onChunkProgress) {
+  return new Promise((resolve) => {
+    const xhr = new XMLHttpRequest();
+    xhr.open("PUT", url, true);
+    xhr.setRequestHeader("Content-Range", `bytes ${start}-${start + blob.size - 1}/${total}`);
+    xhr.upload.onprogress = function (ev) {
+      if (ev.lengthComputable && typeof onChunkProgress === "function") onChunkProgress(ev.loaded);
+    };
+    xhr.onload = function () {
+      const parsed = _safeParseResponseText(xhr.responseText);
+      resolve({ status: xhr.status, json: parsed.ok ? parsed.json : null, text: parsed.text });
+    };
+    xhr.onerror = function () {
+      resolve({ status: 0, json: null, text: "Network error during upload" });
+    };
+    xhr.send(blob);
+  });
+}
+
+/**
+ * Resumable upload: create a session, PUT byte ranges, resume from the server's
+ * received offset after network errors, then finalize.
+ * Resolves to the same shape as uploadFile().
+ */
+export async function uploadFileResumable(file, dataset, onProgress, options = {}) {
+  if (!file) return { success: false, error: "no file provided" };
+  const baseUrl = options.baseUrl || "";
+  const chunkSize = options.chunkSize || RESUMABLE_CHUNK_SIZE;
+  const report = (loaded) => {
+    if (typeof onProgress === "function") {
+      try { onProgress(Math.min(100, Math.round((loaded / file.size) * 100))); } catch (_) {}
+    }
+  };
+
+  try {
+    const form = new FormData();
+    form.append("dataset", dataset || "airline");
+    form.append("filename", file.name);
+    form.append("total_size", String(file.size));
+    if (file.type) form.append("content_type", file.type);
+    const created = await fetch(`${baseUrl}/api/uploads`, { method: "POST", body: form });
+    const createdBody = _safeParseResponseText(await created.text());
+    if (!created.ok || !createdBody.ok) {
+      return { success: false, status: created.status, error: createdBody.text || `HTTP ${created.status}` };
+    }
+    const sessionId = createdBody.json.session_id;
+    const sessionUrl = `${baseUrl}/api/uploads/${sessionId}`;
+
+    let offset = 0;
+    let retries = 0;
+    while (offset < file.size) {
+      const blob = file.slice(offset, offset + chunkSize);
+      const res = await _putChunk(sessionUrl, blob, offset, file.size, (loaded) => report(offset + loaded));
+      if (res.status >= 200 && res.status < 300) {
+        offset = res.json?.received ?? offset + blob.size;
+        retries = 0;
+        report(offset);
+        continue;
+      }
+      if (res.status === 409 && res.json?.received != null) {
+        // server already has a different offset (e.g. a retried chunk landed, or our
+        // offset came from a status read taken while a chunk was in flight) -> resume there
+        offset = res.json.received;
+        continue;
+      }
+      // a 409 without an offset (session busy) is retried below after a status read
+      if (res.status !== 0 && res.status < 500 && res.status !== 409) {
+        return { success: false, status: res.status, error: res.text || `HTTP ${res.status}`, data: res.json };
+      }
+      if (++retries > RESUMABLE_MAX_RETRIES) {
+        return { success: false, status: res.status, error: res.text || "upload failed after retries" };
+      }
+      await _sleep(Math.min(30000, 500 * 2 ** retries));
+      // ask the server how much actually arrived before resending
+      try {
+        const st = await fetch(sessionUrl);
+        const stBody = _safeParseResponseText(await st.text());
+        if (st.ok && stBody.ok) offset = stBody.json.received;
+      } catch (_) {}
+    }
+
+    const fin = await fetch(`${sessionUrl}/finalize`, { method: "POST" });
+    const finBody = _safeParseResponseText(await fin.text());
+    if (!fin.ok) {
+      return { success: false, status: fin.status, error: finBody.text || `HTTP ${fin.status}`, data: finBody.json };
+    }
+    const data = finBody.json;
+    return { success: true, status: fin.status, data, upload_id: data?.upload_id ?? null };
+  } catch (err) {
+    return { success: false, error: String(err) };
+  }
+}
+
 /**
  * Trigger processing for an upload.
  * - uploadId: integer upload id returned by /api/upload
@@ -1,4 +1,5 @@
 import React, { useRef, useState } from "react";
+import { uploadFileResumable, RESUMABLE_THRESHOLD } from "../api/api";
 
 export default function UploadPage() {
   const fileRef = useRef();
@@ -99,6 +100,13 @@ export default function UploadPage() {
 
 
   const uploadFile = async (file, dataset, onProgress = () => {}) => {
+    // large files: resumable chunked protocol (survives dropped connections)
+    if (file.size > RESUMABLE_THRESHOLD) {
+      const res = await uploadFileResumable(file, dataset, onProgress, { baseUrl: BACKEND });
+      if (!res.success) throw new Error(res.error || `HTTP ${res.status}`);
+      return { payload: res.data, rawText: JSON.stringify(res.data) };
+    }
+
     const form = new FormData();
     form.append("file", file);
     form.append("dataset", dataset);
@@ -223,7 +231,7 @@ export default function UploadPage() {
         <div className="left-panel">
           <div style={{ marginBottom: 8, fontWeight: 700 }}>Upload a CSV or DOCX file</div>
 
-          <input ref={fileRef} type="file" accept=".csv,.docx" />
+          <input ref={fileRef} type="file" accept=".csv,.docx,.xlsx,.parquet,.arrow,.feather,.ndjson,.jsonl,.gz,.zip,.zst" />
 
           <div style={{ marginTop: 8 }}>
             <div className="muted">Detected dataset</div>